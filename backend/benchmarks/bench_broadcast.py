@@ -0,0 +1,98 @@
+"""Price fan-out to thousands of stream subscribers.
+
+In-process mode drives the Broadcaster directly with simulated connections,
+a fraction of them slow, and needs no database::
+
+    python -m benchmarks.bench_broadcast --connections 5000 --ticks 200
+
+With ``--url`` it opens real WebSocket connections against a running server
+(``ws://localhost:8001/api/ws?token=...``) and reports tick delivery instead.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import percentile
+from broadcast import Broadcaster
+
+async def in_process(connections, ticks, slow_fraction, interval):
+    broadcaster = Broadcaster()
+    received = []
+    latencies = []
+
+    async def consume(subscriber, delay):
+        count = 0
+        while True:
+            for payload in await subscriber.next_batch():
+                latencies.append((time.perf_counter() - json.loads(payload)["sent_at"]) * 1000)
+                count += 1
+            received.append(count)
+            if delay:
+                await asyncio.sleep(delay)
+
+    slow_every = int(1 / slow_fraction) if slow_fraction else 0
+    tasks = []
+    for index in range(connections):
+        subscriber = broadcaster.subscribe(f"user-{index}")
+        delay = interval * 10 if slow_every and index % slow_every == 0 else 0
+        tasks.append(asyncio.create_task(consume(subscriber, delay)))
+    await asyncio.sleep(0)
+
+    publish_times = []
+    for version in range(ticks):
+        start = time.perf_counter()
+        broadcaster.publish("prices", {"type": "prices", "version": version, "sent_at": time.perf_counter()})
+        publish_times.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+
+    await asyncio.sleep(interval * 20)
+    stats = broadcaster.stats()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    print(f"connections={connections} ticks={ticks} delivered={len(latencies)} "
+          f"coalesced={stats['coalesced']} dropped={stats['dropped']}")
+    print(f"publish p50={percentile(publish_times, 50):.2f}ms p99={percentile(publish_times, 99):.2f}ms | "
+          f"delivery p50={percentile(latencies, 50):.2f}ms p99={percentile(latencies, 99):.2f}ms")
+
+async def over_websocket(url, connections, duration):
+    import websockets
+
+    counts = [0] * connections
+
+    async def client(index):
+        async with websockets.connect(url, max_queue=16) as websocket:
+            deadline = time.perf_counter() + duration
+            while time.perf_counter() < deadline:
+                try:
+                    await asyncio.wait_for(websocket.recv(), timeout=deadline - time.perf_counter())
+                    counts[index] += 1
+                except asyncio.TimeoutError:
+                    break
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(client(index) for index in range(connections)), return_exceptions=True)
+    failures = sum(isinstance(result, Exception) for result in results)
+    elapsed = time.perf_counter() - start
+    print(f"connections={connections} failed={failures} messages={sum(counts)} "
+          f"per connection p50={percentile(counts, 50)} min={min(counts)} in {elapsed:.1f}s")
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=5000)
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.01)
+    parser.add_argument("--slow-fraction", type=float, default=0.1)
+    parser.add_argument("--url", help="ws://host:port/api/ws?token=... of a running server")
+    parser.add_argument("--duration", type=float, default=30.0)
+    args = parser.parse_args()
+
+    if args.url:
+        await over_websocket(args.url, args.connections, args.duration)
+    else:
+        await in_process(args.connections, args.ticks, args.slow_fraction, args.interval)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""Compression CPU cost vs bytes saved on a realistic history page.
+
+Builds a ``--rows`` Transaction payload (the /api/transactions/history
+body) and, for each gzip level and Brotli quality, reports the compressed
+size, the ratio and the CPU time per response. Run from ``backend/``::
+
+    python -m benchmarks.bench_compression --rows 1000 --iterations 50
+"""
+import argparse
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import orjson
+
+import server
+from benchmarks.common import percentile
+from compression import BrotliEncoder, GzipEncoder, brotli
+
+def history_payload(rows):
+    now = datetime.now(timezone.utc)
+    transactions = []
+    for i in range(rows):
+        crypto = random.choice(server.CRYPTO_DATA)
+        quantity = round(random.uniform(0.001, 2), 6)
+        transactions.append(server.transaction_row({
+            "id": str(uuid.uuid4()), "user_id": "9b1deb4d-3b7d-4bad-9bdd-2b0d7b3dcb6d",
+            "crypto_id": crypto["id"], "crypto_name": crypto["name"], "crypto_symbol": crypto["symbol"],
+            "transaction_type": random.choice(["buy", "sell"]), "quantity": quantity,
+            "price_brl": crypto["price_brl"], "total_brl": round(quantity * crypto["price_brl"], 2),
+            "timestamp": (now - timedelta(minutes=i)).isoformat(),
+        }))
+    return orjson.dumps(transactions)
+
+def measure(make_compressor, body, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.process_time()
+        compressed = make_compressor().compress(body, final=True)
+        timings.append((time.process_time() - start) * 1000)
+    return len(compressed), timings
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    body = history_payload(args.rows)
+    variants = [(f"gzip-{level}", lambda level=level: GzipEncoder(level)) for level in (1, 6, 9)]
+    if brotli is not None:
+        variants += [(f"br-{quality}", lambda quality=quality: BrotliEncoder(quality)) for quality in (1, 4, 6, 11)]
+    else:
+        print("brotli not installed; gzip only")
+
+    print(f"payload: {args.rows} rows, {len(body)} bytes")
+    print(f"{'variant':<10}{'bytes':>10}{'ratio':>8}{'saved':>10}{'cpu p50':>11}{'KB saved/ms':>13}")
+    for name, make_compressor in variants:
+        size, timings = measure(make_compressor, body, args.iterations)
+        cpu = percentile(timings, 50)
+        saved = len(body) - size
+        print(f"{name:<10}{size:>10}{len(body) / size:>8.1f}{saved:>10}{cpu:>9.2f}ms{saved / 1024 / cpu if cpu else 0:>13.1f}")
+
+if __name__ == "__main__":
+    main()
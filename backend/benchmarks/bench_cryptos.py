@@ -0,0 +1,68 @@
+"""/api/cryptos throughput: per-request models vs the cached payload and 304s.
+
+In-process through ASGITransport, no database needed. ``legacy`` mounts the
+previous handler (one ``Crypto`` per row through ``response_model``) on the
+same app, behind the same middleware. ``--assets`` swaps in a synthetic
+catalog of that size. Run from ``backend/``::
+
+    python -m benchmarks.bench_cryptos --concurrency 20 --duration 5 --assets 200
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+from httpx import ASGITransport, AsyncClient
+
+import server
+from benchmarks.common import summarize
+from prices import PriceFeed, StaticPriceProvider
+
+LEGACY_PATH = "/bench/legacy-cryptos"
+
+@server.app.get(LEGACY_PATH, response_model=List[server.Crypto])
+async def legacy_get_cryptos():
+    return [server.Crypto(**crypto) for crypto in server.price_feed.snapshot.cryptos]
+
+async def measure(path, concurrency, duration, headers=None):
+    latencies = []
+    async with AsyncClient(transport=ASGITransport(app=server.app), base_url="http://bench") as client:
+        deadline = time.perf_counter() + duration
+
+        async def loop():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                latencies.append((time.perf_counter() - start) * 1000)
+                assert response.status_code in (200, 304)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+        return summarize(latencies, time.perf_counter() - start)
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--assets", type=int, help="synthetic catalog size (default: CRYPTO_DATA)")
+    args = parser.parse_args()
+    if args.assets:
+        cryptos = [
+            {"id": f"c{i}", "name": f"Coin {i}", "symbol": f"C{i}", "price_brl": float(i + 1), "icon": "C"}
+            for i in range(args.assets)
+        ]
+        server.price_feed = PriceFeed(StaticPriceProvider(cryptos), initial=cryptos)
+
+    etag = server.cryptos_payload.get(server.price_feed.snapshot)[1]
+    cases = [
+        ("legacy", LEGACY_PATH, None),
+        ("cached", "/api/cryptos", None),
+        ("304", "/api/cryptos", {"If-None-Match": etag}),
+    ]
+    print(f"{'variant':<8}{'rps':>10}{'p50':>10}{'p99':>10}")
+    for name, path, headers in cases:
+        stats = await measure(path, args.concurrency, args.duration, headers)
+        print(f"{name:<8}{stats['rps']:>10.1f}{stats['p50_ms']:>10.3f}{stats['p99_ms']:>10.3f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""Wallet-read latency while a burst of logins is hashing.
+
+Run from ``backend/`` against the MongoDB configured in ``.env``::
+
+    python -m benchmarks.bench_hashing --logins 40 --workers 4
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from httpx import ASGITransport, AsyncClient
+
+import server
+from benchmarks.common import percentile
+from hashing import PasswordHasher
+
+async def register(client, email):
+    response = await client.post("/api/auth/register", json={
+        "name": "Bench User",
+        "email": email,
+        "password": "password123"
+    })
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+async def run(hasher, logins):
+    server.password_hasher = hasher
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        email = f"bench-{uuid.uuid4().hex}@example.com"
+        token = await register(client, email)
+        headers = {"Authorization": f"Bearer {token}"}
+
+        latencies = []
+        done = asyncio.Event()
+
+        async def read_wallet():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/api/wallet", headers=headers)
+                latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.005)
+
+        async def login():
+            return await client.post("/api/auth/login", json={"email": email, "password": "password123"})
+
+        reader = asyncio.create_task(read_wallet())
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await reader
+
+        await client.delete("/api/auth/delete", headers=headers)
+
+    codes = {}
+    for response in responses:
+        codes[response.status_code] = codes.get(response.status_code, 0) + 1
+    return {
+        "logins_per_s": logins / elapsed,
+        "login_status": codes,
+        "wallet_reads": len(latencies),
+        "wallet_p50_ms": percentile(latencies, 50),
+        "wallet_p99_ms": percentile(latencies, 99),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue-limit", type=int, default=64)
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    args = parser.parse_args()
+
+    server.connect_db()
+    modes = [
+        ("inline", PasswordHasher(max_workers=0)),
+        (f"{args.executor} x{args.workers}", PasswordHasher(args.workers, args.queue_limit, args.executor)),
+    ]
+    for name, hasher in modes:
+        result = await run(hasher, args.logins)
+        hasher.shutdown()
+        print(
+            f"{name:>12}: logins/s={result['logins_per_s']:.1f} status={result['login_status']} "
+            f"wallet reads={result['wallet_reads']} p50={result['wallet_p50_ms']:.1f}ms "
+            f"p99={result['wallet_p99_ms']:.1f}ms"
+        )
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""History and login lookup latency on seeded data, without and with indexes.
+
+Seeds a scratch database (``<DB_NAME>_bench_indexes``, dropped at the end)
+on the MongoDB configured in ``.env``. Run from ``backend/``::
+
+    python -m benchmarks.bench_indexes --transactions 1000000 --users 10000
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import server
+from benchmarks.common import percentile
+
+BATCH_SIZE = 10000
+
+async def seed(database, users, transactions):
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    user_docs = [
+        {"id": user_id, "name": "Bench", "email": f"{user_id}@example.com", "hashed_password": "x",
+         "created_at": datetime.now(timezone.utc).isoformat()}
+        for user_id in user_ids
+    ]
+    for start in range(0, users, BATCH_SIZE):
+        await database.users.insert_many(user_docs[start:start + BATCH_SIZE])
+
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    crypto = server.get_crypto_by_id("btc")
+    for start in range(0, transactions, BATCH_SIZE):
+        batch = []
+        for offset in range(min(BATCH_SIZE, transactions - start)):
+            doc = server.build_transaction_doc(random.choice(user_ids), crypto, "buy", 0.001)
+            doc["timestamp"] = (base + timedelta(seconds=start + offset)).isoformat()
+            batch.append(doc)
+        await database.transactions.insert_many(batch)
+    return user_ids
+
+async def measure(database, user_ids, samples):
+    history, login = [], []
+    for user_id in random.sample(user_ids, min(samples, len(user_ids))):
+        start = time.perf_counter()
+        await database.transactions.find({"user_id": user_id}, {"_id": 0}).sort("timestamp", -1).to_list(1000)
+        history.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await database.users.find_one({"email": f"{user_id}@example.com"})
+        login.append((time.perf_counter() - start) * 1000)
+    return history, login
+
+def report(name, history, login):
+    print(
+        f"{name:>10}: history p50={percentile(history, 50):.2f}ms p99={percentile(history, 99):.2f}ms | "
+        f"login lookup p50={percentile(login, 50):.2f}ms p99={percentile(login, 99):.2f}ms"
+    )
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--samples", type=int, default=50)
+    args = parser.parse_args()
+
+    server.connect_db()
+    database = server.client[f"{server.db.name}_bench_indexes"]
+    await server.client.drop_database(database.name)
+    try:
+        start = time.perf_counter()
+        user_ids = await seed(database, args.users, args.transactions)
+        print(f"seeded {args.users} users / {args.transactions} transactions in {time.perf_counter() - start:.1f}s")
+
+        report("no index", *await measure(database, user_ids, args.samples))
+
+        start = time.perf_counter()
+        for name, state in (await server.ensure_indexes(database)).items():
+            print(f"  {name}: {state}")
+        print(f"index build took {time.perf_counter() - start:.1f}s")
+
+        report("indexed", *await measure(database, user_ids, args.samples))
+    finally:
+        await server.client.drop_database(database.name)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+"""Transaction record throughput: insert_one per trade vs the group-commit journal.
+
+Writes ``--records`` transaction documents from ``--concurrency`` tasks,
+once with one ``insert_one`` each and once through ``TransactionJournal``
+per ``--max-delay-ms`` value, and reports records/s and per-write latency.
+Run from ``backend/`` against the MongoDB configured in ``.env``::
+
+    python -m benchmarks.bench_journal --records 5000 --concurrency 200
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import server
+from benchmarks.common import summarize
+from journal import TransactionJournal
+
+async def run(write, records, concurrency, user_id):
+    crypto = server.get_crypto_by_id("btc")
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await write(server.build_transaction_doc(user_id, crypto, "buy", 1.0))
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(records)))
+    return summarize(latencies, time.perf_counter() - start)
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--max-batch", type=int, default=500)
+    parser.add_argument("--max-delay-ms", type=float, nargs="+", default=[1, 5, 20])
+    args = parser.parse_args()
+
+    server.connect_db()
+    user_id = f"bench-{uuid.uuid4().hex}"
+    try:
+        result = await run(server.db.transactions.insert_one, args.records, args.concurrency, user_id)
+        print(f"insert_one      : {result}")
+        for delay in args.max_delay_ms:
+            journal = TransactionJournal(lambda: server.db, max_batch=args.max_batch, max_delay=delay / 1000)
+            result = await run(journal.write, args.records, args.concurrency, user_id)
+            await journal.stop()
+            stats = journal.stats()
+            print(f"journal {delay:>5g} ms: {result} flushes={stats['flushes']} avg_batch={stats['avg_batch']:.1f}")
+    finally:
+        await server.db.transactions.delete_many({"user_id": user_id})
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""Response serialization: per-row pydantic models vs direct projection + orjson.
+
+CPU only, no database. For each list endpoint, times the legacy path (one
+model per row, ``response_model`` validation, stdlib JSON) against the
+projected rows rendered by ``ORJSONResponse``. Run from ``backend/``::
+
+    python -m benchmarks.bench_serialization --rows 1000 --iterations 200
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+import server
+from benchmarks.common import percentile
+from serialization import fast_json
+
+def sample_transactions(count):
+    now = datetime.now(timezone.utc).isoformat()
+    return [
+        {"id": str(uuid.uuid4()), "user_id": "bench", "crypto_id": "btc", "crypto_name": "Bitcoin",
+         "crypto_symbol": "BTC", "transaction_type": "buy", "quantity": 0.01 * (i + 1), "price_brl": 350000.0,
+         "total_brl": 3500.0 * (i + 1), "timestamp": now}
+        for i in range(count)
+    ]
+
+def sample_wallet(count):
+    return [
+        {"crypto_id": f"c{i}", "crypto_name": f"Coin {i}", "crypto_symbol": f"C{i}", "quantity": 1.5,
+         "price_brl": float(i + 1), "total_brl": 1.5 * (i + 1)}
+        for i in range(count)
+    ]
+
+def response_field(path):
+    return next(route.response_field for route in server.app.routes if getattr(route, "path", None) == path)
+
+async def legacy(path, model, documents):
+    content = await serialize_response(field=response_field(path), response_content=[model(**d) for d in documents])
+    return JSONResponse(content).body
+
+async def projected(path, project, documents):
+    return fast_json(map(project, documents)).body
+
+async def measure(render, *args, iterations):
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        body = await render(*args)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, body
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    cases = [
+        ("/api/cryptos", server.Crypto, server.crypto_row, server.CRYPTO_DATA),
+        ("/api/wallet", server.WalletItem, server.wallet_row, sample_wallet(args.rows)),
+        ("/api/transactions/history", server.Transaction, server.transaction_row, sample_transactions(args.rows)),
+    ]
+    print(f"{'endpoint':<28}{'rows':>6}{'legacy p50':>12}{'fast p50':>10}{'speedup':>9}")
+    for path, model, project, documents in cases:
+        old, old_body = await measure(legacy, path, model, documents, iterations=args.iterations)
+        new, new_body = await measure(projected, path, project, documents, iterations=args.iterations)
+        assert json.loads(old_body) == json.loads(new_body), f"{path}: bodies differ"
+        print(f"{path:<28}{len(documents):>6}{percentile(old, 50):>10.3f}ms{percentile(new, 50):>8.3f}ms"
+              f"{percentile(old, 50) / percentile(new, 50):>8.1f}x")
+
+if __name__ == "__main__":
+    asyncio.run(main())
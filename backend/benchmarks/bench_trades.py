@@ -0,0 +1,64 @@
+"""Concurrent trade throughput: legacy read-modify-write vs atomic $inc.
+
+Run from ``backend/`` against the MongoDB configured in ``.env``::
+
+    python -m benchmarks.bench_trades --trades 500 --concurrency 50
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import server
+
+async def legacy_buy(user_id, crypto_id, quantity):
+    # The pre-atomic path: find_one, then insert_one or update_one with a
+    # quantity computed in Python
+    wallet_item = await server.db.wallets.find_one({"user_id": user_id, "crypto_id": crypto_id})
+    if wallet_item:
+        await server.db.wallets.update_one(
+            {"user_id": user_id, "crypto_id": crypto_id},
+            {"$set": {"quantity": wallet_item["quantity"] + quantity}}
+        )
+    else:
+        await server.db.wallets.insert_one({"user_id": user_id, "crypto_id": crypto_id, "quantity": quantity})
+
+async def atomic_buy(user_id, crypto_id, quantity):
+    await server.credit_wallet(user_id, crypto_id, quantity, server.get_crypto_by_id(crypto_id)["price_brl"])
+
+async def run(buy, trades, concurrency):
+    user_id = f"bench-{uuid.uuid4().hex}"
+    crypto = server.get_crypto_by_id("btc")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def trade():
+        async with semaphore:
+            await buy(user_id, crypto["id"], 1.0)
+            await server.db.transactions.insert_one(server.build_transaction_doc(user_id, crypto, "buy", 1.0))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(trade() for _ in range(trades)))
+    elapsed = time.perf_counter() - start
+
+    holdings = await server.db.wallets.find({"user_id": user_id}).to_list(None)
+    balance = sum(item["quantity"] for item in holdings)
+    await server.db.wallets.delete_many({"user_id": user_id})
+    await server.db.transactions.delete_many({"user_id": user_id})
+    return trades / elapsed, balance, len(holdings)
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trades", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    server.connect_db()
+    for name, buy in (("legacy", legacy_buy), ("atomic", atomic_buy)):
+        trades_per_s, balance, documents = await run(buy, args.trades, args.concurrency)
+        print(
+            f"{name:>6}: trades/s={trades_per_s:.1f} balance={balance:g}/{args.trades} "
+            f"wallet docs={documents} lost updates={args.trades - balance:g}"
+        )
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""Wallet valuation for users holding many assets.
+
+Compares the legacy Python loop with the current holdings read, uncached and
+through the wallet cache (in-process ``memory`` backend, so the cached
+numbers leave out the Redis round-trip).
+
+Uses a synthetic price catalog of ``--assets`` cryptos and a scratch user on
+the MongoDB configured in ``.env``. Run from ``backend/``::
+
+    python -m benchmarks.bench_wallet --assets 500 --iterations 200
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import server
+from benchmarks.common import percentile
+from prices import PriceFeed, StaticPriceProvider
+from sharedcache import FakeRedis, ReadThroughCache
+
+async def legacy_balance(user_id, cryptos):
+    # The pre-aggregation path: every document into Python, then a linear
+    # price lookup per holding (and a silent cap at 100 documents)
+    wallet_items = await server.db.wallets.find({"user_id": user_id}, {"_id": 0}).to_list(100)
+    total = 0.0
+    for item in wallet_items:
+        crypto = next((crypto for crypto in cryptos if crypto["id"] == item["crypto_id"]), None)
+        if crypto:
+            total += item["quantity"] * crypto["price_brl"]
+    return round(total, 2)
+
+async def current_balance(user_id, cryptos):
+    return (await server.get_balance({"id": user_id}))["total_brl"]
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--assets", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    cryptos = [
+        {"id": f"c{i}", "name": f"Coin {i}", "symbol": f"C{i}", "price_brl": float(i + 1), "icon": "C"}
+        for i in range(args.assets)
+    ]
+    server.connect_db()
+    server.price_feed = PriceFeed(StaticPriceProvider(cryptos), initial=cryptos)
+    user_id = f"bench-{uuid.uuid4().hex}"
+    await server.db.wallets.insert_many([
+        {"user_id": user_id, "crypto_id": crypto["id"], "quantity": 1.0} for crypto in cryptos
+    ])
+    expected = round(sum(crypto["price_brl"] for crypto in cryptos), 2)
+    try:
+        for name, balance, cache in (
+            ("legacy", legacy_balance, None),
+            ("current", current_balance, None),
+            ("cached", current_balance, FakeRedis()),
+        ):
+            server.wallet_cache = ReadThroughCache(cache, "wallet")
+            latencies = []
+            for _ in range(args.iterations):
+                start = time.perf_counter()
+                total = await balance(user_id, cryptos)
+                latencies.append((time.perf_counter() - start) * 1000)
+            print(f"{name:>8}: total={total} (expected {expected}) "
+                  f"p50={percentile(latencies, 50):.2f}ms p99={percentile(latencies, 99):.2f}ms")
+    finally:
+        await server.db.wallets.delete_many({"user_id": user_id})
+
+if __name__ == "__main__":
+    asyncio.run(main())
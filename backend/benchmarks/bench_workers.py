@@ -0,0 +1,66 @@
+"""Throughput scaling with the number of uvicorn workers.
+
+Starts ``run.py`` with each worker count against the MongoDB configured in
+``.env``, drives it with the load test mix and prints total RPS/p99.
+Run from ``backend/``::
+
+    python -m benchmarks.bench_workers --workers 1 2 4 --concurrency 64 --duration 20
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.loadtest import DEFAULT_MIX, parse_mix, run
+
+async def wait_ready(base_url, timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.perf_counter() < deadline:
+            try:
+                if (await client.get("/api/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"server at {base_url} did not start")
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--total-pool-size", type=int, default=100)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    rows = []
+    for workers in args.workers:
+        process = subprocess.Popen([
+            sys.executable, "run.py", "--host", "127.0.0.1", "--port", str(args.port),
+            "--workers", str(workers), "--total-pool-size", str(args.total_pool_size), "--log-level", "warning",
+        ], env={**os.environ, "RATE_LIMIT_ENABLED": "false"})
+        try:
+            await wait_ready(base_url)
+            async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+                result = await run(client, args.concurrency, args.duration, mix)
+            rows.append((workers, result["total"]))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    base_rps = rows[0][1]["rps"] or 1
+    print(f"{'workers':>8}{'rps':>10}{'speedup':>9}{'p50':>10}{'p99':>10}")
+    for workers, total in rows:
+        print(f"{workers:>8}{total['rps']:>10.1f}{total['rps'] / base_rps:>8.2f}x"
+              f"{total['p50_ms']:>10.2f}{total['p99_ms']:>10.2f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
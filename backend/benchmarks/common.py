@@ -0,0 +1,37 @@
+import subprocess
+from pathlib import Path
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(latencies_ms, elapsed_s):
+    return {
+        "count": len(latencies_ms),
+        "rps": round(len(latencies_ms) / elapsed_s, 2) if elapsed_s else 0.0,
+        "mean_ms": round(sum(latencies_ms) / len(latencies_ms), 3) if latencies_ms else 0.0,
+        "p50_ms": round(percentile(latencies_ms, 50), 3),
+        "p95_ms": round(percentile(latencies_ms, 95), 3),
+        "p99_ms": round(percentile(latencies_ms, 99), 3),
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def use_mongomock(server):
+    """Point ``server`` at an in-memory database (needs mongomock-motor)."""
+    from mongomock_motor import AsyncMongoMockClient
+
+    from settings import Settings
+
+    server.close_db()
+    server.connect_db(Settings(client=AsyncMongoMockClient(), db_name="bench"))
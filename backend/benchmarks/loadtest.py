@@ -0,0 +1,212 @@
+"""Mixed-workload load test for the /api surface.
+
+Each virtual user registers, then loops over weighted operations (login,
+buy, sell, wallet, balance, history, cryptos) until the duration ends.
+Reports RPS and p50/p95/p99 per route and can save and compare JSON runs.
+
+Run from ``backend/``. In-process through ASGITransport, against the
+MongoDB configured in ``.env`` or an in-memory stand-in::
+
+    python -m benchmarks.loadtest --concurrency 50 --duration 30
+    python -m benchmarks.loadtest --mongomock --output benchmarks/results/$(git rev-parse --short HEAD).json
+
+Against a running server (started with ``RATE_LIMIT_ENABLED=false``, all
+virtual users share one IP)::
+
+    python -m benchmarks.loadtest --base-url http://localhost:8001
+
+Compare with a previous run (exit status 1 on regressions)::
+
+    python -m benchmarks.loadtest --compare benchmarks/results/<base>.json --threshold 10
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+from httpx import ASGITransport, AsyncClient
+
+from benchmarks.common import git_commit, summarize
+
+DEFAULT_MIX = "login=1,register=0.2,buy=3,sell=2,wallet=4,balance=4,history=2,cryptos=4"
+CRYPTO_IDS = ["btc", "eth", "bnb", "ada", "sol"]
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - set(OPERATIONS)
+    if unknown:
+        raise SystemExit(f"unknown operations in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+class VirtualUser:
+    def __init__(self, client, recorder):
+        self.client = client
+        self.record = recorder
+        self.email = f"load-{uuid.uuid4().hex}@example.com"
+        self.headers = {}
+
+    async def request(self, route, method, url, **kwargs):
+        start = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        self.record(route, (time.perf_counter() - start) * 1000, response.status_code)
+        return response
+
+    async def register(self, email=None):
+        response = await self.request("POST /api/auth/register", "POST", "/api/auth/register", json={
+            "name": "Load User",
+            "email": email or f"load-{uuid.uuid4().hex}@example.com",
+            "password": "password123"
+        })
+        return response
+
+    async def setup(self):
+        response = await self.register(self.email)
+        response.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def login(self):
+        await self.request("POST /api/auth/login", "POST", "/api/auth/login",
+                           json={"email": self.email, "password": "password123"})
+
+    async def trade(self, kind):
+        await self.request(f"POST /api/transactions/{kind}", "POST", f"/api/transactions/{kind}", headers=self.headers,
+                           json={"crypto_id": random.choice(CRYPTO_IDS), "quantity": 0.01, "transaction_type": kind})
+
+    async def get(self, route):
+        await self.request(f"GET {route}", "GET", route, headers=self.headers)
+
+    async def teardown(self):
+        await self.client.delete("/api/auth/delete", headers=self.headers)
+
+OPERATIONS = {
+    "login": lambda user: user.login(),
+    "register": lambda user: user.register(),
+    "buy": lambda user: user.trade("buy"),
+    "sell": lambda user: user.trade("sell"),
+    "wallet": lambda user: user.get("/api/wallet"),
+    "balance": lambda user: user.get("/api/wallet/balance"),
+    "history": lambda user: user.get("/api/transactions/history"),
+    "cryptos": lambda user: user.get("/api/cryptos"),
+}
+
+async def run(client, concurrency, duration, mix):
+    latencies = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(route, latency_ms, status_code):
+        latencies[route].append(latency_ms)
+        statuses[route][status_code] += 1
+
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    users = [VirtualUser(client, record) for _ in range(concurrency)]
+    await asyncio.gather(*(user.setup() for user in users))
+    latencies.clear()
+    statuses.clear()
+
+    deadline = time.perf_counter() + duration
+
+    async def loop(user):
+        while time.perf_counter() < deadline:
+            await OPERATIONS[random.choices(names, weights)[0]](user)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(loop(user) for user in users))
+    elapsed = time.perf_counter() - start
+    await asyncio.gather(*(user.teardown() for user in users))
+
+    routes = {}
+    for route in sorted(latencies):
+        routes[route] = summarize(latencies[route], elapsed)
+        routes[route]["status"] = {str(code): count for code, count in sorted(statuses[route].items())}
+    every = [latency for samples in latencies.values() for latency in samples]
+    return {"elapsed_s": round(elapsed, 3), "routes": routes, "total": summarize(every, elapsed)}
+
+def print_report(result):
+    print(f"{'route':<34}{'count':>8}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}  status")
+    for route, stats in list(result["routes"].items()) + [("TOTAL", result["total"])]:
+        print(f"{route:<34}{stats['count']:>8}{stats['rps']:>10.1f}{stats['p50_ms']:>10.2f}"
+              f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}  {stats.get('status', '')}")
+
+def compare(result, baseline, threshold):
+    """Print per-route deltas; returns the routes that regressed."""
+    regressions = []
+    print(f"\ncompared with {baseline.get('commit')} ({baseline.get('timestamp')})")
+    for route, stats in result["routes"].items():
+        base = baseline["routes"].get(route)
+        if not base or not base["p99_ms"] or not base["rps"]:
+            continue
+        p99_change = (stats["p99_ms"] / base["p99_ms"] - 1) * 100
+        rps_change = (stats["rps"] / base["rps"] - 1) * 100
+        flag = ""
+        if p99_change > threshold or rps_change < -threshold:
+            flag = "  REGRESSION"
+            regressions.append(route)
+        print(f"{route:<34} p99 {p99_change:+7.1f}%   rps {rps_change:+7.1f}%{flag}")
+    return regressions
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="comma-separated operation=weight pairs")
+    parser.add_argument("--base-url", help="run against a live server instead of in-process")
+    parser.add_argument("--mongomock", action="store_true", help="in-process run on an in-memory database")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold in percent")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+    random.seed(args.seed)
+    # One INFO line per request would dominate the run
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if args.base_url:
+        client = AsyncClient(base_url=args.base_url, timeout=30)
+    else:
+        import server
+        if args.mongomock:
+            from benchmarks.common import use_mongomock
+            use_mongomock(server)
+        server.connect_db()
+        # Every virtual user shares one client IP
+        server.rate_limiter.enabled = False
+        client = AsyncClient(transport=ASGITransport(app=server.app), base_url="http://loadtest", timeout=30)
+
+    async with client:
+        result = await run(client, args.concurrency, args.duration, mix)
+    result.update({
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": mix,
+            "target": args.base_url or ("in-process/mongomock" if args.mongomock else "in-process"),
+        },
+    })
+    print_report(result)
+
+    if args.output:
+        path = Path(args.output)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(result, indent=2))
+        print(f"\nresults written to {path}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if compare(result, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class Subscriber:
+    """Per-connection outbox with coalescing and a hard bound.
+
+    Messages are keyed (``"prices"``, ``"balance:btc"``...). A new message
+    replaces an undelivered one with the same key, so a slow client only ever
+    receives the latest state. Past ``max_pending`` distinct keys the oldest
+    undelivered message is dropped.
+    """
+
+    def __init__(self, user_id: str, max_pending: int = 16):
+        self.user_id = user_id
+        self.max_pending = max_pending
+        self._pending: "OrderedDict[str, str]" = OrderedDict()
+        self._ready = asyncio.Event()
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def offer(self, key: str, payload: str):
+        if key in self._pending:
+            self.coalesced += 1
+            self._pending.move_to_end(key)
+        self._pending[key] = payload
+        if len(self._pending) > self.max_pending:
+            self._pending.popitem(last=False)
+            self.dropped += 1
+        self._ready.set()
+
+    async def next_batch(self) -> List[str]:
+        await self._ready.wait()
+        self._ready.clear()
+        batch = list(self._pending.values())
+        self._pending.clear()
+        self.delivered += len(batch)
+        return batch
+
+class Broadcaster:
+    """Fans messages out to every subscriber, serializing each one once."""
+
+    def __init__(self, max_pending: int = 16):
+        self.max_pending = max_pending
+        self._subscribers: Set[Subscriber] = set()
+        self._by_user: Dict[str, Set[Subscriber]] = {}
+        self.published = 0
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, user_id: str) -> Subscriber:
+        subscriber = Subscriber(user_id, self.max_pending)
+        self._subscribers.add(subscriber)
+        self._by_user.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+        user_subscribers = self._by_user.get(subscriber.user_id)
+        if user_subscribers is not None:
+            user_subscribers.discard(subscriber)
+            if not user_subscribers:
+                del self._by_user[subscriber.user_id]
+
+    def publish(self, key: str, message: dict):
+        payload = json.dumps(message, ensure_ascii=False)
+        for subscriber in self._subscribers:
+            subscriber.offer(key, payload)
+        self.published += 1
+
+    def publish_user(self, user_id: str, key: str, message: dict):
+        user_subscribers = self._by_user.get(user_id)
+        if not user_subscribers:
+            return
+        payload = json.dumps(message, ensure_ascii=False)
+        for subscriber in user_subscribers:
+            subscriber.offer(key, payload)
+        self.published += 1
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self._subscribers),
+            "users": len(self._by_user),
+            "published": self.published,
+            "coalesced": sum(subscriber.coalesced for subscriber in self._subscribers),
+            "dropped": sum(subscriber.dropped for subscriber in self._subscribers),
+        }
+
+class UserRelay:
+    """Carries per-user messages to the worker holding the user's sockets.
+
+    Without a backend this is ``Broadcaster.publish_user``: a balance
+    update only reaches connections of the worker that ran the trade, so
+    the stream is single-worker. With a Redis-compatible backend every
+    message goes through one pub/sub channel and each worker delivers it
+    to its own subscribers, its own messages included. Publishing never
+    waits on the broker: messages are queued and sent in order by one
+    task, and dropped (counted) if the broker is down.
+    """
+
+    def __init__(self, broadcaster: Broadcaster, backend=None, channel: str = "stream:user",
+                 max_queue: int = 10000, retry_delay: float = 1.0, subscribe_timeout: float = 5.0):
+        self.broadcaster = broadcaster
+        self.backend = backend
+        self.channel = channel
+        self.retry_delay = retry_delay
+        self.subscribe_timeout = subscribe_timeout
+        self.max_queue = max_queue
+        self._outbox: Optional["asyncio.Queue[str]"] = None
+        self._tasks: List[asyncio.Task] = []
+        self._subscribed: Optional[asyncio.Event] = None
+        self.relayed = 0
+        self.received = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def publish_user(self, user_id: str, key: str, message: dict):
+        if self.backend is None:
+            self.broadcaster.publish_user(user_id, key, message)
+            return
+        if self._outbox is None:
+            # Not started (or stopped): nobody would send it
+            self.errors += 1
+            return
+        try:
+            self._outbox.put_nowait(json.dumps([user_id, key, message], ensure_ascii=False))
+        except asyncio.QueueFull:
+            self.errors += 1
+
+    async def _send(self):
+        while True:
+            payload = await self._outbox.get()
+            try:
+                await self.backend.publish(self.channel, payload)
+                self.relayed += 1
+            except Exception:
+                self.errors += 1
+                logger.exception("Stream relay publish failed")
+
+    async def _listen(self):
+        while True:
+            pubsub = self.backend.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message["type"] == "subscribe":
+                        self._subscribed.set()
+                        continue
+                    if message["type"] != "message":
+                        continue
+                    self.received += 1
+                    user_id, key, body = json.loads(message["data"])
+                    self.broadcaster.publish_user(user_id, key, body)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.errors += 1
+                logger.exception("Stream relay subscription lost, resubscribing")
+                await asyncio.sleep(self.retry_delay)
+            finally:
+                await pubsub.aclose()
+
+    async def start(self):
+        """Subscribe before returning, so no message published after it is missed.
+
+        An unreachable broker does not block startup past
+        ``subscribe_timeout``; the listener keeps retrying.
+        """
+        if self.backend is None or self._tasks:
+            return
+        self._subscribed = asyncio.Event()
+        self._outbox = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._send())]
+        try:
+            await asyncio.wait_for(self._subscribed.wait(), self.subscribe_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Stream relay not subscribed after %ss, still retrying", self.subscribe_timeout)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._outbox = None
+
+    def stats(self) -> dict:
+        return {
+            "relay": self.enabled,
+            "relayed": self.relayed,
+            "received": self.received,
+            "relay_errors": self.errors,
+        }
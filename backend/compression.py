@@ -0,0 +1,140 @@
+import zlib
+from typing import Optional, Sequence
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+DEFAULT_CONTENT_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+def accepted_encodings(header: str) -> dict:
+    encodings = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        # wbits=31: gzip container
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        # Sync flush keeps streamed rows flowing instead of sitting in the buffer
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class BrotliEncoder:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        body = self._compressor.process(data)
+        return body + (self._compressor.finish() if final else self._compressor.flush())
+
+class CompressionMiddleware:
+    """gzip/Brotli for text-like responses, streaming ones included.
+
+    Complete bodies under ``minimum_size`` go out as-is; streamed bodies are
+    compressed chunk by chunk. Brotli is used when the client accepts it and
+    the ``brotli`` package is installed.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4,
+                 content_types: Sequence[str] = DEFAULT_CONTENT_TYPES):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.content_types = tuple(content_types)
+
+    def choose(self, accept_encoding: str) -> Optional[str]:
+        encodings = accepted_encodings(accept_encoding)
+        wildcard = encodings.get("*", 0.0)
+        if brotli is not None and encodings.get("br", wildcard) > 0:
+            return "br"
+        if encodings.get("gzip", wildcard) > 0:
+            return "gzip"
+        return None
+
+    def compressor(self, encoding: str):
+        return BrotliEncoder(self.brotli_quality) if encoding == "br" else GzipEncoder(self.gzip_level)
+
+    def compressible(self, headers: dict) -> bool:
+        content_type = headers.get(b"content-type", b"").decode("latin-1").split(";")[0].strip().lower()
+        return any(content_type.startswith(allowed) for allowed in self.content_types)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_headers = dict(scope["headers"])
+        encoding = self.choose(request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = dict(message.get("headers", []))
+                if (message["status"] in (204, 304) or b"content-encoding" in headers
+                        or not self.compressible(headers)):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Held until the first body chunk tells complete from streamed
+                    start_message = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(self._start(start_message, None, None))
+                    await send(message)
+                    return
+                compressor = self.compressor(encoding)
+                compressed = compressor.compress(body, final=not more_body)
+                await send(self._start(start_message, encoding, None if more_body else len(compressed)))
+            else:
+                compressed = compressor.compress(body, final=not more_body)
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _start(message: dict, encoding: Optional[str], length: Optional[int]) -> dict:
+        headers = [(key, value) for key, value in message.get("headers", []) if key != b"vary"]
+        vary = [value for key, value in message.get("headers", []) if key == b"vary"]
+        if b"accept-encoding" not in b",".join(vary).lower():
+            vary.append(b"Accept-Encoding")
+        headers.append((b"vary", b", ".join(vary)))
+        if encoding is not None:
+            rewritten = []
+            for key, value in headers:
+                if key == b"content-length":
+                    continue
+                if key == b"etag" and not value.startswith(b"W/"):
+                    # The compressed bytes differ, so the tag can only be weak
+                    value = b"W/" + value
+                rewritten.append((key, value))
+            headers = rewritten + [(b"content-encoding", encoding.encode())]
+            if length is not None:
+                headers.append((b"content-length", str(length).encode()))
+        return {**message, "headers": headers}
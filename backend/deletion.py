@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DELETION_COLLECTION = "deletion_jobs"
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+class AccountPurger:
+    """Deletes a tombstoned account's data in the background.
+
+    Every job is a document in ``deletion_jobs``; a worker claims it with a
+    lease that each batch renews, so a job left behind by a crashed worker
+    is picked up again by the periodic sweep. Batches delete by ``_id``
+    and the account document goes last, so a purge can stop anywhere and
+    simply run again.
+    """
+
+    def __init__(self, get_db: Callable, collections: Sequence[str],
+                 hooks: Sequence[Callable[[str], Awaitable]] = (), batch_size: int = 1000,
+                 lease: float = 60.0, sweep_interval: float = 30.0):
+        self._get_db = get_db
+        self.collections = list(collections)
+        # Extra cleanup per user (files, in-memory state); must be idempotent
+        self.hooks = list(hooks)
+        self.batch_size = batch_size
+        self.lease = lease
+        self.sweep_interval = sweep_interval
+        self._tasks = set()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def submit(self, job_id: str, user_id: str) -> dict:
+        now = utc_now()
+        job = {
+            "id": job_id,
+            "user_id": user_id,
+            "status": "pending",
+            "deleted": {},
+            "lease_until": 0,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None,
+        }
+        await self._get_db()[DELETION_COLLECTION].insert_one(dict(job))
+        self._spawn(job_id)
+        return job
+
+    def _spawn(self, job_id: Optional[str] = None):
+        task = asyncio.create_task(self.run(job_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def claim(self, job_id: Optional[str] = None) -> Optional[dict]:
+        """Take one unfinished job whose lease has expired (``job_id`` to pick it)."""
+        now = time.time()
+        query = {"status": {"$in": ["pending", "running"]}, "lease_until": {"$lt": now}}
+        if job_id is not None:
+            query["id"] = job_id
+        # The document as it was before the claim; the lease is ours if it matched
+        return await self._get_db()[DELETION_COLLECTION].find_one_and_update(
+            query,
+            {"$set": {"status": "running", "lease_until": now + self.lease, "updated_at": utc_now()}},
+            projection={"_id": 0},
+        )
+
+    async def run(self, job_id: Optional[str] = None) -> int:
+        """Purge claimable jobs (just ``job_id`` if given); returns how many finished."""
+        finished = 0
+        while True:
+            job = await self.claim(job_id)
+            if job is None:
+                return finished
+            try:
+                await self.purge(job)
+                finished += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Left "running"; the sweep retries once the lease runs out
+                logger.exception("Account deletion %s failed", job["id"])
+                return finished
+            if job_id is not None:
+                return finished
+
+    async def purge(self, job: dict):
+        db = self._get_db()
+        jobs = db[DELETION_COLLECTION]
+        user_id = job["user_id"]
+        for hook in self.hooks:
+            await hook(user_id)
+        # Writes already in flight at tombstone time can land after a collection
+        # was emptied, so sweep again until a whole pass finds nothing
+        while True:
+            deleted = 0
+            for collection in self.collections:
+                while True:
+                    ids = [
+                        document["_id"]
+                        async for document in db[collection].find({"user_id": user_id}, {"_id": 1}).limit(self.batch_size)
+                    ]
+                    if not ids:
+                        break
+                    result = await db[collection].delete_many({"_id": {"$in": ids}})
+                    deleted += result.deleted_count
+                    await jobs.update_one({"id": job["id"]}, {
+                        "$inc": {f"deleted.{collection}": result.deleted_count},
+                        "$set": {"lease_until": time.time() + self.lease, "updated_at": utc_now()},
+                    })
+            if not deleted:
+                break
+        await db.users.delete_one({"id": user_id, "deleted_at": {"$exists": True}})
+        await jobs.update_one({"id": job["id"]}, {"$set": {
+            "status": "done", "lease_until": 0, "updated_at": utc_now(), "finished_at": utc_now(),
+        }})
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self._get_db()[DELETION_COLLECTION].find_one({"id": job_id}, {"_id": 0})
+
+    async def _sweep(self):
+        while True:
+            try:
+                await self.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Account deletion sweep failed")
+            await asyncio.sleep(self.sweep_interval)
+
+    def start(self):
+        # The first sweep also resumes jobs interrupted by a restart
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def stop(self):
+        tasks: List[asyncio.Task] = list(self._tasks)
+        if self._sweeper is not None:
+            tasks.append(self._sweeper)
+            self._sweeper = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,318 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLLECTION = "export_jobs"
+EXPORT_FORMATS = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+EXPORT_COLUMNS = [
+    "id", "user_id", "crypto_id", "crypto_name", "crypto_symbol", "transaction_type",
+    "quantity", "price_brl", "total_brl", "timestamp",
+]
+EXPORT_SORT = [("user_id", 1), ("timestamp", 1), ("id", 1)]
+
+def iso_utc(value: datetime) -> str:
+    # Stored timestamps are UTC isoformat strings, so they compare as text
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+def export_query(user_id: Optional[str] = None, start: Optional[datetime] = None,
+                 end: Optional[datetime] = None, crypto_id: Optional[str] = None) -> dict:
+    query = {}
+    if user_id is not None:
+        query["user_id"] = user_id
+    if start is not None or end is not None:
+        query["timestamp"] = {}
+        if start is not None:
+            query["timestamp"]["$gte"] = iso_utc(start)
+        if end is not None:
+            query["timestamp"]["$lt"] = iso_utc(end)
+    if crypto_id is not None:
+        query["crypto_id"] = crypto_id
+    return query
+
+async def iter_frames(db, query: dict, batch_size: int = 5000) -> AsyncIterator["pd.DataFrame"]:
+    """Stream matching transactions as DataFrames of at most ``batch_size`` rows."""
+    cursor = db.transactions.find(
+        query, {"_id": 0, **{column: 1 for column in EXPORT_COLUMNS}}
+    ).sort(EXPORT_SORT).batch_size(batch_size)
+    rows: List[dict] = []
+    async for transaction in cursor:
+        rows.append(transaction)
+        if len(rows) >= batch_size:
+            yield to_frame(rows)
+            rows = []
+    if rows:
+        yield to_frame(rows)
+
+def to_frame(rows: List[dict]) -> "pd.DataFrame":
+    # Imported on first export: pandas is most of the app's import time
+    import pandas as pd
+
+    frame = pd.DataFrame.from_records(rows, columns=EXPORT_COLUMNS)
+    return frame.astype({"quantity": "float64", "price_brl": "float64", "total_brl": "float64"})
+
+async def iter_csv(db, query: dict, batch_size: int = 5000) -> AsyncIterator[str]:
+    """CSV text, one chunk per batch; the header comes first even with no rows."""
+    yield ",".join(EXPORT_COLUMNS) + "\n"
+    async for frame in iter_frames(db, query, batch_size):
+        yield await asyncio.to_thread(frame.to_csv, header=False, index=False)
+
+class ParquetSink:
+    """Appends one row group per frame; pyarrow is only needed for Parquet."""
+
+    def __init__(self, path: Path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self.schema = pa.schema([
+            (column, pa.float64() if column in ("quantity", "price_brl", "total_brl") else pa.string())
+            for column in EXPORT_COLUMNS
+        ])
+        self.writer = pq.ParquetWriter(str(path), self.schema)
+
+    def write(self, frame: "pd.DataFrame"):
+        self.writer.write_table(self._pa.Table.from_pandas(frame, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        self.writer.close()
+
+class CsvSink:
+    def __init__(self, path: Path):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.file.write(",".join(EXPORT_COLUMNS) + "\n")
+
+    def write(self, frame: "pd.DataFrame"):
+        frame.to_csv(self.file, header=False, index=False)
+
+    def close(self):
+        self.file.close()
+
+SINKS = {"csv": CsvSink, "parquet": ParquetSink}
+
+async def write_export(db, query: dict, path: Path, export_format: str, batch_size: int = 5000,
+                       on_batch: Optional[Callable[[int], Awaitable]] = None) -> int:
+    """Write every matching transaction to ``path``; returns the row count.
+
+    Holds at most one batch in memory; encoding and file I/O run off the loop.
+    ``on_batch`` is awaited with the running row count after each batch.
+    """
+    sink = await asyncio.to_thread(SINKS[export_format], path)
+    rows = 0
+    try:
+        async for frame in iter_frames(db, query, batch_size):
+            await asyncio.to_thread(sink.write, frame)
+            rows += len(frame)
+            if on_batch is not None:
+                await on_batch(rows)
+    finally:
+        await asyncio.to_thread(sink.close)
+    return rows
+
+class ExportInProgress(Exception):
+    """The user already has an export pending or running."""
+
+class ExportJobs:
+    """Background exports to files under ``directory``, tracked in Mongo.
+
+    The job document is the download handle; with several workers
+    ``directory`` must be shared between them. Like account deletions, a
+    worker claims a job with a lease that each batch renews, so one left
+    ``running`` by a crashed worker is written again by the periodic
+    sweep, up to ``max_attempts`` times. A user has at most one unfinished
+    job: ``active_user`` is set only while it is pending or running, under
+    a unique sparse index.
+    """
+
+    def __init__(self, get_db, directory, retention: float = 24 * 3600, batch_size: int = 5000,
+                 lease: float = 60.0, sweep_interval: float = 30.0, max_attempts: int = 3):
+        self._get_db = get_db
+        self.directory = Path(directory)
+        self.retention = retention
+        self.batch_size = batch_size
+        self.lease = lease
+        self.sweep_interval = sweep_interval
+        self.max_attempts = max_attempts
+        self._tasks = set()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def path_for(self, job: dict) -> Path:
+        return self.directory / f"{job['id']}.{job['format']}"
+
+    async def active(self, user_id: str) -> Optional[dict]:
+        return await self._get_db()[EXPORT_COLLECTION].find_one(
+            {"user_id": user_id, "status": {"$in": ["pending", "running"]}}, {"_id": 0}
+        )
+
+    async def submit(self, job_id: str, user_id: Optional[str], query: dict, export_format: str) -> dict:
+        if user_id is not None and await self.active(user_id) is not None:
+            raise ExportInProgress(user_id)
+        now = datetime.now(timezone.utc)
+        job = {
+            "id": job_id,
+            "user_id": user_id,
+            "format": export_format,
+            "status": "pending",
+            "rows": 0,
+            "error": None,
+            "created_at": now.isoformat(),
+            "expires_at": (now + timedelta(seconds=self.retention)).isoformat(),
+        }
+        # Text, not a document: the filter's "$gte"/"$lt" keys cannot be stored as field names
+        document = {**job, "query": json.dumps(query), "lease_until": 0, "attempts": 0}
+        if user_id is not None:
+            document["active_user"] = user_id
+        try:
+            await self._get_db()[EXPORT_COLLECTION].insert_one(document)
+        except DuplicateKeyError:
+            # Another request for the same user got in between
+            raise ExportInProgress(user_id)
+        self._spawn(job_id)
+        return job
+
+    def _spawn(self, job_id: Optional[str] = None):
+        task = asyncio.create_task(self.run(job_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def claim(self, job_id: Optional[str] = None) -> Optional[dict]:
+        """Take one unfinished job whose lease has expired (``job_id`` to pick it)."""
+        now = time.time()
+        query = {"status": {"$in": ["pending", "running"]}, "lease_until": {"$lt": now}}
+        if job_id is not None:
+            query["id"] = job_id
+        # The document as it was before the claim; the lease is ours if it matched
+        return await self._get_db()[EXPORT_COLLECTION].find_one_and_update(
+            query,
+            {"$set": {"status": "running", "lease_until": now + self.lease}, "$inc": {"attempts": 1}},
+            projection={"_id": 0},
+        )
+
+    async def run(self, job_id: Optional[str] = None) -> int:
+        """Write claimable jobs (just ``job_id`` if given); returns how many finished."""
+        finished = 0
+        while True:
+            job = await self.claim(job_id)
+            if job is None:
+                return finished
+            if job.get("attempts", 0) >= self.max_attempts:
+                # Claimed this many times without finishing: it takes its worker down
+                await self._finish(job, {"status": "failed", "error": "Exportação interrompida"})
+            else:
+                await self._export(job)
+            finished += 1
+            if job_id is not None:
+                return finished
+
+    async def _finish(self, job: dict, fields: dict):
+        await self._get_db()[EXPORT_COLLECTION].update_one(
+            {"id": job["id"]}, {"$set": {**fields, "lease_until": 0}, "$unset": {"active_user": ""}}
+        )
+
+    async def _export(self, job: dict):
+        db = self._get_db()
+        jobs = db[EXPORT_COLLECTION]
+        path = self.path_for(job)
+
+        async def renew(rows: int):
+            await jobs.update_one({"id": job["id"]}, {"$set": {"rows": rows, "lease_until": time.time() + self.lease}})
+
+        try:
+            await asyncio.to_thread(self.directory.mkdir, parents=True, exist_ok=True)
+            rows = await write_export(db, json.loads(job["query"]), path, job["format"], self.batch_size, renew)
+        except asyncio.CancelledError:
+            # Shutdown: never leave the job "running" next to a partial file
+            path.unlink(missing_ok=True)
+            await self._finish(job, {"status": "failed", "error": "Exportação interrompida"})
+            raise
+        except Exception as exc:
+            logger.exception("Export %s failed", job["id"])
+            path.unlink(missing_ok=True)
+            await self._finish(job, {"status": "failed", "error": str(exc)})
+        else:
+            await self._finish(job, {
+                "status": "done",
+                "rows": rows,
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+            })
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self._get_db()[EXPORT_COLLECTION].find_one({"id": job_id}, {"_id": 0})
+
+    async def prune(self) -> int:
+        """Delete expired jobs and their files."""
+        jobs = self._get_db()[EXPORT_COLLECTION]
+        expired = {"expires_at": {"$lt": datetime.now(timezone.utc).isoformat()}}
+        async for job in jobs.find(expired, {"_id": 0, "id": 1, "format": 1}):
+            self.path_for(job).unlink(missing_ok=True)
+        return (await jobs.delete_many(expired)).deleted_count
+
+    async def delete_user(self, user_id: str) -> int:
+        jobs = self._get_db()[EXPORT_COLLECTION]
+        async for job in jobs.find({"user_id": user_id}, {"_id": 0, "id": 1, "format": 1}):
+            self.path_for(job).unlink(missing_ok=True)
+        return (await jobs.delete_many({"user_id": user_id})).deleted_count
+
+    async def _sweep(self):
+        while True:
+            try:
+                await self.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Export sweep failed")
+            await asyncio.sleep(self.sweep_interval)
+
+    def start(self):
+        # The first sweep also resumes jobs interrupted by a restart
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def stop(self):
+        tasks: List[asyncio.Task] = list(self._tasks)
+        if self._sweeper is not None:
+            tasks.append(self._sweeper)
+            self._sweeper = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export transactions to CSV or Parquet")
+    parser.add_argument("output", help="destination file")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), help="defaults to the output extension")
+    parser.add_argument("--user-id", help="only this user's ledger (default: whole database)")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="ISO date/time, inclusive")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="ISO date/time, exclusive")
+    parser.add_argument("--crypto-id")
+    parser.add_argument("--batch-size", type=int, default=int(os.environ.get('EXPORT_BATCH_SIZE', '5000')))
+    args = parser.parse_args()
+    output = Path(args.output)
+    export_format = args.format or output.suffix.lstrip(".")
+    if export_format not in EXPORT_FORMATS:
+        parser.error(f"unknown format {export_format!r}; use --format")
+
+    # Imported here: server imports this module
+    from server import connect_db
+
+    db = connect_db()
+    query = export_query(args.user_id, args.start, args.end, args.crypto_id)
+    rows = asyncio.run(write_export(db, query, output, export_format, args.batch_size))
+    print(f"{rows} rows written to {output}")
+
+if __name__ == "__main__":
+    main()
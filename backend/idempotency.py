@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+import orjson
+from pymongo.errors import DuplicateKeyError
+
+IDEMPOTENCY_COLLECTION = "idempotency_keys"
+MAX_KEY_LENGTH = 255
+# Stored for a request that stopped after it started writing: whether the
+# trade applied is unknown, so it is never run again
+INTERRUPTED_RESPONSE = {"detail": "Erro interno, confira o histórico"}
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request."""
+
+class IdempotencyInProgress(Exception):
+    """The first request with this key is still running."""
+
+def request_fingerprint(route: str, payload: dict) -> str:
+    return hashlib.sha256(route.encode() + b"\0" + orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+class IdempotencyLedger:
+    """Stored responses per (user, Idempotency-Key), expired by a TTL index.
+
+    ``begin`` claims the key with an insert, so the unique ``_id`` lets
+    exactly one of several concurrent duplicates execute; the others wait
+    for its stored response, up to ``wait`` seconds. The claim is held by
+    ``owner`` for ``lease`` seconds, and ``mark_writing`` records that its
+    writes are starting. Past the lease a retry takes over a claim with
+    no write marker (the worker died, or is slow and will find the claim
+    gone when it tries to write); one with a marker is completed as a
+    500 instead, since the trade may have applied.
+    """
+
+    def __init__(self, get_db: Callable, wait: float = 10.0, poll_interval: float = 0.05, lease: float = 60.0):
+        self._get_db = get_db
+        self.wait = wait
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.replayed = 0
+        self.taken_over = 0
+
+    @staticmethod
+    def record_id(user_id: str, key: str) -> str:
+        return f"{user_id}:{key}"
+
+    async def begin(self, user_id: str, key: str, fingerprint: str, owner: str) -> Optional[dict]:
+        """None if ``owner`` should execute; otherwise the stored response."""
+        records = self._get_db()[IDEMPOTENCY_COLLECTION]
+        record_id = self.record_id(user_id, key)
+        try:
+            await records.insert_one({
+                "_id": record_id,
+                "user_id": user_id,
+                "fingerprint": fingerprint,
+                "status": "pending",
+                "owner": owner,
+                "lease_until": time.time() + self.lease,
+                "created_at": datetime.now(timezone.utc),
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+        deadline = time.monotonic() + self.wait
+        while True:
+            record = await records.find_one({"_id": record_id})
+            if record is None:
+                # Released by a failed first attempt: claim it again
+                return await self.begin(user_id, key, fingerprint, owner)
+            if record["fingerprint"] != fingerprint:
+                raise IdempotencyConflict()
+            if record["status"] == "done":
+                self.replayed += 1
+                return record["response"]
+            if record.get("lease_until", 0) < time.time():
+                if "writing_at" in record:
+                    # Its writes may have applied: answer, never run it twice
+                    await records.update_one(
+                        {"_id": record_id, "status": "pending"},
+                        {"$set": {"status": "done", "response": {"status_code": 500, "body": INTERRUPTED_RESPONSE}}},
+                    )
+                    continue
+                # Conditional on the lease we saw, so one retry takes it over
+                taken = await records.update_one(
+                    {"_id": record_id, "status": "pending", "lease_until": record.get("lease_until"),
+                     "writing_at": {"$exists": False}},
+                    {"$set": {"owner": owner, "lease_until": time.time() + self.lease}},
+                )
+                if taken.modified_count:
+                    self.taken_over += 1
+                    return None
+            if time.monotonic() >= deadline:
+                raise IdempotencyInProgress()
+            await asyncio.sleep(self.poll_interval)
+
+    async def mark_writing(self, user_id: str, key: str, owner: str) -> bool:
+        """Record that ``owner`` starts writing; False if its claim was taken over."""
+        result = await self._get_db()[IDEMPOTENCY_COLLECTION].update_one(
+            {"_id": self.record_id(user_id, key), "status": "pending", "owner": owner},
+            {"$set": {"writing_at": datetime.now(timezone.utc)}},
+        )
+        return result.modified_count == 1
+
+    async def complete(self, user_id: str, key: str, owner: str, status_code: int, body):
+        await self._get_db()[IDEMPOTENCY_COLLECTION].update_one(
+            {"_id": self.record_id(user_id, key), "status": "pending", "owner": owner},
+            {"$set": {"status": "done", "response": {"status_code": status_code, "body": body}}}
+        )
+
+    async def release(self, user_id: str, key: str, owner: str):
+        """Forget a key whose request failed before changing anything."""
+        await self._get_db()[IDEMPOTENCY_COLLECTION].delete_one(
+            {"_id": self.record_id(user_id, key), "status": "pending", "owner": owner,
+             "writing_at": {"$exists": False}}
+        )
+
+    def stats(self) -> dict:
+        return {"replayed": self.replayed, "taken_over": self.taken_over}
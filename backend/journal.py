@@ -0,0 +1,195 @@
+import argparse
+import asyncio
+import time
+from typing import Callable, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+from metrics import JOURNAL_BATCH_SIZE, JOURNAL_FLUSH_LATENCY
+from positions import new_position, recompute
+
+class TransactionJournal:
+    """Write-behind for transaction records, flushed by group commit.
+
+    ``write`` queues the document and returns once the ``insert_many``
+    carrying it has been acknowledged, so a trade is still only confirmed
+    after its record is stored. A group is flushed when it reaches
+    ``max_batch`` records or ``max_delay`` seconds after its first one.
+    """
+
+    def __init__(self, get_db: Callable, collection: str = "transactions",
+                 max_batch: int = 500, max_delay: float = 0.005):
+        self._get_db = get_db
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: List[Tuple[dict, asyncio.Future]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._stopping = False
+        self.flushes = 0
+        self.records = 0
+        self.failed = 0
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    async def write(self, document: dict):
+        # Started on first use as well, for apps that skip the startup hooks
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((document, future))
+        if len(self._queue) >= self.max_batch:
+            self._full.set()
+        self._wakeup.set()
+        await future
+
+    async def _run(self):
+        while not self._stopping:
+            await self._wakeup.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._full.clear()
+            await self._drain()
+
+    async def _drain(self):
+        while self._queue:
+            batch = self._queue[:self.max_batch]
+            del self._queue[:self.max_batch]
+            await self.flush(batch)
+
+    async def flush(self, batch: List[Tuple[dict, asyncio.Future]]):
+        failures = {}
+        started = time.perf_counter()
+        try:
+            await self._get_db()[self.collection].insert_many([document for document, _ in batch], ordered=False)
+        except BulkWriteError as exc:
+            # Unordered: only the records listed in writeErrors are missing
+            failures = {error["index"]: exc for error in exc.details.get("writeErrors", [])}
+        except Exception as exc:
+            failures = {index: exc for index in range(len(batch))}
+        JOURNAL_FLUSH_LATENCY.observe(time.perf_counter() - started)
+        JOURNAL_BATCH_SIZE.observe(len(batch))
+        self.flushes += 1
+        self.records += len(batch) - len(failures)
+        self.failed += len(failures)
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                # The request went away; its record is written all the same
+                continue
+            if index in failures:
+                future.set_exception(failures[index])
+            else:
+                future.set_result(None)
+
+    async def stop(self):
+        """Flush what is queued, then stop the flusher."""
+        if self._task is not None and self._task.get_loop() is asyncio.get_running_loop():
+            # Not cancelled: a batch taken off the queue must finish its flush
+            self._stopping = True
+            self._full.set()
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._stopping = False
+        self._task = None
+        await self._drain()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._queue),
+            "flushes": self.flushes,
+            "records": self.records,
+            "failed": self.failed,
+            "avg_batch": self.records / self.flushes if self.flushes else 0.0,
+        }
+
+async def check(db, user_id: Optional[str] = None) -> List[dict]:
+    """Positions whose trade counters disagree with the transaction log.
+
+    The wallet is updated before its record is written, so a crash with
+    records still queued leaves ``buy_count``/``sell_count`` ahead of the
+    log. Wallets without counters (written before they existed) are
+    skipped until ``positions`` has been recomputed once.
+    """
+    match = {} if user_id is None else {"user_id": user_id}
+    logged = {}
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "crypto_id": "$crypto_id"},
+            "buy_count": {"$sum": {"$cond": [{"$eq": ["$transaction_type", "buy"]}, 1, 0]}},
+            "sell_count": {"$sum": {"$cond": [{"$eq": ["$transaction_type", "sell"]}, 1, 0]}},
+        }},
+    ]
+    async for group in db.transactions.aggregate(pipeline, allowDiskUse=True):
+        logged[(group["_id"]["user_id"], group["_id"]["crypto_id"])] = (group["buy_count"], group["sell_count"])
+
+    mismatches = []
+    wallets = db.wallets.find(
+        {**match, "buy_count": {"$exists": True}},
+        {"_id": 0, "user_id": 1, "crypto_id": 1, "buy_count": 1, "sell_count": 1},
+    )
+    async for wallet in wallets:
+        key = (wallet["user_id"], wallet["crypto_id"])
+        counted = (wallet.get("buy_count", 0), wallet.get("sell_count", 0))
+        expected = logged.get(key, (0, 0))
+        if counted != expected:
+            mismatches.append({
+                "user_id": key[0],
+                "crypto_id": key[1],
+                "wallet": {"buy_count": counted[0], "sell_count": counted[1]},
+                "logged": {"buy_count": expected[0], "sell_count": expected[1]},
+            })
+    return mismatches
+
+async def repair(db, mismatches: List[dict]) -> int:
+    """Rebuild the affected users' wallets from the log.
+
+    The lost trades were never acknowledged to the client, so the log is
+    taken as the truth and their wallet changes are rolled back. Like
+    ``recompute``, run it while trading is paused.
+    """
+    written = 0
+    for mismatch in mismatches:
+        if mismatch["logged"] == {"buy_count": 0, "sell_count": 0}:
+            # Nothing in the log for the replay to rebuild it from
+            await db.wallets.update_one(
+                {"user_id": mismatch["user_id"], "crypto_id": mismatch["crypto_id"]}, {"$set": new_position()}
+            )
+            written += 1
+    for user_id in sorted({mismatch["user_id"] for mismatch in mismatches}):
+        written += await recompute(db, user_id)
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Check wallets against the transaction log after a crash")
+    parser.add_argument("--user-id", help="only check this user")
+    parser.add_argument("--repair", action="store_true", help="recompute the wallets of mismatched users")
+    args = parser.parse_args()
+
+    # Imported here: server imports this module
+    from server import connect_db
+
+    db = connect_db()
+
+    async def run():
+        mismatches = await check(db, args.user_id)
+        for mismatch in mismatches:
+            print(f"{mismatch['user_id']} {mismatch['crypto_id']}: wallet {mismatch['wallet']}, log {mismatch['logged']}")
+        print(f"{len(mismatches)} mismatched positions")
+        if args.repair and mismatches:
+            print(f"{await repair(db, mismatches)} positions recomputed")
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
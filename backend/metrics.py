@@ -0,0 +1,167 @@
+import contextvars
+import logging
+import time
+from typing import Callable, Dict, List, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+REGISTRY = CollectorRegistry()
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], registry=REGISTRY,
+)
+MONGO_LATENCY = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency",
+    ["command", "collection", "outcome"], registry=REGISTRY,
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+AUTH_LATENCY = Histogram(
+    "auth_stage_duration_seconds", "Time spent in get_current_user by stage",
+    ["stage", "source"], registry=REGISTRY,
+    buckets=(.00005, .0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1),
+)
+HASH_LATENCY = Histogram(
+    "password_hash_duration_seconds", "bcrypt hash/verify latency, including pool wait",
+    ["operation"], registry=REGISTRY,
+    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+JOURNAL_BATCH_SIZE = Histogram(
+    "journal_batch_size", "Transaction records per journal group commit",
+    registry=REGISTRY, buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+JOURNAL_FLUSH_LATENCY = Histogram(
+    "journal_flush_duration_seconds", "Journal insert_many latency per group commit",
+    registry=REGISTRY, buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1),
+)
+
+MAX_LOGGED_COMMANDS = 50
+
+# Commands issued while handling the current request, for the slow log.
+# Motor copies the context into its executor threads, so the listener sees it.
+request_commands: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_commands", default=None)
+
+def query_shape(value):
+    """Replace literal values by "?" so shapes group and carry no user data."""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+        return [query_shape(item) for item in value]
+    return "?"
+
+def command_shape(name: str, command: dict):
+    if name == "find":
+        return {"filter": query_shape(command.get("filter", {})), "sort": command.get("sort")}
+    if name == "aggregate":
+        return [next(iter(stage)) for stage in command.get("pipeline", [])]
+    if name == "findAndModify":
+        return {"query": query_shape(command.get("query", {}))}
+    if name in ("update", "delete"):
+        return [query_shape(statement.get("q", {})) for statement in command.get(name + "s", [])[:3]]
+    return None
+
+class MongoCommandTimer(monitoring.CommandListener):
+    def __init__(self):
+        self._started: Dict[tuple, tuple] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        commands = request_commands.get()
+        shape = command_shape(event.command_name, event.command) if commands is not None else None
+        self._started[(event.connection_id, event.request_id)] = (collection, commands, shape)
+
+    def _finish(self, event, outcome: str):
+        collection, commands, shape = self._started.pop((event.connection_id, event.request_id), ("", None, None))
+        seconds = event.duration_micros / 1e6
+        MONGO_LATENCY.labels(event.command_name, collection, outcome).observe(seconds)
+        if commands is not None and len(commands) < MAX_LOGGED_COMMANDS:
+            commands.append({
+                "command": event.command_name,
+                "collection": collection,
+                "ms": round(seconds * 1000, 3),
+                "shape": shape,
+            })
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+class StatsCollector:
+    """Exposes the numeric fields of existing ``stats()`` dicts as gauges."""
+
+    def __init__(self, sources: Dict[str, Callable[[], dict]]):
+        self.sources = sources
+
+    def collect(self):
+        for source, stats in self.sources.items():
+            for key, value in stats().items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    yield GaugeMetricFamily(f"app_{source}_{key}", f"{source} {key}", value=value)
+
+class MetricsMiddleware:
+    """Per-route latency histogram plus an optional slow-request log.
+
+    Routes are labeled by their template (``/api/wallet``), never by the raw
+    path, to keep label cardinality bounded.
+    """
+
+    def __init__(self, app, slow_request_ms: float = 0):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+        self._templates: Dict[Callable, str] = {}
+
+    def route_template(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        template = self._templates.get(endpoint)
+        if template is None:
+            for route in scope["app"].routes:
+                if getattr(route, "endpoint", None) is endpoint:
+                    template = route.path
+                    break
+            else:
+                template = getattr(endpoint, "__name__", "unknown")
+            self._templates[endpoint] = template
+        return template
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        commands: List[dict] = []
+        token = request_commands.set(commands if self.slow_request_ms > 0 else None)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            request_commands.reset(token)
+            route = self.route_template(scope)
+            REQUEST_LATENCY.labels(scope["method"], route, str(status_code)).observe(elapsed)
+            if 0 < self.slow_request_ms <= elapsed * 1000:
+                logger.warning(
+                    "Slow request %s %s -> %s in %.1fms; mongo: %s",
+                    scope["method"], route, status_code, elapsed * 1000, commands,
+                )
+
+def render_metrics() -> tuple:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
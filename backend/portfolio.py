@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Optional, Set
+
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+PORTFOLIO_COLLECTION = "portfolio_history"
+# One document per periodic job; unique on "id"
+LEASE_COLLECTION = "job_leases"
+REVALUE_LEASE = "portfolio_revalue"
+RECORD_CHUNK = 500
+
+# range -> (window, bucket size) served by /api/wallet/history
+HISTORY_RANGES = {
+    "1d": (timedelta(days=1), timedelta(minutes=15)),
+    "7d": (timedelta(days=7), timedelta(hours=1)),
+    "30d": (timedelta(days=30), timedelta(hours=6)),
+    "1y": (timedelta(days=365), timedelta(days=1)),
+    "all": (None, timedelta(days=7)),
+}
+
+async def ensure_series(db) -> str:
+    if PORTFOLIO_COLLECTION in await db.list_collection_names():
+        return "exists"
+    try:
+        await db.create_collection(
+            PORTFOLIO_COLLECTION,
+            timeseries={"timeField": "ts", "metaField": "user_id", "granularity": "minutes"},
+        )
+        return "created (time-series)"
+    except (OperationFailure, NotImplementedError):
+        # MongoDB < 5.0 and in-memory stand-ins have no time-series collections
+        await db[PORTFOLIO_COLLECTION].create_index([("user_id", 1), ("ts", 1)], name="user_ts")
+        return "created (regular)"
+
+def make_point(user_id: str, holdings: Dict[str, float], prices: Dict[str, float], at: datetime) -> dict:
+    # "epoch" duplicates "ts" as a number so buckets are plain arithmetic
+    return {
+        "user_id": user_id,
+        "ts": at,
+        "epoch": at.timestamp(),
+        "holdings": holdings,
+        "total_brl": round(sum(quantity * prices.get(crypto_id, 0.0) for crypto_id, quantity in holdings.items()), 2),
+    }
+
+def history_pipeline(user_id: str, range_name: str, now: datetime) -> list:
+    window, bucket = HISTORY_RANGES[range_name]
+    match = {"user_id": user_id}
+    if window is not None:
+        match["ts"] = {"$gte": now - window}
+    size = bucket.total_seconds()
+    return [
+        {"$match": match},
+        {"$sort": {"ts": 1}},
+        {"$group": {
+            "_id": {"$subtract": ["$epoch", {"$mod": ["$epoch", size]}]},
+            "ts": {"$last": "$ts"},
+            "total_brl": {"$last": "$total_brl"},
+            "holdings": {"$last": "$holdings"},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+
+async def record_users(db, user_ids: Iterable[str], prices) -> int:
+    """Write one point per user from their current holdings and ``prices``."""
+    price_of = {crypto["id"]: crypto["price_brl"] for crypto in prices.cryptos}
+    user_ids = list(user_ids)
+    written = 0
+    for start in range(0, len(user_ids), RECORD_CHUNK):
+        chunk = user_ids[start:start + RECORD_CHUNK]
+        holdings = {user_id: {} for user_id in chunk}
+        async for item in db.wallets.find(
+            {"user_id": {"$in": chunk}, "quantity": {"$gt": 0}},
+            {"_id": 0, "user_id": 1, "crypto_id": 1, "quantity": 1}
+        ):
+            holdings[item["user_id"]][item["crypto_id"]] = item["quantity"]
+        now = datetime.now(timezone.utc)
+        await db[PORTFOLIO_COLLECTION].insert_many([
+            make_point(user_id, user_holdings, price_of, now) for user_id, user_holdings in holdings.items()
+        ])
+        written += len(chunk)
+    return written
+
+class PortfolioRecorder:
+    """Background job that keeps the valuation series up to date.
+
+    Trades ``mark()`` the user; marked users get a new point on the next
+    flush. Every ``revalue_interval`` seconds (0 disables it) all users with
+    holdings get a point too, so the series follows price moves; every
+    worker runs the timer, but only the one holding the period's lease in
+    ``job_leases`` writes the points.
+    """
+
+    def __init__(self, get_db: Callable, get_prices: Callable, flush_interval: float = 5.0,
+                 revalue_interval: float = 3600.0):
+        self._get_db = get_db
+        self._get_prices = get_prices
+        self.flush_interval = flush_interval
+        self.revalue_interval = revalue_interval
+        self._dirty: Set[str] = set()
+        self._tasks = []
+
+    def mark(self, user_id: str):
+        self._dirty.add(user_id)
+
+    def forget(self, user_id: str):
+        self._dirty.discard(user_id)
+
+    async def flush(self) -> int:
+        if not self._dirty:
+            return 0
+        user_ids, self._dirty = self._dirty, set()
+        return await record_users(self._get_db(), user_ids, self._get_prices())
+
+    async def revalue_all(self) -> int:
+        db = self._get_db()
+        user_ids = [
+            group["_id"]
+            async for group in db.wallets.aggregate([
+                {"$match": {"quantity": {"$gt": 0}}},
+                {"$group": {"_id": "$user_id"}},
+            ])
+        ]
+        return await record_users(db, user_ids, self._get_prices())
+
+    async def claim_revalue(self) -> bool:
+        """Take the lease for the current revalue period, if nobody has it yet."""
+        now = time.time()
+        # Periods are aligned to the clock, so all workers agree on them
+        lease_until = (now // self.revalue_interval + 1) * self.revalue_interval
+        try:
+            await self._get_db()[LEASE_COLLECTION].update_one(
+                {"id": REVALUE_LEASE, "lease_until": {"$lte": now}},
+                {"$set": {"lease_until": lease_until}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # Taken by another worker: the upsert ran into the unique id
+            return False
+        return True
+
+    async def revalue(self) -> int:
+        if not await self.claim_revalue():
+            return 0
+        return await self.revalue_all()
+
+    async def _every(self, interval: float, job: Callable):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Portfolio %s failed", job.__name__)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks.append(asyncio.create_task(self._every(self.flush_interval, self.flush)))
+        if self.revalue_interval > 0:
+            self._tasks.append(asyncio.create_task(self._every(self.revalue_interval, self.revalue)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.flush()
+
+async def rebuild(db, user_id: Optional[str] = None, batch_size: int = 1000) -> int:
+    """Replay ``db.transactions`` into a fresh series, one point per trade.
+
+    Replays one user at a time in (timestamp, id) order, which the
+    transactions index serves, so memory stays bounded by one user's
+    holdings plus one insert batch. Points are valued at the last traded
+    price of each asset.
+    """
+    query = {} if user_id is None else {"user_id": user_id}
+    await db[PORTFOLIO_COLLECTION].delete_many(query)
+    if user_id is not None:
+        user_ids = [user_id]
+    else:
+        user_ids = [
+            group["_id"]
+            async for group in db.transactions.aggregate([{"$group": {"_id": "$user_id"}}], allowDiskUse=True)
+        ]
+
+    points = []
+    written = 0
+    for current_user in user_ids:
+        cursor = db.transactions.find(
+            {"user_id": current_user},
+            {"_id": 0, "crypto_id": 1, "transaction_type": 1, "quantity": 1, "price_brl": 1, "timestamp": 1}
+        ).sort([("timestamp", 1), ("id", 1)]).batch_size(batch_size)
+        holdings: Dict[str, float] = {}
+        prices: Dict[str, float] = {}
+        async for transaction in cursor:
+            crypto_id = transaction["crypto_id"]
+            sign = 1 if transaction["transaction_type"] == "buy" else -1
+            holdings[crypto_id] = holdings.get(crypto_id, 0.0) + sign * transaction["quantity"]
+            prices[crypto_id] = transaction["price_brl"]
+            points.append(make_point(
+                current_user,
+                {crypto: quantity for crypto, quantity in holdings.items() if quantity > 0},
+                prices,
+                datetime.fromisoformat(transaction["timestamp"]),
+            ))
+            if len(points) >= batch_size:
+                await db[PORTFOLIO_COLLECTION].insert_many(points)
+                written += len(points)
+                points = []
+    if points:
+        await db[PORTFOLIO_COLLECTION].insert_many(points)
+        written += len(points)
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Portfolio valuation series maintenance")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subcommands.add_parser("rebuild", help="rebuild the series from the transaction log")
+    rebuild_parser.add_argument("--user-id", help="only rebuild this user")
+    rebuild_parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    # Imported here: server imports this module
+    from server import connect_db
+
+    db = connect_db()
+
+    async def run():
+        await ensure_series(db)
+        return await rebuild(db, args.user_id, args.batch_size)
+
+    print(f"{asyncio.run(run())} points written")
+
+if __name__ == "__main__":
+    main()
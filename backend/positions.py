@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+from typing import Optional
+
+from pymongo import UpdateOne
+
+# Materialized on each wallet document next to "quantity", average cost
+# method: buys add to the cost basis, sells take out their share of it at
+# the average cost and realize the difference to the sale price
+POSITION_DEFAULTS = {"cost_brl": 0.0, "realized_pnl_brl": 0.0, "buy_count": 0, "sell_count": 0}
+
+def position_field(name: str) -> dict:
+    # Wallets written before these fields existed count as zero
+    return {"$ifNull": [f"${name}", POSITION_DEFAULTS.get(name, 0.0)]}
+
+def buy_update(quantity: float, price: float) -> dict:
+    return {"$inc": {"quantity": quantity, "cost_brl": quantity * price, "buy_count": 1}}
+
+def trade_stage(transaction_type: str, quantity: float, price: float) -> dict:
+    """One pipeline-update ``$set`` stage applying a trade to a wallet.
+
+    Every expression in a stage reads the values from before it, so the
+    average cost a sell uses is computed and spent atomically.
+    """
+    if transaction_type == "buy":
+        return {"$set": {
+            "quantity": {"$add": [position_field("quantity"), quantity]},
+            "cost_brl": {"$add": [position_field("cost_brl"), quantity * price]},
+            "buy_count": {"$add": [position_field("buy_count"), 1]},
+        }}
+    average = {"$cond": [
+        {"$gt": [position_field("quantity"), 0]},
+        {"$divide": [position_field("cost_brl"), position_field("quantity")]},
+        0,
+    ]}
+    return {"$set": {
+        "quantity": {"$subtract": [position_field("quantity"), quantity]},
+        "cost_brl": {"$cond": [
+            {"$lte": [position_field("quantity"), quantity]}, 0.0,
+            {"$subtract": [position_field("cost_brl"), {"$multiply": [quantity, average]}]},
+        ]},
+        "realized_pnl_brl": {"$add": [
+            position_field("realized_pnl_brl"), {"$multiply": [quantity, {"$subtract": [price, average]}]},
+        ]},
+        "sell_count": {"$add": [position_field("sell_count"), 1]},
+    }}
+
+def apply_trade(position: dict, transaction_type: str, quantity: float, price: float) -> dict:
+    """Python twin of ``trade_stage``, used to replay the transaction log."""
+    if transaction_type == "buy":
+        position["quantity"] += quantity
+        position["cost_brl"] += quantity * price
+        position["buy_count"] += 1
+        return position
+    average = position["cost_brl"] / position["quantity"] if position["quantity"] > 0 else 0.0
+    position["cost_brl"] = 0.0 if position["quantity"] <= quantity else position["cost_brl"] - quantity * average
+    position["realized_pnl_brl"] += quantity * (price - average)
+    position["quantity"] -= quantity
+    position["sell_count"] += 1
+    return position
+
+def position_view(item: dict) -> dict:
+    """Average cost and unrealized P&L for a valued wallet item."""
+    quantity, cost = item["quantity"], item.get("cost_brl", 0.0)
+    item["avg_cost_brl"] = cost / quantity if quantity > 0 else 0.0
+    item["unrealized_pnl_brl"] = item["total_brl"] - cost
+    return item
+
+def new_position() -> dict:
+    return {"quantity": 0.0, **POSITION_DEFAULTS}
+
+async def recompute(db, user_id: Optional[str] = None, batch_size: int = 1000) -> int:
+    """Rebuild quantity and position fields of the wallets from the transaction log.
+
+    One sorted aggregation pass over ``db.transactions``; each (user, crypto)
+    run is folded with ``apply_trade`` and written back in bulk batches, so
+    memory stays bounded by one batch of positions. Overwrites the live
+    counters: run it while trading is paused.
+    """
+    pipeline = [
+        {"$sort": {"user_id": 1, "crypto_id": 1, "timestamp": 1, "id": 1}},
+        {"$project": {"_id": 0, "user_id": 1, "crypto_id": 1, "transaction_type": 1, "quantity": 1, "price_brl": 1}},
+    ]
+    if user_id is not None:
+        pipeline.insert(0, {"$match": {"user_id": user_id}})
+    updates = []
+    written = 0
+    current_key, position = None, None
+
+    async def flush():
+        nonlocal updates, written
+        if updates:
+            await db.wallets.bulk_write(updates, ordered=False)
+            written += len(updates)
+            updates = []
+
+    async for transaction in db.transactions.aggregate(pipeline, allowDiskUse=True):
+        key = (transaction["user_id"], transaction["crypto_id"])
+        if key != current_key:
+            if current_key is not None:
+                updates.append(position_update(current_key, position))
+                if len(updates) >= batch_size:
+                    await flush()
+            current_key, position = key, new_position()
+        apply_trade(position, transaction["transaction_type"], transaction["quantity"], transaction["price_brl"])
+    if current_key is not None:
+        updates.append(position_update(current_key, position))
+    await flush()
+    return written
+
+def position_update(key: tuple, position: dict) -> UpdateOne:
+    user_id, crypto_id = key
+    return UpdateOne({"user_id": user_id, "crypto_id": crypto_id}, {"$set": position}, upsert=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild wallet cost basis and P&L from the transaction log")
+    parser.add_argument("--user-id", help="only recompute this user")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    # Imported here: server imports this module
+    from server import connect_db
+
+    db = connect_db()
+    print(f"{asyncio.run(recompute(db, args.user_id, args.batch_size))} positions written")
+
+if __name__ == "__main__":
+    main()
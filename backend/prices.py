@@ -0,0 +1,161 @@
+import asyncio
+import importlib
+import json
+import logging
+import math
+import random
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = ("id", "name", "symbol", "price_brl", "icon")
+
+class PriceSnapshot:
+    """Immutable view of every price at one point in time.
+
+    The feed swaps whole snapshots, so a handler that grabs ``feed.snapshot``
+    once sees one consistent price version for the rest of the request.
+    """
+
+    __slots__ = ("version", "updated_at", "cryptos", "by_id")
+
+    def __init__(self, version: int, cryptos: List[dict], updated_at: Optional[float] = None):
+        self.version = version
+        self.updated_at = time.time() if updated_at is None else updated_at
+        self.cryptos: Tuple[dict, ...] = tuple(dict(crypto) for crypto in cryptos)
+        self.by_id: Dict[str, dict] = {crypto["id"]: crypto for crypto in self.cryptos}
+
+    def get(self, crypto_id: str) -> Optional[dict]:
+        return self.by_id.get(crypto_id)
+
+    def age(self) -> float:
+        return time.time() - self.updated_at
+
+def validate_prices(cryptos: List[dict]) -> List[dict]:
+    if not cryptos:
+        raise ValueError("price provider returned no cryptos")
+    for crypto in cryptos:
+        missing = [field for field in REQUIRED_FIELDS if field not in crypto]
+        if missing:
+            raise ValueError(f"crypto {crypto.get('id')!r} is missing {missing}")
+        if not isinstance(crypto["price_brl"], (int, float)) or not crypto["price_brl"] > 0:
+            raise ValueError(f"crypto {crypto['id']!r} has invalid price {crypto['price_brl']!r}")
+    return cryptos
+
+# Providers: anything with an ``async fetch() -> List[dict]`` works
+class StaticPriceProvider:
+    def __init__(self, cryptos: List[dict]):
+        self._cryptos = [dict(crypto) for crypto in cryptos]
+
+    async def fetch(self) -> List[dict]:
+        return self._cryptos
+
+class FilePriceProvider:
+    """Reads a JSON list shaped like ``CRYPTO_DATA``; re-read on every fetch."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    async def fetch(self) -> List[dict]:
+        text = await asyncio.to_thread(self.path.read_text, encoding="utf-8")
+        return json.loads(text)
+
+class RandomWalkPriceProvider:
+    """Simulated market: each fetch moves every price by a log-normal step."""
+
+    def __init__(self, cryptos: List[dict], volatility: float = 0.01, seed: Optional[int] = None):
+        self._cryptos = [dict(crypto) for crypto in cryptos]
+        self.volatility = volatility
+        self._random = random.Random(seed)
+
+    async def fetch(self) -> List[dict]:
+        for crypto in self._cryptos:
+            step = math.exp(self._random.gauss(0, self.volatility))
+            crypto["price_brl"] = max(0.01, round(crypto["price_brl"] * step, 2))
+        return [dict(crypto) for crypto in self._cryptos]
+
+def build_provider(name: str, cryptos: List[dict], path: Optional[str] = None, volatility: float = 0.01):
+    if name == "static":
+        return StaticPriceProvider(cryptos)
+    if name == "file":
+        if not path:
+            raise ValueError("PRICE_FILE is required for the file price provider")
+        return FilePriceProvider(path)
+    if name == "random":
+        return RandomWalkPriceProvider(cryptos, volatility=volatility)
+    if ":" in name:
+        # "package.module:ProviderClass" for out-of-tree providers
+        module_name, class_name = name.split(":", 1)
+        return getattr(importlib.import_module(module_name), class_name)()
+    raise ValueError(f"unknown price provider {name!r}")
+
+class PriceFeed:
+    """Polls a provider in a background task and publishes snapshots.
+
+    Readers never lock: ``snapshot`` is replaced by a single attribute
+    assignment. ``max_age=None`` disables staleness tracking.
+    """
+
+    def __init__(self, provider, initial: List[dict], interval: float = 5.0, max_age: Optional[float] = None):
+        self.provider = provider
+        self.interval = interval
+        self.max_age = max_age
+        self.snapshot = PriceSnapshot(1, validate_prices(initial))
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        # Called with the new snapshot whenever the price version changes
+        self.listeners: List[Callable[[PriceSnapshot], None]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_stale(self) -> bool:
+        return self.max_age is not None and self.snapshot.age() > self.max_age
+
+    async def refresh(self) -> PriceSnapshot:
+        cryptos = validate_prices(await self.provider.fetch())
+        current = self.snapshot
+        # Unchanged prices only refresh the timestamp, so the version moves
+        # exactly when the data does
+        version = current.version if list(current.cryptos) == cryptos else current.version + 1
+        self.snapshot = PriceSnapshot(version, cryptos)
+        if version != current.version:
+            for listener in self.listeners:
+                listener(self.snapshot)
+        return self.snapshot
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep serving the last good snapshot; staleness reports it
+                self.errors += 1
+                self.last_error = str(e)
+                logger.warning("Price refresh failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "version": self.snapshot.version,
+            "age_seconds": round(self.snapshot.age(), 3),
+            "stale": self.is_stale,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
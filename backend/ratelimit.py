@@ -0,0 +1,165 @@
+import importlib
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from sharedcache import build_backend
+
+logger = logging.getLogger(__name__)
+
+class RateLimited(Exception):
+    def __init__(self, rule: str, retry_after: float):
+        super().__init__(rule)
+        self.rule = rule
+        self.retry_after = retry_after
+
+def parse_rate(spec: str) -> Optional[Tuple[float, float]]:
+    """``"10/60"`` -> (capacity 10, refill 10/60 tokens per second); "0" or "" disables."""
+    if not spec or spec.strip() == "0":
+        return None
+    count, seconds = spec.split("/", 1)
+    capacity, period = float(count), float(seconds)
+    if capacity <= 0 or period <= 0:
+        raise ValueError(f"invalid rate {spec!r}")
+    return capacity, capacity / period
+
+class MemoryBucketStore:
+    """Token buckets in a bounded in-process LRU.
+
+    Per worker: with several workers each one grants its own burst, so a
+    shared store is needed for exact limits. An evicted bucket comes back
+    full, which only ever errs on the permissive side.
+    """
+
+    def __init__(self, maxsize: int = 100_000, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.evictions = 0
+
+    async def take(self, key: str, capacity: float, refill_rate: float, cost: float = 1.0) -> float:
+        """Spend ``cost`` tokens; returns 0 if allowed, else seconds until it would be."""
+        now = self.clock()
+        tokens, updated = self._buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill_rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / refill_rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+            self.evictions += 1
+        return wait
+
+    def clear(self):
+        self._buckets.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._buckets), "maxsize": self.maxsize, "evictions": self.evictions}
+
+# KEYS[1] = bucket; ARGV = capacity, refill rate, cost. State is
+# "tokens updated" with Redis' own clock, so workers on different hosts
+# agree; the wait goes back as a string, Lua numbers would be truncated
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local tokens, updated = capacity, now
+local state = redis.call('GET', KEYS[1])
+if state then
+  local space = string.find(state, ' ')
+  tokens = tonumber(string.sub(state, 1, space - 1))
+  updated = tonumber(string.sub(state, space + 1))
+end
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= cost then
+  tokens = tokens - cost
+else
+  wait = (cost - tokens) / rate
+end
+redis.call('SET', KEYS[1], string.format('%.6f %.6f', tokens, now), 'PX', math.ceil(capacity / rate * 1000))
+return string.format('%.6f', wait)
+"""
+
+class RedisBucketStore:
+    """Token buckets in Redis, shared by every worker.
+
+    Each take is one script run, so concurrent workers never spend the
+    same token. A bucket expires once it would be full again. If Redis is
+    unreachable requests are let through (and counted in ``errors``):
+    throttling must not take logins down with it.
+    """
+
+    def __init__(self, backend, prefix: str = "ratelimit"):
+        self.backend = backend
+        self.prefix = prefix
+        self._take = backend.register_script(TAKE_SCRIPT)
+        self.errors = 0
+
+    async def take(self, key: str, capacity: float, refill_rate: float, cost: float = 1.0) -> float:
+        try:
+            wait = await self._take(keys=[f"{self.prefix}:{key}"], args=[capacity, refill_rate, cost])
+        except Exception:
+            logger.exception("Rate limit store unavailable")
+            self.errors += 1
+            return 0.0
+        return float(wait)
+
+    def clear(self):
+        # Buckets are shared; they expire on their own
+        pass
+
+    def stats(self) -> dict:
+        return {"errors": self.errors}
+
+def build_store(name: str, maxsize: int = 100_000):
+    if name == "memory":
+        return MemoryBucketStore(maxsize=maxsize)
+    if name.split("://", 1)[0] in ("redis", "rediss", "unix"):
+        return RedisBucketStore(build_backend(name))
+    if ":" in name:
+        # "package.module:StoreClass" for a store shared between workers;
+        # it must provide the same async take() as MemoryBucketStore
+        module_name, class_name = name.split(":", 1)
+        return getattr(importlib.import_module(module_name), class_name)()
+    raise ValueError(f"unknown rate limit backend {name!r}")
+
+class RateLimiter:
+    """Named token-bucket rules (``"login_ip": "20/60"``) over one store."""
+
+    def __init__(self, store, rules: Dict[str, str], enabled: bool = True):
+        self.store = store
+        self.rules = {name: parse_rate(spec) for name, spec in rules.items()}
+        self.enabled = enabled
+        self.allowed = 0
+        self.limited = 0
+
+    async def hit(self, rule: str, key: str):
+        """Raises ``RateLimited`` once ``key`` has used up its bucket for ``rule``."""
+        rate = self.rules.get(rule)
+        if not self.enabled or rate is None:
+            return
+        wait = await self.store.take(f"{rule}:{key}", *rate)
+        if wait > 0:
+            self.limited += 1
+            raise RateLimited(rule, wait)
+        self.allowed += 1
+
+    def reset(self):
+        self.store.clear()
+
+    def stats(self) -> dict:
+        stats = {"enabled": self.enabled, "allowed": self.allowed, "limited": self.limited}
+        if hasattr(self.store, "stats"):
+            stats.update(self.store.stats())
+        return stats
+
+def retry_after_header(retry_after: float) -> str:
+    return str(max(1, math.ceil(retry_after)))
@@ -0,0 +1,73 @@
+"""Production entry point: N uvicorn workers, each with its own Mongo pool.
+
+``MONGO_TOTAL_POOL_SIZE`` (or ``--total-pool-size``) is the connection
+budget for the whole deployment; it is split evenly into each worker's
+``MONGO_MAX_POOL_SIZE`` so adding workers does not multiply connections.
+
+With ``TRANSACTION_JOURNAL`` and ``JOURNAL_STARTUP_CHECK`` set, wallets are
+checked against the transaction log once, here, before any worker starts.
+
+    python run.py --workers 4 --port 8001
+"""
+import argparse
+import asyncio
+import os
+
+import uvicorn
+
+def ensure_signing_key():
+    # Generated here rather than by each worker, so an empty JWT_KEYS_DIR
+    # ends up with one key instead of one per worker start second
+    from server import key_ring
+
+    key_ring.load()
+
+def check_journal():
+    # Imported here: only needed for the opt-in check
+    from journal import check
+    from server import close_db, connect_db
+
+    try:
+        mismatches = asyncio.run(check(connect_db()))
+    finally:
+        close_db()
+    if mismatches:
+        print(f"{len(mismatches)} wallet positions disagree with the transaction log; "
+              "run python -m journal --repair")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8001")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--total-pool-size", type=int, default=int(os.environ.get("MONGO_TOTAL_POOL_SIZE", "0")))
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "info"))
+    # Proxies whose X-Forwarded-For is trusted: the per-IP auth limits key on
+    # the client address it yields, so list the load balancer's address here
+    parser.add_argument("--forwarded-allow-ips", default=os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1"))
+    args = parser.parse_args()
+
+    if args.total_pool_size:
+        # Workers are spawned with this environment
+        os.environ["MONGO_MAX_POOL_SIZE"] = str(max(1, args.total_pool_size // args.workers))
+        os.environ.setdefault("MONGO_MIN_POOL_SIZE", str(min(4, int(os.environ["MONGO_MAX_POOL_SIZE"]))))
+
+    ensure_signing_key()
+    journal_enabled = os.environ.get("TRANSACTION_JOURNAL", "false").lower() == "true"
+    if journal_enabled and os.environ.get("JOURNAL_STARTUP_CHECK", "false").lower() == "true":
+        # Before the workers: no trades or purges in flight to misreport
+        check_journal()
+
+    uvicorn.run(
+        "server:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=args.log_level,
+        proxy_headers=True,
+        forwarded_allow_ips=args.forwarded_allow_ips,
+    )
+
+if __name__ == "__main__":
+    main()
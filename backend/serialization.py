@@ -0,0 +1,65 @@
+import hashlib
+from typing import Any, Callable, Hashable, Iterable, Optional, Tuple, Type
+
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+def row_projector(model: Type[BaseModel]) -> Callable[[dict], dict]:
+    """Map a trusted document straight to ``model``'s output shape.
+
+    Keeps the model's field order and casts ``float`` fields (Mongo may hand
+    back ints), so the JSON matches what ``response_model`` would produce,
+    without building and re-validating one model per row.
+    """
+    fields = [(name, field.annotation is float) for name, field in model.model_fields.items()]
+
+    def project(document: dict) -> dict:
+        return {name: float(document[name]) if is_float else document[name] for name, is_float in fields}
+
+    return project
+
+def fast_json(rows: Iterable[dict], headers: Optional[dict] = None) -> ORJSONResponse:
+    """Return ``rows`` as-is; FastAPI skips ``response_model`` for Response objects."""
+    return ORJSONResponse(list(rows), headers=headers)
+
+def etag_for(body: bytes) -> str:
+    # Content hash, so every worker hands out the same tag for the same data
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+class CachedPayload:
+    """Serialized body and ETag, rebuilt only when the source changes.
+
+    Meant for immutable sources replaced wholesale (price snapshots). By
+    default any new source object triggers a rebuild; ``key`` names what
+    actually identifies the data (the snapshot version), for sources that
+    are replaced without their data changing.
+    """
+
+    def __init__(self, render: Callable[[Any], bytes], key: Optional[Callable[[Any], Hashable]] = None):
+        self._render = render
+        self._key = key
+        self._source = None
+        self._cached: Tuple[bytes, str] = (b"", "")
+        self.builds = 0
+
+    def _changed(self, source) -> bool:
+        if self._key is None or self._source is None:
+            return source is not self._source
+        return self._key(source) != self._key(self._source)
+
+    def get(self, source) -> Tuple[bytes, str]:
+        if self._changed(source):
+            body = self._render(source)
+            self._cached = (body, etag_for(body))
+            self.builds += 1
+        # Only the latest source is held, so replaced snapshots can be freed
+        self._source = source
+        return self._cached
@@ -1,42 +1,152 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 import os
+import asyncio
+import base64
+import json
 import logging
+import time
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from typing import Awaitable, Callable, Dict, List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
-from passlib.context import CryptContext
 import jwt
+import orjson
+
+from broadcast import Broadcaster, UserRelay
+from cache import TTLCache
+from compression import CompressionMiddleware
+from deletion import DELETION_COLLECTION, AccountPurger
+from exports import EXPORT_COLLECTION, EXPORT_FORMATS, ExportInProgress, ExportJobs, export_query, iter_csv
+from hashing import HashingBusyError, PasswordHasher
+from idempotency import (
+    IDEMPOTENCY_COLLECTION, INTERRUPTED_RESPONSE, MAX_KEY_LENGTH, IdempotencyConflict, IdempotencyInProgress,
+    IdempotencyLedger, request_fingerprint,
+)
+from journal import TransactionJournal
+from metrics import (
+    AUTH_LATENCY, HASH_LATENCY, REGISTRY, MetricsMiddleware, MongoCommandTimer, StatsCollector, render_metrics,
+)
+from portfolio import (
+    HISTORY_RANGES, LEASE_COLLECTION, PORTFOLIO_COLLECTION, PortfolioRecorder, ensure_series, history_pipeline,
+)
+from positions import POSITION_DEFAULTS, buy_update, position_field, position_view, trade_stage
+from prices import PriceFeed, PriceSnapshot, build_provider
+from ratelimit import RateLimited, RateLimiter, build_store, retry_after_header
+from serialization import CachedPayload, etag_matches, fast_json, row_projector
+from settings import Settings
+from sharedcache import ReadThroughCache, build_backend
+from tokens import ACCESS, REFRESH, REVOCATION_COLLECTION, KeyRing, Revocations
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection: one client (and pool) per worker process, created at
+# startup from the app's Settings; nothing connects at import time
+client: Optional[AsyncIOMotorClient] = None
+db = None
+# (mongo_url, db_name, injected client) of the open connection
+connected_to: Optional[tuple] = None
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def database_key(settings: Settings) -> tuple:
+    return settings.mongo_url, settings.db_name, None if settings.client is None else id(settings.client)
 
-# JWT settings
-SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
+def connect_db(settings: Optional[Settings] = None):
+    """The process's database. Without ``settings`` an open connection is
+    reused as is; with them it must be the same database, since every
+    module global (caches, background jobs) works on that one ``db``."""
+    global client, db, connected_to
+    if client is not None:
+        if settings is not None and database_key(settings) != connected_to:
+            raise RuntimeError(
+                f"already connected to database {connected_to[1]!r}; close_db() before connecting elsewhere"
+            )
+        return db
+    settings = settings or Settings.from_env()
+    if not settings.db_name:
+        raise RuntimeError("DB_NAME is not set")
+    if settings.client is not None:
+        client = settings.client
+    elif settings.mongo_url:
+        client = AsyncIOMotorClient(
+            settings.mongo_url, event_listeners=[MongoCommandTimer()], **settings.client_options
+        )
+    else:
+        raise RuntimeError("MONGO_URL is not set")
+    db = client[settings.db_name]
+    connected_to = database_key(settings)
+    return db
+
+def close_db():
+    global client, db, connected_to
+    if client is not None:
+        client.close()
+    client = None
+    db = None
+    connected_to = None
+
+# Password hashing (bcrypt runs on a bounded pool, off the event loop)
+password_hasher = PasswordHasher(
+    max_workers=int(os.environ.get('HASH_WORKERS', '4')),
+    max_pending=int(os.environ.get('HASH_QUEUE_LIMIT', '64')),
+    kind=os.environ.get('HASH_EXECUTOR', 'thread'),
+)
+
+# Throttling for the bcrypt-backed auth routes: token buckets per client IP
+# and per email, "count/seconds" each ("0" disables a rule). "memory" keeps
+# the buckets per worker, so with N workers each limit is N times looser;
+# a redis:// URL shares them
+rate_limiter = RateLimiter(
+    build_store(
+        os.environ.get('RATE_LIMIT_BACKEND', 'memory'),
+        maxsize=int(os.environ.get('RATE_LIMIT_SIZE', '100000')),
+    ),
+    {
+        "login_ip": os.environ.get('RATE_LIMIT_LOGIN_IP', '20/60'),
+        "login_email": os.environ.get('RATE_LIMIT_LOGIN_EMAIL', '5/60'),
+        "register_ip": os.environ.get('RATE_LIMIT_REGISTER_IP', '10/600'),
+        "register_email": os.environ.get('RATE_LIMIT_REGISTER_EMAIL', '3/600'),
+    },
+    enabled=os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+)
+
+# JWT settings: asymmetric keys from JWT_KEYS_DIR, rotated by kid;
+# short-lived access tokens are renewed with a one-time refresh token
+key_ring = KeyRing(
+    os.environ.get('JWT_KEYS_DIR', str(ROOT_DIR / 'keys')),
+    active_kid=os.environ.get('JWT_ACTIVE_KID') or None,
+    algorithm=os.environ.get('JWT_ALGORITHM', 'EdDSA'),
+)
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRE_MINUTES', '15'))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get('REFRESH_TOKEN_EXPIRE_DAYS', '7'))
+JWKS_MAX_AGE = int(os.environ.get('JWKS_MAX_AGE', '300'))
+revocations = Revocations(
+    lambda: db,
+    ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    capacity=int(os.environ.get('REVOCATION_BLOOM_CAPACITY', '100000')),
+    sync_interval=float(os.environ.get('REVOCATION_SYNC_SECONDS', '5')),
+)
 
 # Security
 security = HTTPBearer()
 
-# Create the main app without a prefix
-app = FastAPI()
+# Per-process caches for get_current_user: token -> claims, user id -> user
+AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', '30'))
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '10000'))
+token_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+user_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
 
-# Create a router with the /api prefix
+# Create a router with the /api prefix; the app itself comes from create_app
 api_router = APIRouter(prefix="/api")
+# Routes outside /api
+root_router = APIRouter()
 
 # Models
 class UserRegister(BaseModel):
@@ -61,9 +171,17 @@ class User(BaseModel):
 
 class Token(BaseModel):
     access_token: str
+    refresh_token: str
     token_type: str
+    expires_in: int
     user: User
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
 class Crypto(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str
@@ -80,6 +198,12 @@ class WalletItem(BaseModel):
     quantity: float
     price_brl: float
     total_brl: float
+    cost_brl: float = 0.0
+    avg_cost_brl: float = 0.0
+    realized_pnl_brl: float = 0.0
+    unrealized_pnl_brl: float = 0.0
+    buy_count: int = 0
+    sell_count: int = 0
 
 class TransactionCreate(BaseModel):
     crypto_id: str
@@ -99,7 +223,60 @@ class Transaction(BaseModel):
     total_brl: float
     timestamp: str
 
-# Crypto data (fixed prices)
+class PortfolioPoint(BaseModel):
+    timestamp: str
+    total_brl: float
+    holdings: Dict[str, float]
+
+class DeletionJob(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    status: str  # 'pending', 'running' or 'done'
+    deleted: Dict[str, int]
+    created_at: str
+    finished_at: Optional[str] = None
+
+class ExportRequest(BaseModel):
+    format: str = "csv"  # 'csv' or 'parquet'
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    crypto_id: Optional[str] = None
+
+class ExportJob(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    format: str
+    status: str  # 'pending', 'running', 'done' or 'failed'
+    rows: int
+    error: Optional[str] = None
+    created_at: str
+    expires_at: str
+
+BATCH_MAX_ORDERS = int(os.environ.get('BATCH_MAX_ORDERS', '100'))
+
+class BatchTradeRequest(BaseModel):
+    orders: List[TransactionCreate] = Field(..., min_length=1, max_length=BATCH_MAX_ORDERS)
+    all_or_nothing: bool = False
+
+class BatchOrderResult(BaseModel):
+    index: int
+    status: str  # 'ok', 'error' or 'aborted'
+    detail: Optional[str] = None
+    transaction: Optional[Transaction] = None
+
+class BatchTradeResponse(BaseModel):
+    results: List[BatchOrderResult]
+    executed: int
+    failed: int
+
+# List endpoints return documents projected straight to these shapes;
+# the models stay as response_model for validation-free docs and OpenAPI
+crypto_row = row_projector(Crypto)
+wallet_row = row_projector(WalletItem)
+transaction_row = row_projector(Transaction)
+portfolio_row = row_projector(PortfolioPoint)
+
+# Crypto catalog; also the initial price snapshot and the static provider's data
 CRYPTO_DATA = [
     {"id": "btc", "name": "Bitcoin", "symbol": "BTC", "price_brl": 350000.00, "icon": "₿"},
     {"id": "eth", "name": "Ethereum", "symbol": "ETH", "price_brl": 18500.00, "icon": "Ξ"},
@@ -108,42 +285,224 @@ CRYPTO_DATA = [
     {"id": "sol", "name": "Solana", "symbol": "SOL", "price_brl": 650.00, "icon": "SOL"},
 ]
 
+# Live prices: a background task refreshes the snapshot from the provider
+PRICE_PROVIDER = os.environ.get('PRICE_PROVIDER', 'static')
+price_feed = PriceFeed(
+    build_provider(
+        PRICE_PROVIDER,
+        CRYPTO_DATA,
+        path=os.environ.get('PRICE_FILE'),
+        volatility=float(os.environ.get('PRICE_VOLATILITY', '0.01')),
+    ),
+    initial=CRYPTO_DATA,
+    interval=float(os.environ.get('PRICE_REFRESH_SECONDS', '5')),
+    max_age=None if PRICE_PROVIDER == 'static' else float(os.environ.get('PRICE_MAX_AGE', '60')),
+)
+
+# Server push: one broadcaster fans price ticks and balance updates out to
+# every WebSocket connection of this process. Balance updates go through
+# stream_relay: with STREAM_BROKER_URL unset they only reach sockets on the
+# worker that ran the trade, so run a single worker or point every worker
+# at the same redis:// broker. Price ticks stay per worker on purpose: each
+# socket gets the snapshot its own worker quotes and trades against.
+broadcaster = Broadcaster(max_pending=int(os.environ.get('STREAM_MAX_PENDING', '16')))
+stream_relay = UserRelay(broadcaster, build_backend(os.environ.get('STREAM_BROKER_URL', '')))
+
+def stream_stats() -> dict:
+    return {**broadcaster.stats(), **stream_relay.stats()}
+
+def prices_message(prices: PriceSnapshot) -> dict:
+    return {"type": "prices", "version": prices.version, "cryptos": list(prices.cryptos)}
+
+price_feed.listeners.append(lambda prices: broadcaster.publish("prices", prices_message(prices)))
+
+# Portfolio valuation series, written in the background after trades
+portfolio_recorder = PortfolioRecorder(
+    lambda: db,
+    lambda: price_feed.snapshot,
+    flush_interval=float(os.environ.get('PORTFOLIO_FLUSH_SECONDS', '5')),
+    revalue_interval=float(os.environ.get('PORTFOLIO_REVALUE_SECONDS', '3600')),
+)
+
+# Ledger exports: large ones are written to files by background jobs
+export_jobs = ExportJobs(
+    lambda: db,
+    os.environ.get('EXPORT_DIR', str(ROOT_DIR / 'exports')),
+    retention=float(os.environ.get('EXPORT_RETENTION_HOURS', '24')) * 3600,
+    batch_size=int(os.environ.get('EXPORT_BATCH_SIZE', '5000')),
+    sweep_interval=float(os.environ.get('EXPORT_SWEEP_SECONDS', '30')),
+)
+
+# Account deletion: the user is tombstoned in the request, the data is
+# purged in batches by a background job
+async def purge_portfolio(user_id: str):
+    # Time-series collections only delete by metaField, so not by _id batches
+    await db[PORTFOLIO_COLLECTION].delete_many({"user_id": user_id})
+
+account_purger = AccountPurger(
+    lambda: db,
+    ["transactions", "wallets", IDEMPOTENCY_COLLECTION],
+    hooks=[export_jobs.delete_user, purge_portfolio],
+    batch_size=int(os.environ.get('DELETION_BATCH_SIZE', '1000')),
+    sweep_interval=float(os.environ.get('DELETION_SWEEP_SECONDS', '30')),
+)
+
+# Tombstoned users keep their document until the purge ends
+ACTIVE_USER = {"deleted_at": {"$exists": False}}
+
+# Trade requests carrying an Idempotency-Key run once; retries get the
+# stored response
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600)))
+idempotency_ledger = IdempotencyLedger(
+    lambda: db,
+    wait=float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', '10')),
+    lease=float(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '60')),
+)
+
+# Wallet holdings, shared by all workers when WALLET_CACHE_URL is a redis://
+# URL ("memory": this process only; unset: off). Trades and account
+# deletion invalidate; entries otherwise expire after WALLET_CACHE_TTL
+wallet_cache = ReadThroughCache(
+    build_backend(os.environ.get('WALLET_CACHE_URL', '')),
+    "wallet",
+    ttl=float(os.environ.get('WALLET_CACHE_TTL', '30')),
+)
+
+# Optional write-behind for single-trade records: grouped into one
+# insert_many per JOURNAL_MAX_DELAY_MS / JOURNAL_MAX_BATCH
+TRANSACTION_JOURNAL = os.environ.get('TRANSACTION_JOURNAL', 'false').lower() == 'true'
+transaction_journal = TransactionJournal(
+    lambda: db,
+    max_batch=int(os.environ.get('JOURNAL_MAX_BATCH', '500')),
+    max_delay=float(os.environ.get('JOURNAL_MAX_DELAY_MS', '5')) / 1000,
+) if TRANSACTION_JOURNAL else None
+
 # Helper functions
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+def hashing_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Servidor ocupado, tente novamente",
+        headers={"Retry-After": "1"},
+    )
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def throttle(rule: str, key: str):
+    try:
+        await rate_limiter.hit(rule, key)
+    except RateLimited as exc:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Muitas tentativas, tente novamente mais tarde",
+            headers={"Retry-After": retry_after_header(exc.retry_after)},
+        )
 
-def create_access_token(data: dict) -> str:
-    to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+def client_ip(request: Request) -> str:
+    # The proxy's address unless run.py trusts it (FORWARDED_ALLOW_IPS), in
+    # which case uvicorn has already replaced it with X-Forwarded-For
+    return request.client.host if request.client else "unknown"
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+async def get_password_hash(password: str) -> str:
+    try:
+        with HASH_LATENCY.labels("hash").time():
+            return await password_hasher.hash(password)
+    except HashingBusyError:
+        raise hashing_busy()
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        with HASH_LATENCY.labels("verify").time():
+            return await password_hasher.verify(plain_password, hashed_password)
+    except HashingBusyError:
+        raise hashing_busy()
+
+def create_token(user_id: str, token_type: str, lifetime: timedelta) -> str:
+    # Fractional iat, so a user revocation never catches a token issued
+    # later in the same second
+    issued_at = time.time()
+    return key_ring.encode({
+        "sub": user_id,
+        "typ": token_type,
+        "jti": uuid.uuid4().hex,
+        "iat": issued_at,
+        "exp": int(issued_at + lifetime.total_seconds()),
+    })
+
+def create_access_token(user_id: str) -> str:
+    return create_token(user_id, ACCESS, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+def issue_tokens(user: dict) -> Token:
+    return Token(
+        access_token=create_access_token(user["id"]),
+        refresh_token=create_token(user["id"], REFRESH, timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)),
+        token_type="bearer",
+        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        user=User(**user),
+    )
+
+def verify_token(token: str, token_type: str) -> dict:
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Token inválido")
+        return key_ring.decode(token, token_type)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expirado")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Token inválido")
-    
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "hashed_password": 0})
+
+def decode_token(token: str) -> dict:
+    start = time.perf_counter()
+    claims = token_cache.get(token)
+    if claims is not None:
+        AUTH_LATENCY.labels("token", "cache").observe(time.perf_counter() - start)
+        return claims
+    claims = verify_token(token, ACCESS)
+    # Never keep a token cached past its own expiry
+    token_cache.set(token, claims, ttl=claims["exp"] - time.time())
+    AUTH_LATENCY.labels("token", "jwt").observe(time.perf_counter() - start)
+    return claims
+
+async def check_revoked(claims: dict):
+    # The bloom filter clears almost every token without a query
+    if not revocations.maybe_revoked(claims["jti"], claims["sub"]):
+        return
+    start = time.perf_counter()
+    revoked = await revocations.is_revoked(claims["jti"], claims["sub"], claims["iat"])
+    AUTH_LATENCY.labels("revocation", "db").observe(time.perf_counter() - start)
+    if revoked:
+        raise HTTPException(status_code=401, detail="Token revogado")
+
+def invalidate_user(user_id: str):
+    user_cache.pop(user_id)
+
+async def authenticate(token: str) -> dict:
+    claims = decode_token(token)
+    await check_revoked(claims)
+    user_id = claims["sub"]
+    start = time.perf_counter()
+    user = user_cache.get(user_id)
     if user is None:
-        raise HTTPException(status_code=401, detail="Usuário não encontrado")
-    return user
+        user = await db.users.find_one({"id": user_id, **ACTIVE_USER}, {"_id": 0, "hashed_password": 0})
+        AUTH_LATENCY.labels("user", "db").observe(time.perf_counter() - start)
+        if user is None:
+            raise HTTPException(status_code=401, detail="Usuário não encontrado")
+        user_cache.set(user_id, user)
+    else:
+        AUTH_LATENCY.labels("user", "cache").observe(time.perf_counter() - start)
+    return dict(user)
 
-def get_crypto_by_id(crypto_id: str) -> Optional[dict]:
-    for crypto in CRYPTO_DATA:
-        if crypto["id"] == crypto_id:
-            return crypto
-    return None
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    return await authenticate(credentials.credentials)
+
+async def get_token_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    claims = decode_token(credentials.credentials)
+    await check_revoked(claims)
+    return claims
+
+def get_crypto_by_id(crypto_id: str, prices: Optional[PriceSnapshot] = None) -> Optional[dict]:
+    return (prices or price_feed.snapshot).get(crypto_id)
+
+def get_trade_prices() -> PriceSnapshot:
+    # Trades must not execute against a snapshot the feed stopped refreshing
+    if price_feed.is_stale:
+        raise HTTPException(status_code=503, detail="Cotações indisponíveis, tente novamente")
+    return price_feed.snapshot
 
 # Routes
 @api_router.get("/")
@@ -152,7 +511,9 @@ async def root():
 
 # Auth routes
 @api_router.post("/auth/register", response_model=Token)
-async def register(user_data: UserRegister):
+async def register(user_data: UserRegister, request: Request):
+    await throttle("register_ip", client_ip(request))
+    await throttle("register_email", user_data.email.lower())
     # Check if user exists
     existing_user = await db.users.find_one({"email": user_data.email})
     if existing_user:
@@ -160,7 +521,7 @@ async def register(user_data: UserRegister):
     
     # Create user
     user_id = str(uuid.uuid4())
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash(user_data.password)
     user_doc = {
         "id": user_id,
         "name": user_data.name,
@@ -168,32 +529,48 @@ async def register(user_data: UserRegister):
         "hashed_password": hashed_password,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    await db.users.insert_one(user_doc)
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        # Concurrent registration with the same email lost to the unique index
+        raise HTTPException(status_code=400, detail="Email já cadastrado")
     
-    # Create token
-    access_token = create_access_token(data={"sub": user_id})
-    user = User(
-        id=user_id,
-        name=user_data.name,
-        email=user_data.email,
-        created_at=user_doc["created_at"]
-    )
-    return Token(access_token=access_token, token_type="bearer", user=user)
+    # Create tokens
+    return issue_tokens(user_doc)
 
 @api_router.post("/auth/login", response_model=Token)
-async def login(credentials: UserLogin):
-    user = await db.users.find_one({"email": credentials.email})
-    if not user or not verify_password(credentials.password, user["hashed_password"]):
+async def login(credentials: UserLogin, request: Request):
+    # Both buckets are spent before any bcrypt work
+    await throttle("login_ip", client_ip(request))
+    await throttle("login_email", credentials.email.lower())
+    user = await db.users.find_one({"email": credentials.email, **ACTIVE_USER})
+    if not user or not await verify_password(credentials.password, user["hashed_password"]):
         raise HTTPException(status_code=401, detail="Email ou senha incorretos")
     
-    access_token = create_access_token(data={"sub": user["id"]})
-    user_data = User(
-        id=user["id"],
-        name=user["name"],
-        email=user["email"],
-        created_at=user["created_at"]
-    )
-    return Token(access_token=access_token, token_type="bearer", user=user_data)
+    return issue_tokens(user)
+
+@api_router.post("/auth/refresh", response_model=Token)
+async def refresh_tokens(payload: RefreshRequest):
+    claims = verify_token(payload.refresh_token, REFRESH)
+    # Exact check: refresh is rare enough to skip the filter
+    if await revocations.is_revoked(claims["jti"], claims["sub"], claims["iat"]):
+        raise HTTPException(status_code=401, detail="Token revogado")
+    user = await db.users.find_one({"id": claims["sub"], **ACTIVE_USER}, {"_id": 0, "hashed_password": 0})
+    if user is None:
+        raise HTTPException(status_code=401, detail="Usuário não encontrado")
+    # One use per refresh token: of two concurrent refreshes only one wins
+    if not await revocations.revoke_token(claims):
+        raise HTTPException(status_code=401, detail="Token revogado")
+    return issue_tokens(user)
+
+@api_router.post("/auth/logout")
+async def logout(payload: Optional[LogoutRequest] = None, claims: dict = Depends(get_token_claims)):
+    await revocations.revoke_token(claims)
+    if payload is not None and payload.refresh_token:
+        refresh = verify_token(payload.refresh_token, REFRESH)
+        if refresh["sub"] == claims["sub"]:
+            await revocations.revoke_token(refresh)
+    return {"message": "Logout realizado com sucesso"}
 
 @api_router.get("/auth/me", response_model=User)
 async def get_me(current_user: dict = Depends(get_current_user)):
@@ -205,170 +582,896 @@ async def update_user(update_data: UserUpdate, current_user: dict = Depends(get_
     if update_data.name:
         update_dict["name"] = update_data.name
     if update_data.password:
-        update_dict["hashed_password"] = get_password_hash(update_data.password)
+        update_dict["hashed_password"] = await get_password_hash(update_data.password)
     
     if update_dict:
         await db.users.update_one({"id": current_user["id"]}, {"$set": update_dict})
+        invalidate_user(current_user["id"])
     
     updated_user = await db.users.find_one({"id": current_user["id"]}, {"_id": 0, "hashed_password": 0})
     return User(**updated_user)
 
 @api_router.delete("/auth/delete")
 async def delete_account(current_user: dict = Depends(get_current_user)):
-    # Delete user transactions
-    await db.transactions.delete_many({"user_id": current_user["id"]})
-    # Delete user wallet
-    await db.wallets.delete_many({"user_id": current_user["id"]})
-    # Delete user
-    await db.users.delete_one({"id": current_user["id"]})
-    return {"message": "Conta deletada com sucesso"}
-
-# Crypto routes
+    # Tombstone first: from here on the account cannot log in or authenticate
+    result = await db.users.update_one(
+        {"id": current_user["id"], **ACTIVE_USER},
+        {"$set": {"deleted_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    invalidate_user(current_user["id"])
+    await wallet_cache.invalidate(current_user["id"])
+    if result.modified_count == 0:
+        raise HTTPException(status_code=401, detail="Usuário não encontrado")
+    # Other workers may still have the user cached; the revocation reaches them sooner
+    await revocations.revoke_user(current_user["id"], REFRESH_TOKEN_EXPIRE_DAYS * 86400)
+    portfolio_recorder.forget(current_user["id"])
+    # Transactions, wallet, portfolio history and exports go in the background
+    job = await account_purger.submit(str(uuid.uuid4()), current_user["id"])
+    return {"message": "Conta deletada com sucesso", "job_id": job["id"]}
+
+@api_router.get("/account-deletions/{job_id}", response_model=DeletionJob)
+async def get_account_deletion(job_id: str):
+    # No auth: the account is gone; the random job id is the handle
+    job = await account_purger.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Exclusão não encontrada")
+    return job
+
+@api_router.get("/stats/cache")
+async def get_cache_stats():
+    return {"token_cache": token_cache.stats(), "user_cache": user_cache.stats(), "wallet_cache": wallet_cache.stats()}
+
+@api_router.get("/stats/stream")
+async def get_stream_stats():
+    return stream_stats()
+
+@api_router.get("/stats/prices")
+async def get_price_stats():
+    return price_feed.stats()
+
+@api_router.get("/stats/ratelimit")
+async def get_ratelimit_stats():
+    return rate_limiter.stats()
+
+@api_router.get("/stats/indexes")
+async def get_index_stats():
+    return index_status
+
+# Crypto routes: the body is serialized once per price version; refreshes
+# with unchanged prices replace the snapshot but keep its version
+cryptos_payload = CachedPayload(
+    lambda prices: orjson.dumps([crypto_row(crypto) for crypto in prices.cryptos]),
+    key=lambda prices: prices.version,
+)
+CRYPTOS_CACHE_CONTROL = f"public, max-age={int(os.environ.get('CRYPTOS_MAX_AGE', '5'))}"
+
 @api_router.get("/cryptos", response_model=List[Crypto])
-async def get_cryptos():
-    return [Crypto(**crypto) for crypto in CRYPTO_DATA]
+async def get_cryptos(request: Request):
+    body, etag = cryptos_payload.get(price_feed.snapshot)
+    headers = {"ETag": etag, "Cache-Control": CRYPTOS_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+# Wallet valuation runs in MongoDB: the price vector from one snapshot is
+# inlined as a $switch, so holdings are priced without a Python loop.
+# With WALLET_CACHE_URL set, cached holdings are priced here instead, against
+# the same snapshot; a cache miss loads the holdings with a find to fill it
+def valuation_pipeline(user_id: str, prices: PriceSnapshot) -> list:
+    price_of = {
+        "$switch": {
+            "branches": [
+                {"case": {"$eq": ["$crypto_id", crypto["id"]]}, "then": crypto["price_brl"]}
+                for crypto in prices.cryptos
+            ],
+            "default": 0,
+        }
+    }
+    return [
+        {"$match": {"user_id": user_id, "crypto_id": {"$in": list(prices.by_id)}, "quantity": {"$gt": 0}}},
+        {"$project": {
+            "_id": 0, "crypto_id": 1, "quantity": 1, "price_brl": price_of,
+            **{field: position_field(field) for field in POSITION_DEFAULTS},
+        }},
+        {"$addFields": {"total_brl": {"$multiply": ["$quantity", "$price_brl"]}}},
+    ]
+
+HOLDING_FIELDS = ["crypto_id", "quantity", *POSITION_DEFAULTS]
+
+async def load_holdings(user_id: str) -> List[dict]:
+    return [
+        {**POSITION_DEFAULTS, **holding}
+        async for holding in db.wallets.find(
+            {"user_id": user_id, "quantity": {"$gt": 0}}, {"_id": 0, **{field: 1 for field in HOLDING_FIELDS}}
+        )
+    ]
+
+async def get_holdings(user_id: str) -> List[dict]:
+    # Holdings do not depend on prices, so cached entries outlive price
+    # ticks; they are valued against the current snapshot on every read
+    return await wallet_cache.get(user_id, lambda: load_holdings(user_id))
+
+def value_holdings(holdings: List[dict], prices: PriceSnapshot) -> List[dict]:
+    items = []
+    for holding in holdings:
+        crypto = prices.get(holding["crypto_id"])
+        if crypto is None:
+            continue
+        items.append({**holding, "price_brl": crypto["price_brl"], "total_brl": holding["quantity"] * crypto["price_brl"]})
+    return items
+
+async def valued_holdings(user_id: str, prices: PriceSnapshot) -> List[dict]:
+    if wallet_cache.enabled:
+        return value_holdings(await get_holdings(user_id), prices)
+    return await db.wallets.aggregate(valuation_pipeline(user_id, prices)).to_list(None)
 
 # Wallet routes
 @api_router.get("/wallet", response_model=List[WalletItem])
 async def get_wallet(current_user: dict = Depends(get_current_user)):
-    wallet_items = await db.wallets.find({"user_id": current_user["id"]}, {"_id": 0}).to_list(100)
-    
+    prices = price_feed.snapshot
     result = []
-    for item in wallet_items:
-        crypto = get_crypto_by_id(item["crypto_id"])
-        if crypto and item["quantity"] > 0:
-            result.append(WalletItem(
-                crypto_id=item["crypto_id"],
-                crypto_name=crypto["name"],
-                crypto_symbol=crypto["symbol"],
-                quantity=item["quantity"],
-                price_brl=crypto["price_brl"],
-                total_brl=item["quantity"] * crypto["price_brl"]
-            ))
-    return result
+    for item in await valued_holdings(current_user["id"], prices):
+        crypto = prices.get(item["crypto_id"])
+        item["crypto_name"] = crypto["name"]
+        item["crypto_symbol"] = crypto["symbol"]
+        result.append(wallet_row(position_view(item)))
+    return fast_json(result)
 
 @api_router.get("/wallet/balance")
 async def get_balance(current_user: dict = Depends(get_current_user)):
-    wallet_items = await db.wallets.find({"user_id": current_user["id"]}, {"_id": 0}).to_list(100)
-    
-    total = 0.0
-    for item in wallet_items:
-        crypto = get_crypto_by_id(item["crypto_id"])
-        if crypto:
-            total += item["quantity"] * crypto["price_brl"]
-    
+    if wallet_cache.enabled:
+        items = value_holdings(await get_holdings(current_user["id"]), price_feed.snapshot)
+        total = sum(item["total_brl"] for item in items)
+    else:
+        pipeline = valuation_pipeline(current_user["id"], price_feed.snapshot) + [
+            {"$group": {"_id": None, "total_brl": {"$sum": "$total_brl"}}},
+        ]
+        totals = await db.wallets.aggregate(pipeline).to_list(1)
+        total = totals[0]["total_brl"] if totals else 0.0
     return {"total_brl": round(total, 2)}
 
+@api_router.get("/wallet/history", response_model=List[PortfolioPoint])
+async def get_wallet_history(
+    range_name: str = Query("7d", alias="range"),
+    current_user: dict = Depends(get_current_user),
+):
+    if range_name not in HISTORY_RANGES:
+        raise HTTPException(status_code=400, detail="Período inválido")
+    pipeline = history_pipeline(current_user["id"], range_name, datetime.now(timezone.utc))
+    return fast_json([
+        portfolio_row({
+            "timestamp": point["ts"].replace(tzinfo=timezone.utc).isoformat(),
+            "total_brl": point["total_brl"],
+            "holdings": {crypto_id: float(quantity) for crypto_id, quantity in point["holdings"].items()},
+        })
+        async for point in db[PORTFOLIO_COLLECTION].aggregate(pipeline)
+    ])
+
+# Wallet mutations: one atomic round-trip each, safe under concurrent trades
+async def credit_wallet(user_id: str, crypto_id: str, quantity: float, price: float) -> float:
+    query = {"user_id": user_id, "crypto_id": crypto_id}
+    try:
+        wallet_item = await db.wallets.find_one_and_update(
+            query,
+            buy_update(quantity, price),
+            projection={"_id": 0, "quantity": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # Lost an upsert race against the unique (user_id, crypto_id) index;
+        # the document exists now, so a plain $inc applies
+        wallet_item = await db.wallets.find_one_and_update(
+            query,
+            buy_update(quantity, price),
+            projection={"_id": 0, "quantity": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+    return wallet_item["quantity"]
+
+async def debit_wallet(user_id: str, crypto_id: str, quantity: float, price: float) -> Optional[float]:
+    # Pipeline update: the cost basis leaves at the average cost in the same write
+    wallet_item = await db.wallets.find_one_and_update(
+        {"user_id": user_id, "crypto_id": crypto_id, "quantity": {"$gte": quantity}},
+        [trade_stage("sell", quantity, price)],
+        projection={"_id": 0, "quantity": 1},
+    )
+    return None if wallet_item is None else wallet_item["quantity"] - quantity
+
+def publish_balance(user_id: str, crypto: dict, quantity: float, delta: float):
+    # Keyed per asset: a slow client gets the latest holding, not every trade
+    stream_relay.publish_user(user_id, f"balance:{crypto['id']}", {
+        "type": "balance",
+        "crypto_id": crypto["id"],
+        "quantity": quantity,
+        "delta": delta,
+        "price_brl": crypto["price_brl"],
+        "total_brl": quantity * crypto["price_brl"],
+    })
+
+def build_transaction_doc(user_id: str, crypto: dict, transaction_type: str, quantity: float,
+                          price_version: Optional[int] = None) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "crypto_id": crypto["id"],
+        "crypto_name": crypto["name"],
+        "crypto_symbol": crypto["symbol"],
+        "transaction_type": transaction_type,
+        "quantity": quantity,
+        "price_brl": crypto["price_brl"],
+        "total_brl": quantity * crypto["price_brl"],
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "price_version": price_version
+    }
+
+async def record_transaction(transaction_doc: dict):
+    # Returns once the record is stored, journaled or not
+    if transaction_journal is not None:
+        await transaction_journal.write(transaction_doc)
+    else:
+        await db.transactions.insert_one(transaction_doc)
+
 # Transaction routes
+async def write_unguarded():
+    # Without an Idempotency-Key there is no claim to mark before writing
+    return None
+
+async def run_idempotent(user_id: str, key: Optional[str], route: str, payload: BaseModel, execute):
+    """Run ``execute(before_write)`` at most once per key, replaying its response.
+
+    ``execute`` awaits ``before_write()`` right before its first wallet
+    write; from then on a failure is stored as a 500 and the key is never
+    released for a retry.
+    """
+    if key is None:
+        return await execute(write_unguarded)
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key inválida")
+    owner = uuid.uuid4().hex
+    try:
+        stored = await idempotency_ledger.begin(
+            user_id, key, request_fingerprint(route, payload.model_dump(mode="json")), owner
+        )
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key já usada em outra requisição")
+    except IdempotencyInProgress:
+        raise HTTPException(status_code=409, detail="Requisição em andamento", headers={"Retry-After": "1"})
+    if stored is not None:
+        return ORJSONResponse(stored["body"], status_code=stored["status_code"], headers={"Idempotent-Replayed": "true"})
+    wrote = False
+
+    async def before_write():
+        nonlocal wrote
+        if not await idempotency_ledger.mark_writing(user_id, key, owner):
+            # Slower than the lease: a retry took the key over and runs the trade
+            raise HTTPException(status_code=409, detail="Requisição em andamento", headers={"Retry-After": "1"})
+        wrote = True
+
+    try:
+        result = await execute(before_write)
+    except HTTPException as exc:
+        if exc.status_code >= 500 and not wrote:
+            # Raised before any write (stale prices, busy): safe to run again
+            await idempotency_ledger.release(user_id, key, owner)
+        else:
+            await idempotency_ledger.complete(user_id, key, owner, exc.status_code, {"detail": exc.detail})
+        raise
+    except Exception:
+        # The trade may have been half applied; never run it a second time
+        await idempotency_ledger.complete(user_id, key, owner, 500, INTERRUPTED_RESPONSE)
+        raise
+    except BaseException:
+        # Cancelled (shutdown, client gone): free the key for the retry
+        # instead of leaving it pending until the lease runs out, unless
+        # the wallet may already have been written
+        if wrote:
+            await idempotency_ledger.complete(user_id, key, owner, 500, INTERRUPTED_RESPONSE)
+        else:
+            await idempotency_ledger.release(user_id, key, owner)
+        raise
+    await idempotency_ledger.complete(user_id, key, owner, 200, result.model_dump(mode="json"))
+    return result
+
 @api_router.post("/transactions/buy", response_model=Transaction)
-async def buy_crypto(transaction_data: TransactionCreate, current_user: dict = Depends(get_current_user)):
-    crypto = get_crypto_by_id(transaction_data.crypto_id)
+async def buy_crypto(
+    transaction_data: TransactionCreate,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None),
+):
+    return await run_idempotent(
+        current_user["id"], idempotency_key, "buy", transaction_data,
+        lambda before_write: execute_buy(transaction_data, current_user, before_write)
+    )
+
+async def execute_buy(transaction_data: TransactionCreate, current_user: dict,
+                      before_write: Callable[[], Awaitable] = write_unguarded) -> Transaction:
+    prices = get_trade_prices()
+    crypto = prices.get(transaction_data.crypto_id)
     if not crypto:
         raise HTTPException(status_code=404, detail="Criptomoeda não encontrada")
     
     if transaction_data.quantity <= 0:
         raise HTTPException(status_code=400, detail="Quantidade deve ser maior que zero")
     
-    # Create transaction
-    transaction_id = str(uuid.uuid4())
-    total = transaction_data.quantity * crypto["price_brl"]
-    transaction_doc = {
-        "id": transaction_id,
-        "user_id": current_user["id"],
-        "crypto_id": crypto["id"],
-        "crypto_name": crypto["name"],
-        "crypto_symbol": crypto["symbol"],
-        "transaction_type": "buy",
-        "quantity": transaction_data.quantity,
-        "price_brl": crypto["price_brl"],
-        "total_brl": total,
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    }
-    await db.transactions.insert_one(transaction_doc)
-    
     # Update wallet
-    wallet_item = await db.wallets.find_one({"user_id": current_user["id"], "crypto_id": crypto["id"]})
-    if wallet_item:
-        new_quantity = wallet_item["quantity"] + transaction_data.quantity
-        await db.wallets.update_one(
-            {"user_id": current_user["id"], "crypto_id": crypto["id"]},
-            {"$set": {"quantity": new_quantity}}
-        )
-    else:
-        await db.wallets.insert_one({
-            "user_id": current_user["id"],
-            "crypto_id": crypto["id"],
-            "quantity": transaction_data.quantity
-        })
+    await before_write()
+    quantity = await credit_wallet(current_user["id"], crypto["id"], transaction_data.quantity, crypto["price_brl"])
+    await wallet_cache.invalidate(current_user["id"])
+    
+    # Create transaction
+    transaction_doc = build_transaction_doc(
+        current_user["id"], crypto, "buy", transaction_data.quantity, prices.version
+    )
+    await record_transaction(transaction_doc)
+    publish_balance(current_user["id"], crypto, quantity, transaction_data.quantity)
+    portfolio_recorder.mark(current_user["id"])
     
     return Transaction(**transaction_doc)
 
 @api_router.post("/transactions/sell", response_model=Transaction)
-async def sell_crypto(transaction_data: TransactionCreate, current_user: dict = Depends(get_current_user)):
-    crypto = get_crypto_by_id(transaction_data.crypto_id)
+async def sell_crypto(
+    transaction_data: TransactionCreate,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None),
+):
+    return await run_idempotent(
+        current_user["id"], idempotency_key, "sell", transaction_data,
+        lambda before_write: execute_sell(transaction_data, current_user, before_write)
+    )
+
+async def execute_sell(transaction_data: TransactionCreate, current_user: dict,
+                       before_write: Callable[[], Awaitable] = write_unguarded) -> Transaction:
+    prices = get_trade_prices()
+    crypto = prices.get(transaction_data.crypto_id)
     if not crypto:
         raise HTTPException(status_code=404, detail="Criptomoeda não encontrada")
     
     if transaction_data.quantity <= 0:
         raise HTTPException(status_code=400, detail="Quantidade deve ser maior que zero")
     
-    # Check wallet
-    wallet_item = await db.wallets.find_one({"user_id": current_user["id"], "crypto_id": crypto["id"]})
-    if not wallet_item or wallet_item["quantity"] < transaction_data.quantity:
+    # Check and update wallet in a single guarded write
+    await before_write()
+    quantity = await debit_wallet(current_user["id"], crypto["id"], transaction_data.quantity, crypto["price_brl"])
+    if quantity is None:
         raise HTTPException(status_code=400, detail="Saldo insuficiente")
+    await wallet_cache.invalidate(current_user["id"])
     
     # Create transaction
-    transaction_id = str(uuid.uuid4())
-    total = transaction_data.quantity * crypto["price_brl"]
-    transaction_doc = {
-        "id": transaction_id,
-        "user_id": current_user["id"],
-        "crypto_id": crypto["id"],
-        "crypto_name": crypto["name"],
-        "crypto_symbol": crypto["symbol"],
-        "transaction_type": "sell",
-        "quantity": transaction_data.quantity,
-        "price_brl": crypto["price_brl"],
-        "total_brl": total,
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    }
-    await db.transactions.insert_one(transaction_doc)
-    
-    # Update wallet
-    new_quantity = wallet_item["quantity"] - transaction_data.quantity
-    await db.wallets.update_one(
-        {"user_id": current_user["id"], "crypto_id": crypto["id"]},
-        {"$set": {"quantity": new_quantity}}
+    transaction_doc = build_transaction_doc(
+        current_user["id"], crypto, "sell", transaction_data.quantity, prices.version
     )
+    await record_transaction(transaction_doc)
+    publish_balance(current_user["id"], crypto, quantity, -transaction_data.quantity)
+    portfolio_recorder.mark(current_user["id"])
     
     return Transaction(**transaction_doc)
 
+# Batch trades: orders are checked against one price snapshot and one read
+# of the holdings, then applied as one guarded update per crypto
+BATCH_MARKER_HISTORY = 8
+
+def plan_batch(orders: List[TransactionCreate], prices: PriceSnapshot, holdings: dict) -> tuple:
+    """Simulate the orders in sequence.
+
+    Returns per-order errors (``None`` when accepted) and, per crypto, the
+    net quantity delta, the minimum starting balance the accepted sequence
+    needs (the ``$gte`` guard of its update) and the accepted trades.
+    """
+    errors = []
+    running = dict(holdings)
+    plan = {}
+    for order in orders:
+        crypto = prices.get(order.crypto_id)
+        if not crypto:
+            errors.append("Criptomoeda não encontrada")
+            continue
+        if order.quantity <= 0:
+            errors.append("Quantidade deve ser maior que zero")
+            continue
+        if order.transaction_type not in ("buy", "sell"):
+            errors.append("Tipo de transação inválido")
+            continue
+        delta = order.quantity if order.transaction_type == "buy" else -order.quantity
+        balance = running.get(crypto["id"], 0.0)
+        if balance + delta < 0:
+            errors.append("Saldo insuficiente")
+            continue
+        running[crypto["id"]] = balance + delta
+        net, required, trades = plan.get(crypto["id"], (0.0, 0.0, []))
+        trades.append((order.transaction_type, order.quantity, crypto["price_brl"]))
+        plan[crypto["id"]] = (net + delta, max(required, -(net + delta)), trades)
+        errors.append(None)
+    return errors, plan
+
+UNDO_FIELDS = ("quantity", "cost_brl", "realized_pnl_brl", "buy_count", "sell_count")
+
+def batch_update(user_id: str, crypto_id: str, trades: list, required: float, batch_id: str,
+                 upsert: bool = True) -> UpdateOne:
+    query = {"user_id": user_id, "crypto_id": crypto_id}
+    if required > 0:
+        query["quantity"] = {"$gte": required}
+    # One stage per trade keeps the cost basis sequential. "undo" ends up with
+    # what the batch changed, so all_or_nothing can $inc it back; the marker
+    # tells which updates matched if a concurrent trade breaks a guard
+    return UpdateOne(query, [
+        {"$set": {"undo": {"batch_id": batch_id, **{name: position_field(name) for name in UNDO_FIELDS}}}},
+        *(trade_stage(*trade) for trade in trades),
+        {"$set": {
+            "undo": {
+                "batch_id": "$undo.batch_id",
+                **{name: {"$subtract": [position_field(name), f"$undo.{name}"]} for name in UNDO_FIELDS},
+            },
+            "batches": {"$slice": [{"$concatArrays": [{"$ifNull": ["$batches", []]}, [batch_id]]}, -BATCH_MARKER_HISTORY]},
+        }},
+    ], upsert=upsert and required == 0)
+
+async def apply_batch(user_id: str, plan: dict, batch_id: str) -> tuple:
+    """Run the per-crypto updates; returns how many applied and the cryptos
+    whose update failed with a write error (not a broken guard)."""
+    entries = [(crypto_id, required, trades) for crypto_id, (_, required, trades) in plan.items()]
+    updates = [batch_update(user_id, crypto_id, trades, required, batch_id) for crypto_id, required, trades in entries]
+    try:
+        result = await db.wallets.bulk_write(updates, ordered=False)
+        return result.matched_count + result.upserted_count, set()
+    except BulkWriteError as exc:
+        # Unordered: every update not listed in writeErrors has been applied
+        applied = exc.details.get("nMatched", 0) + exc.details.get("nUpserted", 0)
+        errors = {error["index"]: error for error in exc.details.get("writeErrors", [])}
+    # A concurrent first buy won the unique (user_id, crypto_id) index; the
+    # document exists now, so the same update applies without the upsert
+    retries = [entries[index] for index, error in errors.items() if error.get("code") == 11000]
+    failed = {entries[index][0] for index, error in errors.items() if error.get("code") != 11000}
+    if retries:
+        try:
+            result = await db.wallets.bulk_write([
+                batch_update(user_id, crypto_id, trades, required, batch_id, upsert=False)
+                for crypto_id, required, trades in retries
+            ], ordered=False)
+            applied += result.matched_count
+        except BulkWriteError as exc:
+            applied += exc.details.get("nMatched", 0)
+            failed.update(retries[error["index"]][0] for error in exc.details.get("writeErrors", []))
+    if failed:
+        logger.error("Batch %s failed to update wallets %s of user %s", batch_id, sorted(failed), user_id)
+    return applied, failed
+
+@api_router.post("/transactions/batch", response_model=BatchTradeResponse)
+async def batch_trade(
+    batch: BatchTradeRequest,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None),
+):
+    return await run_idempotent(
+        current_user["id"], idempotency_key, "batch", batch,
+        lambda before_write: execute_batch(batch, current_user, before_write)
+    )
+
+async def execute_batch(batch: BatchTradeRequest, current_user: dict,
+                        before_write: Callable[[], Awaitable] = write_unguarded) -> BatchTradeResponse:
+    user_id = current_user["id"]
+    prices = get_trade_prices()
+    crypto_ids = list({order.crypto_id for order in batch.orders if prices.get(order.crypto_id)})
+    holdings = {
+        item["crypto_id"]: item["quantity"]
+        async for item in db.wallets.find(
+            {"user_id": user_id, "crypto_id": {"$in": crypto_ids}},
+            {"_id": 0, "crypto_id": 1, "quantity": 1}
+        )
+    }
+    errors, plan = plan_batch(batch.orders, prices, holdings)
+    
+    failed_cryptos = {}
+    if batch.all_or_nothing and any(errors):
+        plan = {}
+    if plan:
+        batch_id = str(uuid.uuid4())
+        await before_write()
+        applied_count, write_failed = await apply_batch(user_id, plan, batch_id)
+        if applied_count < len(plan):
+            # A concurrent trade emptied a holding after the read above, or
+            # an update failed; the marker tells which ones applied
+            applied = {
+                item["crypto_id"]: item["undo"]
+                async for item in db.wallets.find(
+                    {"user_id": user_id, "batches": batch_id}, {"_id": 0, "crypto_id": 1, "undo": 1}
+                )
+            }
+            failed_cryptos = {
+                crypto_id: "Erro ao atualizar a carteira" if crypto_id in write_failed else "Saldo insuficiente"
+                for crypto_id in set(plan) - set(applied)
+            }
+            if batch.all_or_nothing:
+                # No multi-document transactions on a standalone server:
+                # compensate the updates that did apply
+                if applied:
+                    await db.wallets.bulk_write([
+                        UpdateOne(
+                            {"user_id": user_id, "crypto_id": crypto_id, "batches": batch_id},
+                            {
+                                "$inc": {name: -undo[name] for name in UNDO_FIELDS},
+                                "$pull": {"batches": batch_id},
+                            },
+                        )
+                        for crypto_id, undo in applied.items()
+                    ])
+                plan = {}
+        await wallet_cache.invalidate(user_id)
+    
+    results = []
+    transaction_docs = []
+    for index, (order, error) in enumerate(zip(batch.orders, errors)):
+        if error is None and order.crypto_id in failed_cryptos:
+            error = failed_cryptos[order.crypto_id]
+        if error is not None:
+            results.append(BatchOrderResult(index=index, status="error", detail=error))
+        elif order.crypto_id not in plan:
+            results.append(BatchOrderResult(index=index, status="aborted", detail="Lote cancelado"))
+        else:
+            transaction_doc = build_transaction_doc(
+                user_id, prices.get(order.crypto_id), order.transaction_type, order.quantity, prices.version
+            )
+            transaction_docs.append(transaction_doc)
+            results.append(BatchOrderResult(index=index, status="ok", transaction=Transaction(**transaction_doc)))
+    if transaction_docs:
+        await db.transactions.insert_many(transaction_docs)
+        for crypto_id, (delta, _, _) in plan.items():
+            if crypto_id not in failed_cryptos:
+                publish_balance(user_id, prices.get(crypto_id), holdings.get(crypto_id, 0.0) + delta, delta)
+        portfolio_recorder.mark(user_id)
+    
+    executed = len(transaction_docs)
+    return BatchTradeResponse(results=results, executed=executed, failed=len(results) - executed)
+
+# History pagination: keyset on (timestamp, id), newest first
+HISTORY_PAGE_LIMIT = 1000
+HISTORY_STREAM_BATCH = int(os.environ.get('HISTORY_STREAM_BATCH', '500'))
+HISTORY_SORT = [("timestamp", -1), ("id", -1)]
+TRANSACTION_PROJECTION = {"_id": 0, **{field: 1 for field in Transaction.model_fields}}
+
+def encode_cursor(transaction: dict) -> str:
+    raw = json.dumps([transaction["timestamp"], transaction["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        timestamp, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if not isinstance(timestamp, str) or not isinstance(transaction_id, str):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return timestamp, transaction_id
+
+def history_query(user_id: str, cursor: Optional[str] = None) -> dict:
+    query = {"user_id": user_id}
+    if cursor:
+        timestamp, transaction_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "id": {"$lt": transaction_id}},
+        ]
+    return query
+
 @api_router.get("/transactions/history", response_model=List[Transaction])
-async def get_transaction_history(current_user: dict = Depends(get_current_user)):
+async def get_transaction_history(
+    limit: int = Query(HISTORY_PAGE_LIMIT, ge=1, le=HISTORY_PAGE_LIMIT),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+):
     transactions = await db.transactions.find(
+        history_query(current_user["id"], cursor),
+        TRANSACTION_PROJECTION
+    ).sort(HISTORY_SORT).limit(limit + 1).to_list(limit + 1)
+    headers = None
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        headers = {"X-Next-Cursor": encode_cursor(transactions[-1])}
+    return fast_json(map(transaction_row, transactions), headers=headers)
+
+@api_router.get("/transactions/history/stream")
+async def stream_transaction_history(current_user: dict = Depends(get_current_user)):
+    cursor = db.transactions.find(
         {"user_id": current_user["id"]},
-        {"_id": 0}
-    ).sort("timestamp", -1).to_list(1000)
-    return [Transaction(**t) for t in transactions]
-
-# Include the router in the main app
-app.include_router(api_router)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+        TRANSACTION_PROJECTION
+    ).sort(HISTORY_SORT).batch_size(HISTORY_STREAM_BATCH)
+
+    async def rows():
+        chunk = []
+        async for transaction in cursor:
+            chunk.append(orjson.dumps(transaction))
+            if len(chunk) >= HISTORY_STREAM_BATCH:
+                yield b"\n".join(chunk) + b"\n"
+                chunk = []
+        if chunk:
+            yield b"\n".join(chunk) + b"\n"
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+# Export routes
+def export_filter(user_id: str, start: Optional[datetime], end: Optional[datetime], crypto_id: Optional[str]) -> dict:
+    if start is not None and end is not None and start >= end:
+        raise HTTPException(status_code=400, detail="Período inválido")
+    return export_query(user_id, start, end, crypto_id)
+
+@api_router.get("/transactions/export")
+async def export_transactions(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    crypto_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+):
+    query = export_filter(current_user["id"], start, end, crypto_id)
+    return StreamingResponse(
+        iter_csv(db, query, export_jobs.batch_size),
+        media_type=EXPORT_FORMATS["csv"],
+        headers={"Content-Disposition": 'attachment; filename="transactions.csv"'},
+    )
+
+@api_router.post("/transactions/export", response_model=ExportJob, status_code=status.HTTP_202_ACCEPTED)
+async def create_export(export: ExportRequest, current_user: dict = Depends(get_current_user)):
+    if export.format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Formato inválido")
+    query = export_filter(current_user["id"], export.start, export.end, export.crypto_id)
+    await export_jobs.prune()
+    try:
+        return await export_jobs.submit(str(uuid.uuid4()), current_user["id"], query, export.format)
+    except ExportInProgress:
+        raise HTTPException(status_code=409, detail="Já existe uma exportação em andamento")
+
+async def get_user_export(job_id: str, user_id: str) -> dict:
+    job = await export_jobs.get(job_id)
+    if job is None or job["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Exportação não encontrada")
+    return job
+
+@api_router.get("/exports/{job_id}", response_model=ExportJob)
+async def get_export(job_id: str, current_user: dict = Depends(get_current_user)):
+    return await get_user_export(job_id, current_user["id"])
+
+@api_router.get("/exports/{job_id}/download")
+async def download_export(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = await get_user_export(job_id, current_user["id"])
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail="Exportação ainda não concluída")
+    return FileResponse(
+        export_jobs.path_for(job),
+        media_type=EXPORT_FORMATS[job["format"]],
+        filename=f"transactions.{job['format']}",
+    )
+
+# Streaming routes
+async def pump_updates(websocket: WebSocket, subscriber):
+    while True:
+        for payload in await subscriber.next_batch():
+            await websocket.send_text(payload)
+
+@api_router.websocket("/ws")
+async def stream_updates(websocket: WebSocket, token: str = Query(...)):
+    # Browsers cannot set Authorization on a WebSocket, so the JWT comes in
+    # the query string and goes through the same checks as get_current_user
+    try:
+        current_user = await authenticate(token)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+        return
+    
+    await websocket.accept()
+    subscriber = broadcaster.subscribe(current_user["id"])
+    subscriber.offer("prices", json.dumps(prices_message(price_feed.snapshot), ensure_ascii=False))
+    sender = asyncio.create_task(pump_updates(websocket, subscriber))
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        broadcaster.unsubscribe(subscriber)
+
+# Metrics: per-route latency, Mongo command timing, auth/bcrypt breakdown and
+# the existing stats counters, in Prometheus text format
+REGISTRY.register(StatsCollector({
+    "token_cache": token_cache.stats,
+    "user_cache": user_cache.stats,
+    "prices": price_feed.stats,
+    "stream": stream_stats,
+    "ratelimit": rate_limiter.stats,
+    "idempotency": idempotency_ledger.stats,
+    "revocations": revocations.stats,
+    "wallet_cache": wallet_cache.stats,
+    "journal": lambda: transaction_journal.stats() if transaction_journal is not None else {},
+    "hashing": lambda: {"pending": password_hasher.pending, "rejected": password_hasher.rejected},
+}))
+
+# Public signing keys, for services verifying our tokens on their own
+@root_router.get("/.well-known/jwks.json", include_in_schema=False)
+async def get_jwks():
+    return ORJSONResponse(key_ring.jwks(), headers={"Cache-Control": f"public, max-age={JWKS_MAX_AGE}"})
+
+@root_router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
+# Indexes ensured at startup: (collection, keys, options). The wallet index is
+# unique so concurrent $inc upserts in credit_wallet cannot create duplicates.
+INDEXES = [
+    ("users", [("email", 1)], {"name": "email_unique", "unique": True}),
+    ("users", [("id", 1)], {"name": "id_unique", "unique": True}),
+    ("wallets", [("user_id", 1), ("crypto_id", 1)], {"name": "user_crypto_unique", "unique": True}),
+    ("transactions", [("user_id", 1), ("timestamp", -1), ("id", -1)], {"name": "user_timestamp_id"}),
+    (EXPORT_COLLECTION, [("id", 1)], {"name": "id_unique", "unique": True}),
+    # One unfinished export per user; the field only exists while it runs
+    (EXPORT_COLLECTION, [("active_user", 1)], {"name": "active_user_unique", "unique": True, "sparse": True}),
+    (DELETION_COLLECTION, [("id", 1)], {"name": "id_unique", "unique": True}),
+    (LEASE_COLLECTION, [("id", 1)], {"name": "id_unique", "unique": True}),
+    (IDEMPOTENCY_COLLECTION, [("created_at", 1)], {"name": "created_at_ttl", "expireAfterSeconds": IDEMPOTENCY_TTL}),
+    (REVOCATION_COLLECTION, [("expires_at", 1)], {"name": "expires_at_ttl", "expireAfterSeconds": 0}),
+    (REVOCATION_COLLECTION, [("revoked_at", 1)], {"name": "revoked_at"}),
+]
+# Names used by earlier versions of INDEXES, dropped once their replacement exists
+SUPERSEDED_INDEXES = [
+    ("transactions", "user_timestamp", "user_timestamp_id"),
+]
+# Options compared against index_information(); a TTL change is applied in
+# place. Any other difference is only reported: dropping and rebuilding at
+# startup, in every worker at once, would leave the collection without the
+# index (and a unique one without its guarantee) while it builds. Change
+# the spec under a new name and list the old one in SUPERSEDED_INDEXES
+# instead, or migrate by hand
+INDEX_OPTIONS = {"unique": False, "sparse": False, "expireAfterSeconds": None, "partialFilterExpression": None}
+index_status = {}
+
+def index_changes(keys: list, options: dict, info: dict) -> dict:
+    changes = {}
+    if [tuple(key) for key in info["key"]] != [tuple(key) for key in keys]:
+        changes["key"] = keys
+    for option, default in INDEX_OPTIONS.items():
+        if options.get(option, default) != info.get(option, default):
+            changes[option] = options.get(option, default)
+    return changes
+
+async def ensure_indexes(database) -> dict:
+    result = {}
+    for collection, keys, options in INDEXES:
+        name = f"{collection}.{options['name']}"
+        try:
+            existing = await database[collection].index_information()
+            info = existing.get(options["name"])
+            changes = {} if info is None else index_changes(keys, options, info)
+            if info is None:
+                await database[collection].create_index(keys, **options)
+                result[name] = "created"
+            elif not changes:
+                result[name] = "exists"
+            elif set(changes) == {"expireAfterSeconds"} and "expireAfterSeconds" in info:
+                await database.command({
+                    "collMod": collection,
+                    "index": {"name": options["name"], "expireAfterSeconds": options["expireAfterSeconds"]},
+                })
+                result[name] = "updated"
+            else:
+                result[name] = f"mismatch: {', '.join(sorted(changes))} differ from the live index"
+        except OperationFailure as e:
+            result[name] = f"failed: {e}"
+    for collection, old_name, replacement in SUPERSEDED_INDEXES:
+        name = f"{collection}.{old_name}"
+        try:
+            existing = await database[collection].index_information()
+            # Kept until the replacement is built, so queries never lose both
+            if old_name in existing and replacement in existing:
+                await database[collection].drop_index(old_name)
+                result[name] = "dropped"
+        except OperationFailure as e:
+            result[name] = f"failed: {e}"
+    return result
+
+async def create_indexes():
+    index_status.update(await ensure_indexes(db))
+    for name, state in index_status.items():
+        if state.startswith("failed"):
+            logger.error("Index %s %s", name, state)
+        elif state.startswith("mismatch"):
+            logger.warning("Index %s %s", name, state)
+        else:
+            logger.info("Index %s %s", name, state)
+
+async def start_price_feed():
+    price_feed.start()
+
+async def start_stream_relay():
+    await stream_relay.start()
+
+async def start_portfolio_recorder():
+    logger.info("Portfolio series %s", await ensure_series(db))
+    portfolio_recorder.start()
+
+async def start_account_purger():
+    account_purger.start()
+
+async def start_export_jobs():
+    export_jobs.start()
+
+async def start_token_checks():
+    # Keys are read (or generated) before the first login, not during it
+    logger.info("JWT signing key %s (%s)", key_ring.active.kid, key_ring.active.algorithm)
+    revocations.start()
+
+async def start_transaction_journal():
+    # The wallet check against the log runs in run.py, once, before the
+    # workers start (JOURNAL_STARTUP_CHECK), or by hand with python -m journal
+    if transaction_journal is not None:
+        transaction_journal.start()
+
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    await price_feed.stop()
+    await stream_relay.stop()
+    await portfolio_recorder.stop()
+    await export_jobs.stop()
+    await account_purger.stop()
+    await revocations.stop()
+    if transaction_journal is not None:
+        await transaction_journal.stop()
+    await wallet_cache.close()
+    close_db()
+    password_hasher.shutdown()
+
+# Run in order after the database is connected
+STARTUP_HOOKS = [
+    create_indexes, start_price_feed, start_stream_relay, start_portfolio_recorder, start_account_purger,
+    start_export_jobs, start_token_checks, start_transaction_journal,
+]
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """Build the ASGI app; Mongo and the background tasks start with it.
+
+    ``settings`` defaults to the environment. Building an app opens
+    nothing, so tests and tools can import this module without a database.
+    """
+    settings = settings or Settings.from_env()
+    logging.basicConfig(
+        level=settings.log_level,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    app = FastAPI(default_response_class=ORJSONResponse)
+    app.state.settings = settings
+    app.include_router(api_router)
+    app.include_router(root_router)
+
+    # Innermost, so request latency in the metrics includes compression time
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_min_size,
+        gzip_level=settings.compression_level,
+        brotli_quality=settings.brotli_quality,
+        content_types=settings.compression_types,
+    )
+    app.add_middleware(MetricsMiddleware, slow_request_ms=settings.slow_request_ms)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=settings.cors_origins,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag", "Idempotent-Replayed"],
+    )
+
+    async def startup_db_client():
+        connect_db(settings)
+        logger.info("MongoDB client options: %s", settings.client_options or "driver defaults")
+
+    app.add_event_handler("startup", startup_db_client)
+    for hook in STARTUP_HOOKS:
+        app.add_event_handler("startup", hook)
+    app.add_event_handler("shutdown", shutdown_db_client)
+    return app
+
+def __getattr__(name: str):
+    # ``server.app`` (uvicorn "server:app", tests, benchmarks) is built on
+    # first access, from the environment
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
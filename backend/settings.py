@@ -0,0 +1,66 @@
+import os
+from typing import Optional, Sequence
+
+from compression import DEFAULT_CONTENT_TYPES
+
+# MongoDB driver options, only passed when configured
+MONGO_OPTIONS = {
+    'MONGO_MAX_POOL_SIZE': ('maxPoolSize', int),
+    'MONGO_MIN_POOL_SIZE': ('minPoolSize', int),
+    'MONGO_MAX_IDLE_TIME_MS': ('maxIdleTimeMS', int),
+    'MONGO_CONNECT_TIMEOUT_MS': ('connectTimeoutMS', int),
+    'MONGO_SOCKET_TIMEOUT_MS': ('socketTimeoutMS', int),
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': ('serverSelectionTimeoutMS', int),
+    'MONGO_WAIT_QUEUE_TIMEOUT_MS': ('waitQueueTimeoutMS', int),
+    'MONGO_READ_CONCERN': ('readConcernLevel', str),
+    'MONGO_WRITE_CONCERN': ('w', lambda value: int(value) if value.isdigit() else value),
+    'MONGO_JOURNAL': ('journal', lambda value: value.lower() in ('1', 'true', 'yes')),
+    'MONGO_READ_PREFERENCE': ('readPreference', str),
+}
+
+def mongo_client_options() -> dict:
+    options = {}
+    for variable, (option, parse) in MONGO_OPTIONS.items():
+        value = os.environ.get(variable)
+        if value:
+            options[option] = parse(value)
+    return options
+
+class Settings:
+    """What ``create_app`` and ``connect_db`` need; nothing is opened here.
+
+    ``client`` replaces the Motor client built from ``mongo_url``, e.g. with
+    an in-memory ``AsyncMongoMockClient`` in tests.
+    """
+
+    def __init__(self, mongo_url: Optional[str] = None, db_name: Optional[str] = None,
+                 client_options: Optional[dict] = None, client=None,
+                 cors_origins: Sequence[str] = ("*",), log_level: str = "INFO", slow_request_ms: float = 0,
+                 compression_min_size: int = 1024, compression_level: int = 6, brotli_quality: int = 4,
+                 compression_types: Sequence[str] = DEFAULT_CONTENT_TYPES):
+        self.mongo_url = mongo_url
+        self.db_name = db_name
+        self.client_options = client_options or {}
+        self.client = client
+        self.cors_origins = list(cors_origins)
+        self.log_level = log_level
+        self.slow_request_ms = slow_request_ms
+        self.compression_min_size = compression_min_size
+        self.compression_level = compression_level
+        self.brotli_quality = brotli_quality
+        self.compression_types = list(compression_types)
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            mongo_url=os.environ.get('MONGO_URL'),
+            db_name=os.environ.get('DB_NAME'),
+            client_options=mongo_client_options(),
+            cors_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+            log_level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+            slow_request_ms=float(os.environ.get('SLOW_REQUEST_MS', '0')),
+            compression_min_size=int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+            compression_level=int(os.environ.get('COMPRESSION_LEVEL', '6')),
+            brotli_quality=int(os.environ.get('BROTLI_QUALITY', '4')),
+            compression_types=os.environ.get('COMPRESSION_TYPES', ','.join(DEFAULT_CONTENT_TYPES)).split(','),
+        )
@@ -0,0 +1,273 @@
+import asyncio
+import importlib
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import orjson
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # optional: "memory" backend only
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+class FakeRedis:
+    """In-process stand-in for the part of ``redis.asyncio.Redis`` used here.
+
+    Same calls and return values, so tests and single-worker deployments
+    run the real cache code without a server. Not shared between workers.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic, sweep_every: int = 1000):
+        self._clock = clock
+        self._data: Dict[str, tuple] = {}
+        self._sweep_every = sweep_every
+        self._writes = 0
+        self._channels: Dict[str, set] = {}
+
+    def _get(self, name: str) -> Optional[bytes]:
+        entry = self._data.get(name)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= self._clock():
+            del self._data[name]
+            return None
+        return value
+
+    def _put(self, name: str, value, ex: Optional[float]):
+        if not isinstance(value, bytes):
+            value = str(value).encode()
+        self._data[name] = (value, None if ex is None else self._clock() + ex)
+        self._writes += 1
+        if self._writes % self._sweep_every == 0:
+            now = self._clock()
+            for key in [key for key, (_, expires_at) in self._data.items() if expires_at is not None and expires_at <= now]:
+                del self._data[key]
+
+    async def get(self, name: str) -> Optional[bytes]:
+        return self._get(name)
+
+    async def mget(self, keys, *args) -> list:
+        names = [keys] if isinstance(keys, str) else list(keys)
+        return [self._get(name) for name in names + list(args)]
+
+    async def set(self, name: str, value, ex: Optional[int] = None, px: Optional[int] = None,
+                  nx: bool = False) -> Optional[bool]:
+        if nx and self._get(name) is not None:
+            return None
+        self._put(name, value, px / 1000 if px is not None else ex)
+        return True
+
+    async def delete(self, *names) -> int:
+        return sum(self._data.pop(name, None) is not None for name in names)
+
+    async def publish(self, channel: str, message) -> int:
+        if not isinstance(message, bytes):
+            message = str(message).encode()
+        subscribers = self._channels.get(channel, ())
+        for pubsub in subscribers:
+            pubsub._deliver({"type": "message", "channel": channel.encode(), "data": message})
+        return len(subscribers)
+
+    def pubsub(self) -> "FakePubSub":
+        return FakePubSub(self)
+
+    async def aclose(self):
+        self._data.clear()
+
+class FakePubSub:
+    """The ``subscribe``/``listen``/``aclose`` subset of ``redis.asyncio.client.PubSub``."""
+
+    def __init__(self, server: FakeRedis):
+        self._server = server
+        self._messages: "asyncio.Queue[dict]" = asyncio.Queue()
+        self.channels: set = set()
+
+    def _deliver(self, message: dict):
+        self._messages.put_nowait(message)
+
+    async def subscribe(self, *channels: str):
+        for channel in channels:
+            self.channels.add(channel)
+            self._server._channels.setdefault(channel, set()).add(self)
+            self._deliver({"type": "subscribe", "channel": channel.encode(), "data": len(self.channels)})
+
+    async def listen(self):
+        while True:
+            yield await self._messages.get()
+
+    async def aclose(self):
+        for channel in self.channels:
+            self._server._channels.get(channel, set()).discard(self)
+        self.channels.clear()
+
+def milliseconds(seconds: float) -> int:
+    # Redis takes whole units; PX keeps fractional TTLs
+    return max(1, int(seconds * 1000))
+
+def build_backend(url: str):
+    """None (no shared cache), ``memory``, a ``redis://`` URL or ``module:Class``."""
+    if not url or url == "none":
+        return None
+    if url == "memory":
+        return FakeRedis()
+    if url.split("://", 1)[0] in ("redis", "rediss", "unix"):
+        if redis is None:
+            raise RuntimeError("the redis package is required for a redis:// cache URL")
+        return redis.from_url(url)
+    if ":" in url:
+        # Any client with the same async get/mget/set/delete as redis.asyncio
+        module_name, class_name = url.split(":", 1)
+        return getattr(importlib.import_module(module_name), class_name)()
+    raise ValueError(f"unknown cache backend {url!r}")
+
+class ReadThroughCache:
+    """JSON values in a Redis-compatible store shared by all workers.
+
+    Each key has a generation token next to its entry; ``invalidate``
+    replaces the token, so an entry loaded from data read before the
+    write no longer matches even if it is stored after it. Misses are
+    single-flight per generation: one load per key and token in a
+    worker, and across workers whoever holds the key's lock loads while
+    the others wait for it, up to ``lock_wait`` seconds. Store errors
+    fall back to the loader.
+    """
+
+    def __init__(self, backend, namespace: str, ttl: float = 30.0, lock_timeout: float = 5.0,
+                 lock_wait: float = 0.5, poll_interval: float = 0.02):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.lock_wait = lock_wait
+        self.poll_interval = poll_interval
+        self._flights: Dict[tuple, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def _keys(self, key: str) -> tuple:
+        base = f"{self.namespace}:{key}"
+        return base, f"{base}:gen", f"{base}:lock"
+
+    async def get(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        if self.backend is None:
+            return await loader()
+        entry_key, generation_key, _ = self._keys(key)
+        try:
+            found, value, generation = await self._lookup(entry_key, generation_key)
+        except Exception:
+            logger.exception("Cache read of %s failed", entry_key)
+            self.errors += 1
+            return await loader()
+        if found:
+            self.hits += 1
+            return value
+        # Keyed by generation too: a read after an invalidation never joins
+        # a load that started before it, in this worker or another
+        flight_key = (key, generation)
+        flight = self._flights.get(flight_key)
+        if flight is None:
+            self.misses += 1
+            flight = asyncio.ensure_future(self._fetch(key, generation, loader))
+            self._flights[flight_key] = flight
+            flight.add_done_callback(lambda done: self._landed(flight_key, done))
+        else:
+            self.coalesced += 1
+        # Shielded: a caller going away must not cancel the load the others wait on
+        return await asyncio.shield(flight)
+
+    def _landed(self, flight_key: tuple, flight: asyncio.Task):
+        if self._flights.get(flight_key) is flight:
+            del self._flights[flight_key]
+        if not flight.cancelled():
+            flight.exception()
+
+    async def _lookup(self, entry_key: str, generation_key: str) -> tuple:
+        raw, generation = await self.backend.mget([entry_key, generation_key])
+        generation = generation.decode() if generation is not None else None
+        if raw is not None:
+            stored_generation, value = orjson.loads(raw)
+            if stored_generation == generation:
+                return True, value, generation
+        return False, None, generation
+
+    async def _fetch(self, key: str, generation: Optional[str], loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry_key, generation_key, lock_key = self._keys(key)
+        try:
+            locked = await self.backend.set(lock_key, b"1", px=milliseconds(self.lock_timeout), nx=True)
+            if not locked:
+                deadline = time.monotonic() + self.lock_wait
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(self.poll_interval)
+                    found, value, current = await self._lookup(entry_key, generation_key)
+                    if found:
+                        self.coalesced += 1
+                        return value
+                    if current != generation:
+                        # Invalidated meanwhile: what the other worker loads is already old
+                        break
+                # The other loader is slow or gone: load without the lock
+        except Exception:
+            logger.exception("Cache read of %s failed", entry_key)
+            self.errors += 1
+            return await loader()
+
+        try:
+            value = await loader()
+            # Under the generation read before loading, so a write racing
+            # the load leaves an entry that never matches
+            await self._store(entry_key, orjson.dumps([generation, value]))
+        finally:
+            if locked:
+                await self._release(lock_key)
+        return value
+
+    async def _store(self, entry_key: str, payload: bytes):
+        try:
+            await self.backend.set(entry_key, payload, px=milliseconds(self.ttl))
+        except Exception:
+            logger.exception("Cache write of %s failed", entry_key)
+            self.errors += 1
+
+    async def _release(self, lock_key: str):
+        try:
+            await self.backend.delete(lock_key)
+        except Exception:
+            # Expires after lock_timeout anyway
+            self.errors += 1
+
+    async def invalidate(self, key: str):
+        if self.backend is None:
+            return
+        _, generation_key, _ = self._keys(key)
+        try:
+            # Outlives every entry of the previous generation, so an expired
+            # token can never make one of them match again
+            await self.backend.set(generation_key, uuid.uuid4().hex.encode(), px=milliseconds(self.ttl * 2))
+        except Exception:
+            logger.exception("Cache invalidation of %s failed", generation_key)
+            self.errors += 1
+
+    async def close(self):
+        if self.backend is not None:
+            await self.backend.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.backend is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "in_flight": len(self._flights),
+        }
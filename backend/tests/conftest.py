@@ -0,0 +1,50 @@
+import os
+import uuid
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+from settings import Settings
+from tokens import KeyRing
+
+# Set to run the suite against a real MongoDB instead of the in-memory stand-in
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL")
+
+@pytest.fixture
+def settings():
+    """Configurações do banco isolado do teste: mongomock em memória ou, com TEST_MONGO_URL, um banco próprio"""
+    # Unique per test and per xdist worker, so suites can run in parallel
+    name = f"test_{os.environ.get('PYTEST_XDIST_WORKER', 'main')}_{uuid.uuid4().hex[:12]}"
+    if TEST_MONGO_URL:
+        return Settings(mongo_url=TEST_MONGO_URL, db_name=name)
+    return Settings(client=AsyncMongoMockClient(), db_name=name)
+
+@pytest.fixture(scope="session", autouse=True)
+def signing_keys(tmp_path_factory):
+    """Chave JWT gerada em diretório temporário, nunca em JWT_KEYS_DIR (backend/keys)"""
+    key_ring = KeyRing(
+        tmp_path_factory.mktemp("keys"),
+        active_kid=server.key_ring.active_kid,
+        algorithm=server.key_ring.algorithm,
+    )
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(server, "key_ring", key_ring)
+        yield key_ring
+
+@pytest.fixture(autouse=True)
+def database(settings):
+    """Banco isolado por teste; apps com lifespan usam create_app(settings)"""
+    server.close_db()
+    yield server.connect_db(settings)
+    if TEST_MONGO_URL:
+        from pymongo import MongoClient
+
+        with MongoClient(TEST_MONGO_URL) as sync_client:
+            sync_client.drop_database(settings.db_name)
+    server.close_db()
+
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    """Cada teste começa com os buckets de rate limit cheios"""
+    server.rate_limiter.reset()
@@ -0,0 +1,52 @@
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+import server
+from settings import Settings
+
+@pytest.mark.asyncio
+async def test_create_app_uses_settings():
+    """Teste da factory: app montado a partir das configurações recebidas"""
+    app = server.create_app(Settings(cors_origins=["https://banksys.example"], compression_min_size=10))
+    assert app.state.settings.cors_origins == ["https://banksys.example"]
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/api/cryptos", headers={
+            "Origin": "https://banksys.example", "Accept-Encoding": "gzip",
+        })
+    assert response.status_code == 200
+    assert response.headers["access-control-allow-origin"] == "https://banksys.example"
+    assert response.headers["content-encoding"] == "gzip"
+
+def test_connect_requires_database_settings():
+    """Teste de conexão sem MONGO_URL/DB_NAME configurados"""
+    server.close_db()
+    with pytest.raises(RuntimeError):
+        server.connect_db(Settings(db_name="banksys"))
+    with pytest.raises(RuntimeError):
+        server.connect_db(Settings(mongo_url="mongodb://localhost:27017"))
+    assert server.client is None and server.db is None
+
+def test_connect_refuses_a_second_database():
+    """Teste de segunda app com outro banco no mesmo processo: erro em vez de reusar o primeiro"""
+    current = server.db
+    settings = Settings(client=server.client, db_name=current.name)
+    assert server.connect_db(settings) is current
+    assert server.connect_db() is current
+    with pytest.raises(RuntimeError):
+        server.connect_db(Settings(client=server.client, db_name="other"))
+    with pytest.raises(RuntimeError):
+        server.connect_db(Settings(mongo_url="mongodb://elsewhere:27017", db_name=current.name))
+    assert server.db is current
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("attempt", [1, 2])
+async def test_database_is_isolated_per_test(attempt):
+    """Teste de isolamento: o mesmo email registra em cada teste"""
+    async with AsyncClient(transport=ASGITransport(app=server.app), base_url="http://test") as client:
+        response = await client.post("/api/auth/register", json={
+            "name": "Isolated User",
+            "email": "isolated@example.com",
+            "password": "password123"
+        })
+    assert response.status_code == 200
+    assert await server.db.users.count_documents({}) == 1
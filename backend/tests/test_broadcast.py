@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import server
+from broadcast import Broadcaster, UserRelay
+from sharedcache import FakeRedis
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_gets_coalesced_latest_message():
+    """Teste de agregação: cliente lento recebe apenas a mensagem mais recente"""
+    broadcaster = Broadcaster()
+    subscriber = broadcaster.subscribe("user-1")
+    for version in range(5):
+        broadcaster.publish("prices", {"version": version})
+    batch = await subscriber.next_batch()
+    assert [json.loads(payload) for payload in batch] == [{"version": 4}]
+    assert subscriber.coalesced == 4
+
+@pytest.mark.asyncio
+async def test_subscriber_queue_is_bounded():
+    """Teste do limite da fila por conexão"""
+    broadcaster = Broadcaster(max_pending=2)
+    subscriber = broadcaster.subscribe("user-1")
+    for key in ("a", "b", "c"):
+        broadcaster.publish(key, {"key": key})
+    batch = await subscriber.next_batch()
+    assert [json.loads(payload)["key"] for payload in batch] == ["b", "c"]
+    assert subscriber.dropped == 1
+
+@pytest.mark.asyncio
+async def test_publish_user_only_reaches_that_user():
+    """Teste de envio de saldo apenas para as conexões do usuário"""
+    broadcaster = Broadcaster()
+    alice = broadcaster.subscribe("alice")
+    bob = broadcaster.subscribe("bob")
+    broadcaster.publish_user("alice", "balance:btc", {"quantity": 1.0})
+    assert len(await alice.next_batch()) == 1
+    assert not bob._ready.is_set()
+    broadcaster.unsubscribe(alice)
+    broadcaster.unsubscribe(bob)
+    assert broadcaster.stats()["connections"] == 0
+
+@pytest.mark.asyncio
+async def test_relay_delivers_balance_to_another_worker():
+    """Teste de saldo publicado em um worker e entregue às conexões de outro"""
+    broker = FakeRedis()
+    trading = Broadcaster()
+    streaming = Broadcaster()
+    trading_relay = UserRelay(trading, broker)
+    streaming_relay = UserRelay(streaming, broker)
+    await trading_relay.start()
+    await streaming_relay.start()
+    try:
+        subscriber = streaming.subscribe("alice")
+        trading_relay.publish_user("alice", "balance:btc", {"quantity": 1.0})
+        batch = await asyncio.wait_for(subscriber.next_batch(), 1)
+        assert [json.loads(payload) for payload in batch] == [{"quantity": 1.0}]
+        assert trading_relay.stats()["relayed"] == 1
+        assert streaming_relay.stats()["received"] == 1
+    finally:
+        await trading_relay.stop()
+        await streaming_relay.stop()
+
+@pytest.mark.asyncio
+async def test_relay_without_broker_stays_local():
+    """Teste sem broker: o saldo vai direto às conexões deste worker"""
+    broadcaster = Broadcaster()
+    relay = UserRelay(broadcaster)
+    subscriber = broadcaster.subscribe("alice")
+    relay.publish_user("alice", "balance:btc", {"quantity": 1.0})
+    assert len(await subscriber.next_batch()) == 1
+    assert relay.stats()["relay"] is False
+
+def test_websocket_rejects_invalid_token(settings):
+    """Teste de conexão WebSocket com token inválido"""
+    with TestClient(server.create_app(settings)) as client:
+        with pytest.raises(WebSocketDisconnect):
+            with client.websocket_connect("/api/ws?token=invalido") as websocket:
+                websocket.receive_text()
+
+def test_websocket_pushes_prices_and_balance(settings):
+    """Teste de envio de cotações e saldo pelo WebSocket"""
+    with TestClient(server.create_app(settings)) as client:
+        response = client.post("/api/auth/register", json={
+            "name": "Stream Test User",
+            "email": "stream@example.com",
+            "password": "password123"
+        })
+        token = response.json()["access_token"]
+        with client.websocket_connect(f"/api/ws?token={token}") as websocket:
+            prices = websocket.receive_json()
+            assert prices["type"] == "prices"
+            assert prices["cryptos"][0]["id"] == "btc"
+            
+            client.post("/api/transactions/buy", headers={"Authorization": f"Bearer {token}"}, json={
+                "crypto_id": "btc",
+                "quantity": 0.5,
+                "transaction_type": "buy"
+            })
+            balance = websocket.receive_json()
+            assert balance["type"] == "balance"
+            assert balance["crypto_id"] == "btc"
+            assert balance["quantity"] == 0.5
+            assert balance["delta"] == 0.5
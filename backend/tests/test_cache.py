@@ -0,0 +1,41 @@
+from cache import TTLCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_cache_hit_and_miss_counters():
+    """Teste dos contadores de acerto e falha do cache"""
+    cache = TTLCache(maxsize=10, ttl=30)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_cache_entry_expires():
+    """Teste de expiração das entradas pelo TTL"""
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=30, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=5)
+    clock.now = 10
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    clock.now = 31
+    assert cache.get("a") is None
+
+def test_cache_evicts_least_recently_used():
+    """Teste de remoção do item menos usado quando o cache está cheio"""
+    cache = TTLCache(maxsize=2, ttl=30)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
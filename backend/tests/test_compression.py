@@ -0,0 +1,83 @@
+import gzip
+import json
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import server
+from compression import CompressionMiddleware, accepted_encodings
+
+ROWS = [{"id": i, "crypto_id": "btc", "quantity": 0.5} for i in range(200)]
+
+async def large(request):
+    return JSONResponse(ROWS, headers={"ETag": '"abc"'})
+
+async def small(request):
+    return JSONResponse({"ok": True})
+
+async def binary(request):
+    return Response(b"\0" * 4096, media_type="application/octet-stream")
+
+async def stream(request):
+    async def rows():
+        for row in ROWS:
+            yield json.dumps(row) + "\n"
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+app = CompressionMiddleware(Starlette(routes=[
+    Route("/large", large), Route("/small", small), Route("/binary", binary), Route("/stream", stream),
+]), minimum_size=500)
+
+@pytest.fixture
+async def client():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        yield ac
+
+def test_accepted_encodings():
+    """Teste da leitura do Accept-Encoding com pesos"""
+    assert accepted_encodings("gzip, br;q=0, *;q=0.1") == {"gzip": 1.0, "br": 0.0, "*": 0.1}
+
+@pytest.mark.asyncio
+async def test_large_json_is_gzipped(client):
+    """Teste de compressão gzip de respostas JSON grandes"""
+    response = await client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < len(json.dumps(ROWS))
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"abc"'
+    assert response.json() == ROWS
+
+@pytest.mark.asyncio
+async def test_small_binary_and_identity_are_untouched(client):
+    """Teste de respostas não comprimidas: pequenas, tipo fora da lista e sem Accept-Encoding"""
+    for path, encoding in (("/small", "gzip"), ("/binary", "gzip"), ("/large", "identity")):
+        response = await client.get(path, headers={"Accept-Encoding": encoding})
+        assert "content-encoding" not in response.headers, path
+
+@pytest.mark.asyncio
+async def test_streaming_response_is_compressed_per_chunk(client):
+    """Teste de compressão de respostas em streaming (NDJSON)"""
+    chunks = []
+    async with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        async for chunk in response.aiter_raw():
+            chunks.append(chunk)
+    rows = [json.loads(line) for line in gzip.decompress(b"".join(chunks)).splitlines()]
+    assert rows == ROWS
+
+@pytest.mark.asyncio
+async def test_brotli_preferred_when_available(client):
+    """Teste de preferência por Brotli quando instalado"""
+    brotli = pytest.importorskip("brotli")
+    response = await client.get("/large", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["content-encoding"] == "br"
+    assert json.loads(brotli.decompress(response.content)) == ROWS
+
+def test_app_uses_compression_middleware():
+    """Teste de que o app principal usa o middleware de compressão"""
+    middleware = [m for m in server.app.user_middleware if m.cls is CompressionMiddleware]
+    assert len(middleware) == 1
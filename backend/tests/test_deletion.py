@@ -0,0 +1,90 @@
+import asyncio
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+import server
+from deletion import DELETION_COLLECTION
+
+@pytest.fixture
+async def client():
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        yield ac
+
+async def register_trader(client):
+    email = f"delete-{uuid.uuid4().hex}@example.com"
+    response = await client.post("/api/auth/register", json={
+        "name": "Delete User", "email": email, "password": "password123"
+    })
+    user_id = response.json()["user"]["id"]
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    for crypto_id in ("btc", "eth"):
+        await client.post("/api/transactions/buy", headers=headers, json={
+            "crypto_id": crypto_id, "quantity": 1, "transaction_type": "buy"
+        })
+    return user_id, email, headers
+
+async def wait_for_deletion(client, job_id):
+    for _ in range(100):
+        job = (await client.get(f"/api/account-deletions/{job_id}")).json()
+        if job["status"] == "done":
+            return job
+        await asyncio.sleep(0.05)
+    raise AssertionError("deletion did not finish")
+
+@pytest.mark.asyncio
+async def test_delete_tombstones_then_purges(client):
+    """Teste da exclusão: bloqueio imediato e remoção dos dados em segundo plano"""
+    user_id, email, headers = await register_trader(client)
+    response = await client.delete("/api/auth/delete", headers=headers)
+    assert response.status_code == 200
+    assert (await client.get("/api/auth/me", headers=headers)).status_code == 401
+    login = await client.post("/api/auth/login", json={"email": email, "password": "password123"})
+    assert login.status_code == 401
+
+    job = await wait_for_deletion(client, response.json()["job_id"])
+    assert job["deleted"] == {"transactions": 2, "wallets": 2}
+    assert await server.db.users.find_one({"id": user_id}) is None
+    assert await server.db.transactions.count_documents({"user_id": user_id}) == 0
+    assert await server.db.wallets.count_documents({"user_id": user_id}) == 0
+
+@pytest.mark.asyncio
+async def test_interrupted_deletion_is_resumed(client, monkeypatch):
+    """Teste de retomada de uma exclusão interrompida (lease expirado)"""
+    user_id, _, headers = await register_trader(client)
+    monkeypatch.setattr(server.account_purger, "batch_size", 1)
+    await server.db.users.update_one({"id": user_id}, {"$set": {"deleted_at": "2025-01-01T00:00:00+00:00"}})
+    job_id = str(uuid.uuid4())
+    # Worker died after purging part of the wallet
+    await server.db[DELETION_COLLECTION].insert_one({
+        "id": job_id, "user_id": user_id, "status": "running", "deleted": {"wallets": 1},
+        "lease_until": 0, "created_at": "2025-01-01T00:00:00+00:00", "finished_at": None,
+    })
+    await server.db.wallets.delete_one({"user_id": user_id, "crypto_id": "btc"})
+
+    assert await server.account_purger.run(job_id) == 1
+    job = await server.account_purger.get(job_id)
+    assert job["status"] == "done"
+    assert job["deleted"] == {"wallets": 2, "transactions": 2}
+    assert await server.db.users.find_one({"id": user_id}) is None
+    # Idempotent: a finished job is not claimed again
+    assert await server.account_purger.run(job_id) == 0
+
+@pytest.mark.asyncio
+async def test_leased_job_is_not_claimed_twice(client):
+    """Teste de que um job com lease ativo não é assumido por outro worker"""
+    job_id = str(uuid.uuid4())
+    await server.db[DELETION_COLLECTION].insert_one({
+        "id": job_id, "user_id": "nobody", "status": "pending", "deleted": {},
+        "lease_until": 0, "created_at": "2025-01-01T00:00:00+00:00", "finished_at": None,
+    })
+    assert await server.account_purger.claim(job_id) is not None
+    assert await server.account_purger.claim(job_id) is None
+
+@pytest.mark.asyncio
+async def test_unknown_deletion_job(client):
+    """Teste de consulta de exclusão inexistente"""
+    response = await client.get(f"/api/account-deletions/{uuid.uuid4()}")
+    assert response.status_code == 404
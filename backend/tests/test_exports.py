@@ -0,0 +1,181 @@
+import asyncio
+import csv
+import io
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+import exports
+import server
+from exports import EXPORT_COLUMNS
+
+@pytest.fixture
+async def export_client(tmp_path, monkeypatch):
+    """Cliente autenticado com algumas transações e diretório de exportação temporário"""
+    monkeypatch.setattr(server.export_jobs, "directory", tmp_path)
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post("/api/auth/register", json={
+            "name": "Export User",
+            "email": f"export-{uuid.uuid4().hex}@example.com",
+            "password": "password123"
+        })
+        ac.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+        for crypto_id in ("btc", "eth", "btc"):
+            await ac.post("/api/transactions/buy", json={
+                "crypto_id": crypto_id, "quantity": 0.5, "transaction_type": "buy"
+            })
+        yield ac
+        await ac.delete("/api/auth/delete")
+
+async def wait_for_job(client, job_id):
+    for _ in range(100):
+        job = (await client.get(f"/api/exports/{job_id}")).json()
+        if job["status"] in ("done", "failed"):
+            return job
+        await asyncio.sleep(0.05)
+    raise AssertionError("export did not finish")
+
+def test_export_columns_match_transaction_model():
+    """Teste de que as colunas exportadas são os campos de Transaction"""
+    assert EXPORT_COLUMNS == list(server.Transaction.model_fields)
+
+@pytest.mark.asyncio
+async def test_stream_csv_with_crypto_filter(export_client):
+    """Teste da exportação CSV em streaming com filtro de cripto"""
+    response = await export_client.get("/api/transactions/export", params={"crypto_id": "btc"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 2
+    assert {row["crypto_id"] for row in rows} == {"btc"}
+    assert float(rows[0]["quantity"]) == 0.5
+
+@pytest.mark.asyncio
+async def test_stream_csv_date_range(export_client):
+    """Teste do filtro por período (fim exclusivo) e período inválido"""
+    response = await export_client.get("/api/transactions/export", params={"end": "2000-01-01T00:00:00"})
+    assert response.text.strip() == ",".join(EXPORT_COLUMNS)
+    response = await export_client.get("/api/transactions/export", params={
+        "start": "2030-01-01T00:00:00", "end": "2020-01-01T00:00:00"
+    })
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_background_csv_export_and_download(export_client):
+    """Teste da exportação em segundo plano com download"""
+    response = await export_client.post("/api/transactions/export", json={"format": "csv"})
+    assert response.status_code == 202
+    job = await wait_for_job(export_client, response.json()["id"])
+    assert job["status"] == "done"
+    assert job["rows"] == 3
+    response = await export_client.get(f"/api/exports/{job['id']}/download")
+    assert response.status_code == 200
+    assert len(list(csv.DictReader(io.StringIO(response.text)))) == 3
+
+@pytest.mark.asyncio
+async def test_background_parquet_export(export_client, tmp_path):
+    """Teste da exportação Parquet em segundo plano"""
+    pq = pytest.importorskip("pyarrow.parquet")
+    response = await export_client.post("/api/transactions/export", json={"format": "parquet", "crypto_id": "eth"})
+    job = await wait_for_job(export_client, response.json()["id"])
+    assert job["status"] == "done"
+    table = pq.read_table(tmp_path / f"{job['id']}.parquet")
+    assert table.column_names == EXPORT_COLUMNS
+    assert table.column("crypto_id").to_pylist() == ["eth"]
+
+@pytest.mark.asyncio
+async def test_export_job_is_private(export_client):
+    """Teste de que outro usuário não acessa a exportação"""
+    response = await export_client.post("/api/transactions/export", json={"format": "csv"})
+    job_id = response.json()["id"]
+    await wait_for_job(export_client, job_id)
+    other = await export_client.post("/api/auth/register", json={
+        "name": "Other", "email": f"other-{uuid.uuid4().hex}@example.com", "password": "password123"
+    })
+    headers = {"Authorization": f"Bearer {other.json()['access_token']}"}
+    assert (await export_client.get(f"/api/exports/{job_id}", headers=headers)).status_code == 404
+    assert (await export_client.get(f"/api/exports/{job_id}/download", headers=headers)).status_code == 404
+    await export_client.delete("/api/auth/delete", headers=headers)
+
+@pytest.mark.asyncio
+async def test_invalid_export_format(export_client):
+    """Teste de formato de exportação inválido"""
+    response = await export_client.post("/api/transactions/export", json={"format": "xlsx"})
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_cancelled_export_is_marked_failed(export_client, monkeypatch):
+    """Teste de exportação interrompida no desligamento: job falho e sem arquivo parcial"""
+    iter_frames = exports.iter_frames
+    stalled = asyncio.Event()
+
+    async def stalled_frames(db, query, batch_size):
+        async for frame in iter_frames(db, query, batch_size):
+            yield frame
+        stalled.set()
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(exports, "iter_frames", stalled_frames)
+    job = (await export_client.post("/api/transactions/export", json={"format": "csv"})).json()
+    path = server.export_jobs.path_for(job)
+    await asyncio.wait_for(stalled.wait(), 5)
+    assert path.exists()
+    await server.export_jobs.stop()
+
+    job = (await export_client.get(f"/api/exports/{job['id']}")).json()
+    assert job["status"] == "failed"
+    assert job["error"] == "Exportação interrompida"
+    assert not path.exists()
+
+@pytest.mark.asyncio
+async def test_second_export_is_rejected_while_one_runs(export_client, monkeypatch):
+    """Teste de exportação recusada enquanto outra do mesmo usuário está em andamento"""
+    release = asyncio.Event()
+    write_export = exports.write_export
+
+    async def held_export(*args, **kwargs):
+        await release.wait()
+        return await write_export(*args, **kwargs)
+
+    monkeypatch.setattr(exports, "write_export", held_export)
+    first = (await export_client.post("/api/transactions/export", json={"format": "csv"})).json()
+    response = await export_client.post("/api/transactions/export", json={"format": "csv"})
+    assert response.status_code == 409
+
+    release.set()
+    assert (await wait_for_job(export_client, first["id"]))["status"] == "done"
+    response = await export_client.post("/api/transactions/export", json={"format": "csv"})
+    assert response.status_code == 202
+    await wait_for_job(export_client, response.json()["id"])
+
+@pytest.mark.asyncio
+async def test_sweep_resumes_export_of_crashed_worker(export_client, monkeypatch):
+    """Teste de retomada: job deixado 'running' por um worker que caiu é refeito pela varredura"""
+    # The submitting worker dies before writing: the job stays claimed and running
+    monkeypatch.setattr(server.export_jobs, "_spawn", lambda job_id=None: None)
+    job = (await export_client.post("/api/transactions/export", json={"format": "csv"})).json()
+    jobs = server.db[exports.EXPORT_COLLECTION]
+    await jobs.update_one({"id": job["id"]}, {"$set": {"status": "running", "lease_until": 0}})
+
+    assert await server.export_jobs.run() == 1
+    job = (await export_client.get(f"/api/exports/{job['id']}")).json()
+    assert job["status"] == "done"
+    assert job["rows"] == 3
+    assert (await export_client.get(f"/api/exports/{job['id']}/download")).status_code == 200
+
+@pytest.mark.asyncio
+async def test_export_fails_after_max_attempts(export_client):
+    """Teste de limite de tentativas: job que sempre derruba o worker termina como falho"""
+    job = (await export_client.post("/api/transactions/export", json={"format": "csv"})).json()
+    await wait_for_job(export_client, job["id"])
+    jobs = server.db[exports.EXPORT_COLLECTION]
+    await jobs.update_one({"id": job["id"]}, {"$set": {
+        "status": "running", "lease_until": 0, "attempts": server.export_jobs.max_attempts,
+    }})
+
+    assert await server.export_jobs.run() == 1
+    job = (await export_client.get(f"/api/exports/{job['id']}")).json()
+    assert job["status"] == "failed"
+    assert job["error"] == "Exportação interrompida"
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from hashing import HashingBusyError, PasswordHasher
+
+@pytest.mark.asyncio
+async def test_hash_and_verify_on_pool():
+    """Teste de hash e verificação de senha no pool de threads"""
+    hasher = PasswordHasher(max_workers=2, max_pending=4)
+    try:
+        hashed = await hasher.hash("password123")
+        assert await hasher.verify("password123", hashed)
+        assert not await hasher.verify("wrongpassword", hashed)
+    finally:
+        hasher.shutdown()
+
+@pytest.mark.asyncio
+async def test_hash_inline_without_pool():
+    """Teste de hash sem pool (max_workers=0)"""
+    hasher = PasswordHasher(max_workers=0)
+    hashed = await hasher.hash("password123")
+    assert await hasher.verify("password123", hashed)
+
+@pytest.mark.asyncio
+async def test_hash_rejects_when_queue_full():
+    """Teste de rejeição quando a fila de hashing está cheia"""
+    hasher = PasswordHasher(max_workers=1, max_pending=1)
+    try:
+        first = asyncio.ensure_future(hasher.hash("password123"))
+        await asyncio.sleep(0)
+        with pytest.raises(HashingBusyError):
+            await hasher.hash("password456")
+        await first
+        assert hasher.rejected == 1
+        assert hasher.pending == 0
+    finally:
+        hasher.shutdown()
+
+@pytest.mark.asyncio
+async def test_hasher_restarts_after_shutdown():
+    """Teste de reinício: o pool é recriado após shutdown()"""
+    hasher = PasswordHasher(max_workers=1)
+    try:
+        hashed = await hasher.hash("password123")
+        hasher.shutdown()
+        assert await hasher.verify("password123", hashed)
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,155 @@
+import asyncio
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+import server
+from idempotency import IDEMPOTENCY_COLLECTION
+from prices import PriceFeed, StaticPriceProvider
+
+@pytest.fixture
+async def client():
+    """Cliente autenticado com usuário próprio"""
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post("/api/auth/register", json={
+            "name": "Idempotency User",
+            "email": f"idem-{uuid.uuid4().hex}@example.com",
+            "password": "password123"
+        })
+        ac.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+        yield ac
+
+BUY = {"crypto_id": "btc", "quantity": 0.5, "transaction_type": "buy"}
+
+async def btc_quantity(client):
+    wallet = (await client.get("/api/wallet")).json()
+    return sum(item["quantity"] for item in wallet if item["crypto_id"] == "btc")
+
+@pytest.mark.asyncio
+async def test_retry_replays_stored_response(client):
+    """Teste de repetição com a mesma Idempotency-Key (sem cobrança dupla)"""
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    first = await client.post("/api/transactions/buy", json=BUY, headers=headers)
+    second = await client.post("/api/transactions/buy", json=BUY, headers=headers)
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert await btc_quantity(client) == 0.5
+    history = (await client.get("/api/transactions/history")).json()
+    assert len(history) == 1
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates_execute_once(client):
+    """Teste de requisições concorrentes com a mesma chave (uma única execução)"""
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    responses = await asyncio.gather(*(
+        client.post("/api/transactions/buy", json=BUY, headers=headers) for _ in range(5)
+    ))
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.json()["id"] for response in responses}) == 1
+    assert await btc_quantity(client) == 0.5
+
+@pytest.mark.asyncio
+async def test_key_reused_with_other_payload(client):
+    """Teste de chave reutilizada com outro corpo ou rota"""
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    await client.post("/api/transactions/buy", json=BUY, headers=headers)
+    response = await client.post("/api/transactions/buy", json=dict(BUY, quantity=1), headers=headers)
+    assert response.status_code == 422
+    response = await client.post("/api/transactions/sell", json=dict(BUY, transaction_type="sell"), headers=headers)
+    assert response.status_code == 422
+
+@pytest.mark.asyncio
+async def test_client_errors_are_replayed(client):
+    """Teste de que erros 4xx também são repetidos para a mesma chave"""
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    sell = dict(BUY, transaction_type="sell")
+    first = await client.post("/api/transactions/sell", json=sell, headers=headers)
+    assert first.status_code == 400
+    await client.post("/api/transactions/buy", json=BUY)
+    second = await client.post("/api/transactions/sell", json=sell, headers=headers)
+    assert second.status_code == 400
+    assert second.json() == first.json()
+    assert await btc_quantity(client) == 0.5
+
+@pytest.mark.asyncio
+async def test_server_errors_release_the_key(client, monkeypatch):
+    """Teste de que erros 5xx antes da escrita liberam a chave para nova tentativa"""
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    live_feed = server.price_feed
+    # max_age=-1: the snapshot is always stale
+    stale_feed = PriceFeed(StaticPriceProvider(server.CRYPTO_DATA), initial=server.CRYPTO_DATA, max_age=-1)
+    monkeypatch.setattr(server, "price_feed", stale_feed)
+    response = await client.post("/api/transactions/buy", json=BUY, headers=headers)
+    assert response.status_code == 503
+    monkeypatch.setattr(server, "price_feed", live_feed)
+    response = await client.post("/api/transactions/buy", json=BUY, headers=headers)
+    assert response.status_code == 200
+    assert "Idempotent-Replayed" not in response.headers
+
+@pytest.mark.asyncio
+async def test_abandoned_claim_is_taken_over(client):
+    """Teste de chave pendente de um worker que caiu: após o lease, a nova tentativa executa"""
+    key = str(uuid.uuid4())
+    user_id = (await client.get("/api/auth/me")).json()["id"]
+    fingerprint = server.request_fingerprint("buy", server.TransactionCreate(**BUY).model_dump(mode="json"))
+    await server.idempotency_ledger.begin(user_id, key, fingerprint, "dead-worker")
+    await server.db[IDEMPOTENCY_COLLECTION].update_one(
+        {"_id": server.idempotency_ledger.record_id(user_id, key)}, {"$set": {"lease_until": 0}}
+    )
+    response = await client.post("/api/transactions/buy", json=BUY, headers={"Idempotency-Key": key})
+    assert response.status_code == 200
+    assert await btc_quantity(client) == 0.5
+    assert server.idempotency_ledger.stats()["taken_over"] >= 1
+    # A slow first attempt finds its claim gone before writing anything
+    assert not await server.idempotency_ledger.mark_writing(user_id, key, "dead-worker")
+
+@pytest.mark.asyncio
+async def test_claim_with_writes_is_not_taken_over(client):
+    """Teste de chave pendente que já começou a escrever: a nova tentativa recebe 500, sem reexecutar"""
+    key = str(uuid.uuid4())
+    user_id = (await client.get("/api/auth/me")).json()["id"]
+    fingerprint = server.request_fingerprint("buy", server.TransactionCreate(**BUY).model_dump(mode="json"))
+    await server.idempotency_ledger.begin(user_id, key, fingerprint, "dead-worker")
+    assert await server.idempotency_ledger.mark_writing(user_id, key, "dead-worker")
+    await server.db[IDEMPOTENCY_COLLECTION].update_one(
+        {"_id": server.idempotency_ledger.record_id(user_id, key)}, {"$set": {"lease_until": 0}}
+    )
+    response = await client.post("/api/transactions/buy", json=BUY, headers={"Idempotency-Key": key})
+    assert response.status_code == 500
+    assert response.headers["Idempotent-Replayed"] == "true"
+    assert await btc_quantity(client) == 0
+
+@pytest.mark.asyncio
+async def test_cancelled_request_releases_the_key(client):
+    """Teste de requisição cancelada: a chave é liberada, não fica pendente"""
+    key = str(uuid.uuid4())
+    user_id = (await client.get("/api/auth/me")).json()["id"]
+
+    async def cancelled(before_write):
+        raise asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        await server.run_idempotent(user_id, key, "buy", server.TransactionCreate(**BUY), cancelled)
+    assert await server.db[IDEMPOTENCY_COLLECTION].count_documents({}) == 0
+    response = await client.post("/api/transactions/buy", json=BUY, headers={"Idempotency-Key": key})
+    assert response.status_code == 200
+
+@pytest.mark.asyncio
+async def test_request_cancelled_after_wallet_write_is_not_retried(client):
+    """Teste de cancelamento após a escrita na carteira: a nova tentativa não compra de novo"""
+    key = str(uuid.uuid4())
+    user = await server.db.users.find_one({"id": (await client.get("/api/auth/me")).json()["id"]})
+
+    async def cancelled_after_write(before_write):
+        await server.execute_buy(server.TransactionCreate(**BUY), user, before_write)
+        raise asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        await server.run_idempotent(user["id"], key, "buy", server.TransactionCreate(**BUY), cancelled_after_write)
+    response = await client.post("/api/transactions/buy", json=BUY, headers={"Idempotency-Key": key})
+    assert response.status_code == 500
+    assert response.headers["Idempotent-Replayed"] == "true"
+    assert await btc_quantity(client) == 0.5
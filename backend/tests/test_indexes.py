@@ -0,0 +1,58 @@
+import pytest
+
+import server
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_is_idempotent():
+    """Teste de criação idempotente dos índices"""
+    await server.ensure_indexes(server.db)
+    result = await server.ensure_indexes(server.db)
+    assert result == {
+        "users.email_unique": "exists",
+        "users.id_unique": "exists",
+        "wallets.user_crypto_unique": "exists",
+        "transactions.user_timestamp_id": "exists",
+        "export_jobs.id_unique": "exists",
+        "export_jobs.active_user_unique": "exists",
+        "deletion_jobs.id_unique": "exists",
+        "job_leases.id_unique": "exists",
+        "idempotency_keys.created_at_ttl": "exists",
+        "revoked_tokens.expires_at_ttl": "exists",
+        "revoked_tokens.revoked_at": "exists",
+    }
+    wallet_indexes = await server.db.wallets.index_information()
+    assert wallet_indexes["user_crypto_unique"]["unique"]
+
+@pytest.mark.asyncio
+async def test_superseded_and_changed_indexes_are_reconciled():
+    """Teste de reconciliação: índice renomeado removido e índice alterado apenas reportado"""
+    await server.db.transactions.create_index([("user_id", 1), ("timestamp", -1)], name="user_timestamp")
+    await server.db.wallets.create_index([("user_id", 1), ("crypto_id", 1)], name="user_crypto_unique")
+    result = await server.ensure_indexes(server.db)
+    assert result["transactions.user_timestamp_id"] == "created"
+    assert result["transactions.user_timestamp"] == "dropped"
+    assert result["wallets.user_crypto_unique"].startswith("mismatch: unique")
+    assert "user_timestamp" not in await server.db.transactions.index_information()
+    # Never dropped at startup: the live index stays until an operator migrates it
+    wallet_indexes = await server.db.wallets.index_information()
+    assert "user_crypto_unique" in wallet_indexes and not wallet_indexes["user_crypto_unique"].get("unique")
+
+@pytest.mark.asyncio
+async def test_changed_ttl_is_applied_with_collmod(monkeypatch):
+    """Teste de alteração do TTL: aplicada com collMod, sem recriar o índice"""
+    await server.db.idempotency_keys.create_index(
+        [("created_at", 1)], name="created_at_ttl", expireAfterSeconds=server.IDEMPOTENCY_TTL + 60
+    )
+    commands = []
+
+    async def command(spec):
+        commands.append(spec)
+        return {"ok": 1}
+
+    monkeypatch.setattr(server.db, "command", command, raising=False)
+    result = await server.ensure_indexes(server.db)
+    assert result["idempotency_keys.created_at_ttl"] == "updated"
+    assert commands == [{
+        "collMod": "idempotency_keys",
+        "index": {"name": "created_at_ttl", "expireAfterSeconds": server.IDEMPOTENCY_TTL},
+    }]
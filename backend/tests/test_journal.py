@@ -0,0 +1,112 @@
+import asyncio
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from pymongo.errors import BulkWriteError
+
+import journal
+import server
+from journal import TransactionJournal
+
+@pytest.fixture
+async def client():
+    """Cliente autenticado com usuário próprio"""
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post("/api/auth/register", json={
+            "name": "Journal User",
+            "email": f"journal-{uuid.uuid4().hex}@example.com",
+            "password": "password123"
+        })
+        ac.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+        ac.user_id = (await ac.get("/api/auth/me")).json()["id"]
+        yield ac
+
+def record(run_id: str) -> dict:
+    return {"id": str(uuid.uuid4()), "user_id": f"journal-{run_id}", "crypto_id": "btc", "transaction_type": "buy"}
+
+@pytest.mark.asyncio
+async def test_concurrent_writes_share_one_flush():
+    """Teste de group commit: escritas concorrentes em um único insert_many"""
+    run_id = uuid.uuid4().hex
+    log = TransactionJournal(lambda: server.db, max_batch=100, max_delay=0.05)
+    await asyncio.gather(*(log.write(record(run_id)) for _ in range(20)))
+    assert log.flushes == 1
+    assert log.records == 20
+    assert await server.db.transactions.count_documents({"user_id": f"journal-{run_id}"}) == 20
+    await log.stop()
+
+@pytest.mark.asyncio
+async def test_full_batch_flushes_early():
+    """Teste de flush antecipado ao atingir max_batch"""
+    run_id = uuid.uuid4().hex
+    log = TransactionJournal(lambda: server.db, max_batch=5, max_delay=10)
+    await asyncio.wait_for(asyncio.gather(*(log.write(record(run_id)) for _ in range(10))), timeout=5)
+    assert log.flushes == 2
+    assert log.stats()["avg_batch"] == 5
+    await log.stop()
+
+@pytest.mark.asyncio
+async def test_failed_record_only_fails_its_writer():
+    """Teste de erro em um registro do lote (os demais são confirmados)"""
+    run_id = uuid.uuid4().hex
+    log = TransactionJournal(lambda: server.db, max_batch=100, max_delay=0.05)
+    duplicate = record(run_id)
+    await server.db.transactions.insert_one(dict(duplicate, _id=f"dup-{run_id}"))
+    results = await asyncio.gather(
+        log.write(record(run_id)),
+        log.write(dict(duplicate, _id=f"dup-{run_id}")),
+        log.write(record(run_id)),
+        return_exceptions=True,
+    )
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], BulkWriteError)
+    assert log.stats()["failed"] == 1
+    await log.stop()
+
+@pytest.mark.asyncio
+async def test_trades_through_journal(client):
+    """Teste de compra e venda com o journal habilitado"""
+    original = server.transaction_journal
+    server.transaction_journal = TransactionJournal(lambda: server.db, max_delay=0.01)
+    try:
+        responses = await asyncio.gather(*(
+            client.post("/api/transactions/buy", json={"crypto_id": "btc", "quantity": 0.1, "transaction_type": "buy"})
+            for _ in range(5)
+        ))
+        assert {response.status_code for response in responses} == {200}
+        response = await client.post(
+            "/api/transactions/sell", json={"crypto_id": "btc", "quantity": 0.2, "transaction_type": "sell"}
+        )
+        assert response.status_code == 200
+        history = (await client.get("/api/transactions/history")).json()
+        assert len(history) == 6
+        assert server.transaction_journal.flushes < 6
+        assert await journal.check(server.db, client.user_id) == []
+    finally:
+        await server.transaction_journal.stop()
+        server.transaction_journal = original
+
+@pytest.mark.asyncio
+async def test_check_and_repair_lost_records(client):
+    """Teste de verificação pós-crash: registros perdidos e reparo da carteira"""
+    for crypto_id in ("btc", "eth"):
+        await client.post("/api/transactions/buy", json={"crypto_id": crypto_id, "quantity": 1, "transaction_type": "buy"})
+    await client.post("/api/transactions/buy", json={"crypto_id": "btc", "quantity": 2, "transaction_type": "buy"})
+    # Simulate records still queued when the worker died
+    await server.db.transactions.delete_many({"user_id": client.user_id, "quantity": 2})
+    await server.db.transactions.delete_many({"user_id": client.user_id, "crypto_id": "eth"})
+
+    mismatches = await journal.check(server.db, client.user_id)
+    assert {mismatch["crypto_id"] for mismatch in mismatches} == {"btc", "eth"}
+    btc = next(mismatch for mismatch in mismatches if mismatch["crypto_id"] == "btc")
+    assert btc["wallet"]["buy_count"] == 2 and btc["logged"]["buy_count"] == 1
+
+    await journal.repair(server.db, mismatches)
+    assert await journal.check(server.db, client.user_id) == []
+    wallets = {
+        wallet["crypto_id"]: wallet["quantity"]
+        async for wallet in server.db.wallets.find({"user_id": client.user_id})
+    }
+    assert wallets == {"btc": 1, "eth": 0}
@@ -0,0 +1,33 @@
+import logging
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+import server
+from metrics import MetricsMiddleware, command_shape, query_shape
+
+def test_query_shape_hides_values():
+    """Teste de formato da consulta sem valores do usuário"""
+    shape = query_shape({"user_id": "abc", "quantity": {"$gte": 1.0}, "$or": [{"timestamp": {"$lt": "x"}}]})
+    assert shape == {"user_id": "?", "quantity": {"$gte": "?"}, "$or": [{"timestamp": {"$lt": "?"}}]}
+    assert command_shape("aggregate", {"pipeline": [{"$match": {}}, {"$group": {}}]}) == ["$match", "$group"]
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_route_latency():
+    """Teste do endpoint /metrics com latência por rota"""
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        await client.get("/api/cryptos")
+        response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/cryptos",status="200"}' in response.text
+    assert "app_token_cache_hits" in response.text
+
+@pytest.mark.asyncio
+async def test_slow_request_is_logged(caplog):
+    """Teste do log de requisições lentas"""
+    transport = ASGITransport(app=MetricsMiddleware(server.app, slow_request_ms=0.001))
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        with caplog.at_level(logging.WARNING, logger="metrics"):
+            await client.get("/api/cryptos")
+    assert any("Slow request GET /api/cryptos -> 200" in record.getMessage() for record in caplog.records)
@@ -0,0 +1,21 @@
+import settings
+
+def test_mongo_options_only_include_configured_values(monkeypatch):
+    """Teste das opções do pool do MongoDB lidas do ambiente"""
+    for variable in settings.MONGO_OPTIONS:
+        monkeypatch.delenv(variable, raising=False)
+    assert settings.mongo_client_options() == {}
+
+    monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "25")
+    monkeypatch.setenv("MONGO_MAX_IDLE_TIME_MS", "60000")
+    monkeypatch.setenv("MONGO_WRITE_CONCERN", "majority")
+    monkeypatch.setenv("MONGO_JOURNAL", "true")
+    assert settings.mongo_client_options() == {
+        "maxPoolSize": 25,
+        "maxIdleTimeMS": 60000,
+        "w": "majority",
+        "journal": True,
+    }
+
+    monkeypatch.setenv("MONGO_WRITE_CONCERN", "1")
+    assert settings.mongo_client_options()["w"] == 1
@@ -0,0 +1,89 @@
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+import server
+from portfolio import PORTFOLIO_COLLECTION, PortfolioRecorder, rebuild
+
+@pytest.fixture
+async def authenticated_client():
+    """Fixture para cliente autenticado"""
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post("/api/auth/register", json={
+            "name": "Portfolio Test User",
+            "email": "portfolio@example.com",
+            "password": "password123"
+        })
+        token = response.json()["access_token"]
+        ac.headers["Authorization"] = f"Bearer {token}"
+        yield ac
+
+async def buy(client, crypto_id, quantity):
+    response = await client.post("/api/transactions/buy", json={
+        "crypto_id": crypto_id,
+        "quantity": quantity,
+        "transaction_type": "buy"
+    })
+    assert response.status_code == 200
+
+@pytest.mark.asyncio
+async def test_trades_are_recorded_in_history(authenticated_client):
+    """Teste de registro da valorização da carteira após operações"""
+    await buy(authenticated_client, "btc", 0.01)
+    await buy(authenticated_client, "eth", 1.0)
+    await server.portfolio_recorder.flush()
+    
+    response = await authenticated_client.get("/api/wallet/history", params={"range": "1d"})
+    assert response.status_code == 200
+    points = response.json()
+    assert len(points) == 1
+    assert points[0]["holdings"] == {"btc": 0.01, "eth": 1.0}
+    assert points[0]["total_brl"] == 3500.0 + 18500.0
+
+@pytest.mark.asyncio
+async def test_history_invalid_range(authenticated_client):
+    """Teste de histórico da carteira com período inválido"""
+    response = await authenticated_client.get("/api/wallet/history", params={"range": "2h"})
+    assert response.status_code == 400
+    assert "Período inválido" in response.json()["detail"]
+
+@pytest.mark.asyncio
+async def test_rebuild_from_transaction_log(authenticated_client):
+    """Teste de reconstrução da série a partir das transações"""
+    await buy(authenticated_client, "ada", 100.0)
+    await authenticated_client.post("/api/transactions/sell", json={
+        "crypto_id": "ada",
+        "quantity": 40.0,
+        "transaction_type": "sell"
+    })
+    user = (await authenticated_client.get("/api/auth/me")).json()
+    
+    written = await rebuild(server.db, user["id"])
+    assert written == 2
+    points = await server.db[PORTFOLIO_COLLECTION].find({"user_id": user["id"]}).sort("ts", 1).to_list(None)
+    assert [point["holdings"] for point in points] == [{"ada": 100.0}, {"ada": 60.0}]
+    assert points[-1]["total_brl"] == 210.0
+
+@pytest.mark.asyncio
+async def test_rebuild_all_users(authenticated_client):
+    """Teste de reconstrução completa, usuário por usuário"""
+    await buy(authenticated_client, "btc", 0.5)
+    await server.db.transactions.insert_one({
+        "id": str(uuid.uuid4()), "user_id": "other", "crypto_id": "eth", "transaction_type": "buy",
+        "quantity": 2.0, "price_brl": 18500.0, "timestamp": "2026-01-01T00:00:00+00:00",
+    })
+    assert await rebuild(server.db, batch_size=1) == 2
+    points = await server.db[PORTFOLIO_COLLECTION].find({}, {"_id": 0, "user_id": 1, "holdings": 1}).to_list(None)
+    assert sorted(point["holdings"].popitem()[0] for point in points) == ["btc", "eth"]
+
+@pytest.mark.asyncio
+async def test_revalue_runs_once_per_period_across_workers(authenticated_client):
+    """Teste do lease de revalorização: um único worker grava por período"""
+    await server.ensure_indexes(server.db)
+    await buy(authenticated_client, "sol", 1.0)
+    workers = [PortfolioRecorder(lambda: server.db, lambda: server.price_feed.snapshot) for _ in range(3)]
+    written = [await worker.revalue() for worker in workers]
+    assert sorted(written) == [0, 0, 1]
+    assert await server.db[PORTFOLIO_COLLECTION].count_documents({}) == 1
@@ -0,0 +1,96 @@
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+import server
+from positions import apply_trade, new_position, recompute
+from prices import PriceFeed, StaticPriceProvider
+
+@pytest.fixture
+async def client():
+    """Cliente autenticado com usuário próprio"""
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post("/api/auth/register", json={
+            "name": "Position User",
+            "email": f"position-{uuid.uuid4().hex}@example.com",
+            "password": "password123"
+        })
+        ac.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+        yield ac
+
+def use_eth_price(monkeypatch, price):
+    cryptos = [dict(crypto, price_brl=price) if crypto["id"] == "eth" else crypto for crypto in server.CRYPTO_DATA]
+    monkeypatch.setattr(server, "price_feed", PriceFeed(StaticPriceProvider(cryptos), initial=cryptos))
+
+async def trade(client, kind, quantity):
+    response = await client.post(f"/api/transactions/{kind}", json={
+        "crypto_id": "eth", "quantity": quantity, "transaction_type": kind
+    })
+    assert response.status_code == 200
+
+async def eth_item(client):
+    return next(item for item in (await client.get("/api/wallet")).json() if item["crypto_id"] == "eth")
+
+def test_apply_trade_average_cost():
+    """Teste do custo médio e do lucro realizado"""
+    position = new_position()
+    apply_trade(position, "buy", 2, 100)
+    apply_trade(position, "buy", 2, 200)
+    apply_trade(position, "sell", 1, 300)
+    assert position["cost_brl"] == 450
+    assert position["realized_pnl_brl"] == 150
+    apply_trade(position, "sell", 3, 100)
+    assert position == {"quantity": 0, "cost_brl": 0.0, "realized_pnl_brl": 0, "buy_count": 2, "sell_count": 2}
+
+@pytest.mark.asyncio
+async def test_wallet_reports_cost_basis_and_pnl(client, monkeypatch):
+    """Teste de custo médio, P&L realizado e não realizado na carteira"""
+    use_eth_price(monkeypatch, 10000.0)
+    await trade(client, "buy", 2)
+    use_eth_price(monkeypatch, 20000.0)
+    await trade(client, "buy", 2)
+    use_eth_price(monkeypatch, 30000.0)
+    await trade(client, "sell", 1)
+
+    item = await eth_item(client)
+    assert item["quantity"] == 3
+    assert item["avg_cost_brl"] == pytest.approx(15000)
+    assert item["cost_brl"] == pytest.approx(45000)
+    assert item["realized_pnl_brl"] == pytest.approx(15000)
+    assert item["unrealized_pnl_brl"] == pytest.approx(3 * 30000 - 45000)
+    assert (item["buy_count"], item["sell_count"]) == (2, 1)
+
+@pytest.mark.asyncio
+async def test_batch_trades_keep_sequential_cost_basis(client, monkeypatch):
+    """Teste do custo médio em lotes com compras e vendas intercaladas"""
+    use_eth_price(monkeypatch, 100.0)
+    response = await client.post("/api/transactions/batch", json={"orders": [
+        {"crypto_id": "eth", "quantity": 4, "transaction_type": "buy"},
+        {"crypto_id": "eth", "quantity": 1, "transaction_type": "sell"},
+        {"crypto_id": "eth", "quantity": 1, "transaction_type": "buy"},
+    ]})
+    assert response.json()["executed"] == 3
+    item = await eth_item(client)
+    assert item["cost_brl"] == pytest.approx(400)
+    assert item["realized_pnl_brl"] == pytest.approx(0)
+    assert (item["buy_count"], item["sell_count"]) == (2, 1)
+
+@pytest.mark.asyncio
+async def test_recompute_rebuilds_positions_from_log(client, monkeypatch):
+    """Teste da reconstrução das posições a partir do histórico"""
+    use_eth_price(monkeypatch, 10000.0)
+    await trade(client, "buy", 3)
+    use_eth_price(monkeypatch, 12000.0)
+    await trade(client, "sell", 2)
+    expected = await eth_item(client)
+    user_id = (await client.get("/api/auth/me")).json()["id"]
+
+    # Carteira anterior aos campos materializados
+    await server.db.wallets.update_one(
+        {"user_id": user_id, "crypto_id": "eth"},
+        {"$set": {"cost_brl": 0.0, "realized_pnl_brl": 0.0, "buy_count": 0, "sell_count": 0}}
+    )
+    assert await recompute(server.db, user_id) == 1
+    assert await eth_item(client) == pytest.approx(expected)
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+import server
+from prices import PriceFeed, RandomWalkPriceProvider, StaticPriceProvider
+
+class FailingProvider:
+    async def fetch(self):
+        raise RuntimeError("feed offline")
+
+def with_price(crypto_id, price):
+    return [dict(crypto, price_brl=price) if crypto["id"] == crypto_id else crypto for crypto in server.CRYPTO_DATA]
+
+@pytest.mark.asyncio
+async def test_refresh_swaps_snapshot_only_on_change():
+    """Teste de troca do snapshot: a versão só muda quando os preços mudam"""
+    feed = PriceFeed(StaticPriceProvider(server.CRYPTO_DATA), initial=server.CRYPTO_DATA)
+    old_snapshot = feed.snapshot
+    await feed.refresh()
+    assert feed.snapshot.version == old_snapshot.version
+    
+    feed.provider = StaticPriceProvider(with_price("btc", 400000.0))
+    await feed.refresh()
+    assert feed.snapshot.version == old_snapshot.version + 1
+    assert feed.snapshot.get("btc")["price_brl"] == 400000.0
+    assert old_snapshot.get("btc")["price_brl"] == 350000.0
+
+@pytest.mark.asyncio
+async def test_random_walk_keeps_prices_positive():
+    """Teste do provedor simulado (passeio aleatório)"""
+    provider = RandomWalkPriceProvider(server.CRYPTO_DATA, volatility=0.5, seed=42)
+    for _ in range(50):
+        cryptos = await provider.fetch()
+    assert all(crypto["price_brl"] > 0 for crypto in cryptos)
+    assert [crypto["id"] for crypto in cryptos] == [crypto["id"] for crypto in server.CRYPTO_DATA]
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_last_snapshot_and_goes_stale():
+    """Teste de falha do provedor: mantém o último snapshot e marca como desatualizado"""
+    feed = PriceFeed(FailingProvider(), initial=server.CRYPTO_DATA, interval=0, max_age=0)
+    snapshot = feed.snapshot
+    feed.start()
+    while feed.errors == 0:
+        await asyncio.sleep(0)
+    await feed.stop()
+    assert feed.snapshot is snapshot
+    assert feed.last_error == "feed offline"
+    assert feed.is_stale
+
+@pytest.mark.asyncio
+async def test_trades_use_current_snapshot_and_reject_when_stale(monkeypatch):
+    """Teste de compra usando o snapshot atual e rejeição com cotações desatualizadas"""
+    feed = PriceFeed(StaticPriceProvider(with_price("eth", 20000.0)), initial=server.CRYPTO_DATA)
+    await feed.refresh()
+    monkeypatch.setattr(server, "price_feed", feed)
+    
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post("/api/auth/register", json={
+            "name": "Price Test User",
+            "email": "prices@example.com",
+            "password": "password123"
+        })
+        client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+        
+        buy_response = await client.post("/api/transactions/buy", json={
+            "crypto_id": "eth",
+            "quantity": 1.0,
+            "transaction_type": "buy"
+        })
+        assert buy_response.status_code == 200
+        assert buy_response.json()["price_brl"] == 20000.0
+        
+        feed.max_age = 0
+        stale_response = await client.post("/api/transactions/buy", json={
+            "crypto_id": "eth",
+            "quantity": 1.0,
+            "transaction_type": "buy"
+        })
+        assert stale_response.status_code == 503
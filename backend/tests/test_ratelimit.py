@@ -0,0 +1,157 @@
+import asyncio
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+import server
+from ratelimit import TAKE_SCRIPT, MemoryBucketStore, RateLimited, RateLimiter, RedisBucketStore, parse_rate
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class ScriptedRedis:
+    """Redis sem servidor: executa o script de token bucket em Python"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.data = {}
+
+    def register_script(self, script):
+        assert script == TAKE_SCRIPT
+
+        async def take(keys, args):
+            capacity, rate, cost = (float(arg) for arg in args)
+            now = self.clock()
+            tokens, updated = self.data.get(keys[0], (capacity, now))
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self.data[keys[0]] = (tokens, now)
+            return f"{wait:.6f}".encode()
+
+        return take
+
+class DownRedis:
+    def register_script(self, script):
+        async def take(keys, args):
+            raise ConnectionError("redis down")
+
+        return take
+
+@pytest.fixture
+async def client():
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        yield ac
+
+@pytest.mark.asyncio
+async def test_bucket_allows_burst_then_refills():
+    """Teste do token bucket: rajada permitida e reposição ao longo do tempo"""
+    clock = FakeClock()
+    limiter = RateLimiter(MemoryBucketStore(clock=clock), {"login": "3/30"})
+    for _ in range(3):
+        await limiter.hit("login", "1.2.3.4")
+    with pytest.raises(RateLimited) as exc:
+        await limiter.hit("login", "1.2.3.4")
+    assert exc.value.retry_after == pytest.approx(10)
+    # Outra chave tem o próprio bucket
+    await limiter.hit("login", "5.6.7.8")
+    clock.now = 10
+    await limiter.hit("login", "1.2.3.4")
+    assert limiter.stats()["limited"] == 1
+
+@pytest.mark.asyncio
+async def test_bucket_store_is_bounded():
+    """Teste do limite de memória do backend em memória (LRU)"""
+    store = MemoryBucketStore(maxsize=2)
+    for key in ("a", "b", "c"):
+        await store.take(key, 1, 1)
+    assert store.stats() == {"size": 2, "maxsize": 2, "evictions": 1}
+
+@pytest.mark.asyncio
+async def test_shared_store_limits_across_workers():
+    """Teste do store compartilhado: dois workers gastam o mesmo bucket"""
+    clock = FakeClock()
+    backend = ScriptedRedis(clock)
+    worker_a = RateLimiter(RedisBucketStore(backend), {"login": "2/60"})
+    worker_b = RateLimiter(RedisBucketStore(backend), {"login": "2/60"})
+    await worker_a.hit("login", "1.2.3.4")
+    await worker_b.hit("login", "1.2.3.4")
+    with pytest.raises(RateLimited) as exc:
+        await worker_a.hit("login", "1.2.3.4")
+    assert exc.value.retry_after == pytest.approx(30)
+    assert list(backend.data) == ["ratelimit:login:1.2.3.4"]
+
+@pytest.mark.asyncio
+async def test_shared_store_fails_open():
+    """Teste de falha do Redis: as requisições passam e o erro é contado"""
+    limiter = RateLimiter(RedisBucketStore(DownRedis()), {"login": "1/60"})
+    await limiter.hit("login", "1.2.3.4")
+    await limiter.hit("login", "1.2.3.4")
+    assert limiter.stats()["errors"] == 2
+
+def test_disabled_rule():
+    """Teste de regra desabilitada com "0\""""
+    assert parse_rate("0") is None
+    assert parse_rate("10/60") == (10, pytest.approx(10 / 60))
+
+@pytest.mark.asyncio
+async def test_login_returns_429_with_retry_after(client):
+    """Teste de bloqueio de login por email com 429 e Retry-After"""
+    email = f"throttle-{uuid.uuid4().hex}@example.com"
+    capacity, _ = server.rate_limiter.rules["login_email"]
+    statuses = [
+        (await client.post("/api/auth/login", json={"email": email, "password": "wrong"})).status_code
+        for _ in range(int(capacity) + 1)
+    ]
+    assert statuses[:-1] == [401] * int(capacity)
+    response = await client.post("/api/auth/login", json={"email": email, "password": "wrong"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+@pytest.mark.asyncio
+async def test_credential_stuffing_keeps_hashing_bounded(client, monkeypatch):
+    """Teste de que um ataque de credential stuffing não multiplica o trabalho de bcrypt"""
+    response = await client.post("/api/auth/register", json={
+        "name": "Victim", "email": f"victim-{uuid.uuid4().hex}@example.com", "password": "password123"
+    })
+    victim = response.json()["user"]["email"]
+    calls = 0
+    verify = server.password_hasher.verify
+
+    async def counting_verify(plain_password, hashed_password):
+        nonlocal calls
+        calls += 1
+        return await verify(plain_password, hashed_password)
+
+    monkeypatch.setattr(server.password_hasher, "verify", counting_verify)
+    responses = await asyncio.gather(*(
+        client.post("/api/auth/login", json={"email": victim, "password": f"guess-{i}"}) for i in range(100)
+    ))
+    statuses = [response.status_code for response in responses]
+    login_ip, _ = server.rate_limiter.rules["login_ip"]
+    login_email, _ = server.rate_limiter.rules["login_email"]
+    assert calls <= min(login_ip, login_email)
+    assert statuses.count(429) >= 100 - min(login_ip, login_email)
+    assert set(statuses) <= {401, 429}
+
+@pytest.mark.asyncio
+async def test_register_is_throttled_per_email(client):
+    """Teste de bloqueio de cadastro por email, independente do IP"""
+    email = f"signup-{uuid.uuid4().hex}@example.com"
+    capacity, _ = server.rate_limiter.rules["register_email"]
+    for _ in range(int(capacity)):
+        await client.post("/api/auth/register", json={"name": "Spam", "email": email, "password": "password123"})
+    response = await client.post("/api/auth/register", json={
+        "name": "Spam", "email": email.upper(), "password": "password123"
+    })
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
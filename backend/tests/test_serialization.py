@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+import server
+from prices import PriceFeed, StaticPriceProvider
+from serialization import CachedPayload, etag_matches, fast_json, row_projector
+
+def test_row_projector_matches_model_dump():
+    """Teste da projeção direta dos documentos no formato do response_model"""
+    document = {
+        "_id": "mongo-id", "id": "t1", "user_id": "u1", "crypto_id": "btc", "crypto_name": "Bitcoin",
+        "crypto_symbol": "BTC", "transaction_type": "buy", "quantity": 1, "price_brl": 350000,
+        "total_brl": 350000.0, "timestamp": "2025-01-01T00:00:00+00:00", "batch_id": "extra",
+    }
+    projected = row_projector(server.Transaction)(document)
+    assert projected == server.Transaction(**document).model_dump()
+    assert list(projected) == list(server.Transaction.model_fields)
+    assert isinstance(projected["quantity"], float)
+
+def test_fast_json_renders_like_response_model():
+    """Teste de que o JSON rápido é idêntico ao serializado via pydantic"""
+    cryptos = list(server.CRYPTO_DATA)
+    response = fast_json(map(server.crypto_row, cryptos), headers={"X-Next-Cursor": "abc"})
+    expected = [server.Crypto(**crypto).model_dump(mode="json") for crypto in cryptos]
+    assert json.loads(response.body) == expected
+    assert response.headers["X-Next-Cursor"] == "abc"
+
+def test_etag_matching():
+    """Teste da comparação de If-None-Match com o ETag"""
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert etag_matches("*", '"b"')
+    assert not etag_matches('"a"', '"b"')
+    assert not etag_matches(None, '"b"')
+
+def test_cached_payload_rebuilds_only_on_new_source():
+    """Teste de que o payload só é reconstruído quando a fonte muda"""
+    payload = CachedPayload(lambda source: json.dumps(source).encode())
+    first, second = ["a"], ["b"]
+    body, etag = payload.get(first)
+    assert payload.get(first) == (body, etag)
+    assert payload.get(second)[1] != etag
+    assert payload.builds == 2
+
+@pytest.mark.asyncio
+async def test_cached_payload_keyed_on_price_version():
+    """Teste de que um refresh sem mudança de preços não reserializa /cryptos"""
+    feed = PriceFeed(StaticPriceProvider(server.CRYPTO_DATA), initial=server.CRYPTO_DATA)
+    payload = CachedPayload(lambda prices: json.dumps(list(prices.cryptos)).encode(), key=lambda prices: prices.version)
+    body, etag = payload.get(feed.snapshot)
+    await feed.refresh()
+    assert payload.get(feed.snapshot) == (body, etag)
+    assert payload.builds == 1
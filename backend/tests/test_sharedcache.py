@@ -0,0 +1,192 @@
+import asyncio
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+import server
+from sharedcache import FakeRedis, ReadThroughCache, build_backend
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+class BrokenBackend:
+    async def mget(self, keys, *args):
+        raise ConnectionError("redis down")
+
+    async def set(self, *args, **kwargs):
+        raise ConnectionError("redis down")
+
+class CountingLoader:
+    def __init__(self, value, delay: float = 0.0):
+        self.value = value
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.value
+
+@pytest.fixture
+async def cached_client():
+    """Cliente autenticado com o cache de carteira em um FakeRedis"""
+    original = server.wallet_cache
+    server.wallet_cache = ReadThroughCache(FakeRedis(), "wallet")
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post("/api/auth/register", json={
+            "name": "Cache User",
+            "email": f"cache-{uuid.uuid4().hex}@example.com",
+            "password": "password123"
+        })
+        ac.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+        yield ac
+    server.wallet_cache = original
+
+@pytest.mark.asyncio
+async def test_fake_redis_ttl_and_nx():
+    """Teste do FakeRedis: expiração e SET NX como no Redis"""
+    clock = FakeClock()
+    backend = FakeRedis(clock=clock)
+    assert await backend.set("lock", b"1", px=500, nx=True)
+    assert await backend.set("lock", b"1", px=500, nx=True) is None
+    assert await backend.mget(["lock", "missing"]) == [b"1", None]
+    clock.now += 0.5
+    assert await backend.get("lock") is None
+    assert await backend.set("lock", "2", ex=1, nx=True)
+    assert await backend.delete("lock", "missing") == 1
+
+def test_build_backend():
+    """Teste da escolha do backend pela URL"""
+    assert build_backend("") is None
+    assert isinstance(build_backend("memory"), FakeRedis)
+    assert isinstance(build_backend("sharedcache:FakeRedis"), FakeRedis)
+    with pytest.raises(ValueError):
+        build_backend("memcached")
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_load_once():
+    """Teste de single-flight: leituras concorrentes carregam uma única vez"""
+    cache = ReadThroughCache(FakeRedis(), "wallet")
+    loader = CountingLoader([{"crypto_id": "btc", "quantity": 1.0}], delay=0.05)
+    results = await asyncio.gather(*(cache.get("user", loader) for _ in range(20)))
+    assert loader.calls == 1
+    assert all(result == loader.value for result in results)
+    assert await cache.get("user", loader) == loader.value
+    assert loader.calls == 1
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["coalesced"] == 19 and stats["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_workers_share_one_load():
+    """Teste de single-flight entre workers com o lock no backend compartilhado"""
+    backend = FakeRedis()
+    worker_a = ReadThroughCache(backend, "wallet", poll_interval=0.005)
+    worker_b = ReadThroughCache(backend, "wallet", poll_interval=0.005)
+    loader = CountingLoader({"total": 1}, delay=0.05)
+    first, second = await asyncio.gather(worker_a.get("user", loader), worker_b.get("user", loader))
+    assert first == second == {"total": 1}
+    assert loader.calls == 1
+
+@pytest.mark.asyncio
+async def test_invalidation_during_load_is_not_cached():
+    """Teste de invalidação durante a carga: o valor antigo não fica no cache"""
+    cache = ReadThroughCache(FakeRedis(), "wallet")
+    stale = CountingLoader("old", delay=0.05)
+    load = asyncio.ensure_future(cache.get("user", stale))
+    await asyncio.sleep(0.01)
+    await cache.invalidate("user")
+    assert await load == "old"
+    assert await cache.get("user", CountingLoader("new")) == "new"
+
+@pytest.mark.asyncio
+async def test_read_after_invalidation_does_not_join_older_load():
+    """Teste de leitura após invalidação: não reaproveita a carga iniciada antes da escrita"""
+    cache = ReadThroughCache(FakeRedis(), "wallet")
+    before = asyncio.ensure_future(cache.get("user", CountingLoader("old", delay=0.05)))
+    await asyncio.sleep(0.01)
+    await cache.invalidate("user")
+    fresh = CountingLoader("new")
+    assert await cache.get("user", fresh) == "new"
+    assert fresh.calls == 1
+    assert await before == "old"
+    assert await cache.get("user", CountingLoader("newer")) == "new"
+
+@pytest.mark.asyncio
+async def test_entries_expire_after_ttl():
+    """Teste de expiração das entradas pelo TTL"""
+    clock = FakeClock()
+    cache = ReadThroughCache(FakeRedis(clock=clock), "wallet", ttl=30)
+    await cache.get("user", CountingLoader("first"))
+    clock.now += 29
+    assert await cache.get("user", CountingLoader("second")) == "first"
+    clock.now += 2
+    assert await cache.get("user", CountingLoader("second")) == "second"
+
+@pytest.mark.asyncio
+async def test_backend_errors_fall_back_to_loader():
+    """Teste de falha do backend: a leitura vai direto ao MongoDB"""
+    cache = ReadThroughCache(BrokenBackend(), "wallet")
+    assert await cache.get("user", CountingLoader("value")) == "value"
+    await cache.invalidate("user")
+    assert cache.stats()["errors"] == 2
+
+@pytest.mark.asyncio
+async def test_trades_invalidate_cached_wallet(cached_client):
+    """Teste de invalidação da carteira em cache por compra e venda"""
+    await cached_client.post("/api/transactions/buy", json={"crypto_id": "btc", "quantity": 1, "transaction_type": "buy"})
+    wallet = (await cached_client.get("/api/wallet")).json()
+    assert [item["quantity"] for item in wallet] == [1]
+    await cached_client.get("/api/wallet/balance")
+    assert server.wallet_cache.stats()["hits"] == 1
+
+    await cached_client.post("/api/transactions/buy", json={"crypto_id": "btc", "quantity": 2, "transaction_type": "buy"})
+    wallet = (await cached_client.get("/api/wallet")).json()
+    assert [item["quantity"] for item in wallet] == [3]
+
+    await cached_client.post("/api/transactions/sell", json={"crypto_id": "btc", "quantity": 3, "transaction_type": "sell"})
+    assert (await cached_client.get("/api/wallet")).json() == []
+    assert (await cached_client.get("/api/wallet/balance")).json() == {"total_brl": 0.0}
+
+@pytest.mark.asyncio
+async def test_batch_and_deletion_invalidate_cached_wallet(cached_client):
+    """Teste de invalidação por lote de ordens e exclusão de conta"""
+    user_id = (await cached_client.get("/api/auth/me")).json()["id"]
+    await cached_client.get("/api/wallet")
+    response = await cached_client.post("/api/transactions/batch", json={"orders": [
+        {"crypto_id": "btc", "quantity": 1, "transaction_type": "buy"},
+        {"crypto_id": "eth", "quantity": 2, "transaction_type": "buy"},
+    ]})
+    assert response.status_code == 200
+    wallet = (await cached_client.get("/api/wallet")).json()
+    assert {item["crypto_id"] for item in wallet} == {"btc", "eth"}
+
+    await cached_client.delete("/api/auth/delete")
+    # Straight from the cache, as another worker would read it
+    holdings = await server.wallet_cache.get(user_id, CountingLoader([]))
+    assert holdings == []
+
+@pytest.mark.asyncio
+async def test_uncached_wallet_is_valued_in_mongo(monkeypatch):
+    """Teste sem cache: carteira e saldo valorizados pelo pipeline de agregação"""
+    monkeypatch.setattr(server, "wallet_cache", ReadThroughCache(None, "wallet"))
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post("/api/auth/register", json={
+            "name": "Uncached User", "email": f"uncached-{uuid.uuid4().hex}@example.com", "password": "password123"
+        })
+        ac.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+        async def no_find(*args, **kwargs):
+            raise AssertionError("holdings loaded into Python")
+
+        monkeypatch.setattr(server, "load_holdings", no_find)
+        await ac.post("/api/transactions/buy", json={"crypto_id": "eth", "quantity": 2, "transaction_type": "buy"})
+        wallet = (await ac.get("/api/wallet")).json()
+        assert [(item["crypto_id"], item["total_brl"]) for item in wallet] == [("eth", 37000.0)]
+        assert (await ac.get("/api/wallet/balance")).json() == {"total_brl": 37000.0}
@@ -0,0 +1,178 @@
+import uuid
+
+import jwt
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+import server
+from tokens import ACCESS, REFRESH, BloomFilter, KeyRing, Revocations, generate_key, write_key
+
+@pytest.fixture
+async def client():
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        yield ac
+
+async def register(client) -> dict:
+    response = await client.post("/api/auth/register", json={
+        "name": "Token User",
+        "email": f"tokens-{uuid.uuid4().hex}@example.com",
+        "password": "password123"
+    })
+    assert response.status_code == 200
+    return response.json()
+
+def bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_key_rotation(tmp_path):
+    """Teste de rotação de chaves: a mais nova assina, as antigas ainda verificam"""
+    write_key(tmp_path, "2026-01", generate_key("EdDSA"))
+    old_token = KeyRing(tmp_path).encode({"sub": "u", "typ": ACCESS, "jti": "1", "iat": 0, "exp": 2**33})
+    write_key(tmp_path, "2026-02", generate_key("RS256"))
+    ring = KeyRing(tmp_path)
+    assert ring.active.kid == "2026-02" and ring.active.algorithm == "RS256"
+    assert ring.decode(old_token, ACCESS)["sub"] == "u"
+    new_token = ring.encode({"sub": "u", "typ": ACCESS, "jti": "2", "iat": 0, "exp": 2**33})
+    assert jwt.get_unverified_header(new_token)["kid"] == "2026-02"
+    assert KeyRing(tmp_path, active_kid="2026-01").active.kid == "2026-01"
+
+    (tmp_path / "2026-01.pem").unlink()
+    with pytest.raises(jwt.InvalidTokenError):
+        KeyRing(tmp_path).decode(old_token, ACCESS)
+
+def test_unknown_kid_reloads_the_directory(tmp_path):
+    """Teste de rotação com restart gradual: kid novo recarrega as chaves do diretório"""
+    clock = FakeClock()
+    write_key(tmp_path, "2026-01", generate_key("EdDSA"))
+    old_worker = KeyRing(tmp_path, clock=clock)
+    assert old_worker.active.kid == "2026-01"
+    write_key(tmp_path, "2026-02", generate_key("EdDSA"))
+    token = KeyRing(tmp_path).encode({"sub": "u", "typ": ACCESS, "jti": "1", "iat": 0, "exp": 2**33})
+    clock.now += 1
+    assert old_worker.decode(token, ACCESS)["sub"] == "u"
+    assert old_worker.active.kid == "2026-02"
+
+    # Bogus kids do not re-read the directory on every request
+    forged = jwt.encode({"sub": "u"}, "secret", algorithm="HS256", headers={"kid": "nope"})
+    with pytest.raises(jwt.InvalidTokenError):
+        old_worker.decode(forged, ACCESS)
+    assert not old_worker.reload()
+
+def test_empty_key_directory_gets_a_key(tmp_path):
+    """Teste de geração automática de chave em diretório vazio"""
+    ring = KeyRing(tmp_path / "keys")
+    assert ring.active.algorithm == "EdDSA"
+    assert [path.stem for path in (tmp_path / "keys").glob("*.pem")] == [ring.active.kid]
+
+@pytest.mark.asyncio
+async def test_jwks_verifies_issued_tokens(client):
+    """Teste do endpoint JWKS: a chave pública publicada verifica o token"""
+    tokens = await register(client)
+    response = await client.get("/.well-known/jwks.json")
+    assert response.status_code == 200
+    assert "max-age" in response.headers["Cache-Control"]
+    keys = {key["kid"]: key for key in response.json()["keys"]}
+    header = jwt.get_unverified_header(tokens["access_token"])
+    assert "d" not in keys[header["kid"]]
+    public_key = jwt.PyJWK(keys[header["kid"]])
+    claims = jwt.decode(tokens["access_token"], public_key.key, algorithms=[header["alg"]])
+    assert claims["sub"] == tokens["user"]["id"]
+    assert claims["exp"] - claims["iat"] <= server.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+@pytest.mark.asyncio
+async def test_refresh_token_is_single_use(client):
+    """Teste de refresh: novo par de tokens e reuso do refresh rejeitado"""
+    tokens = await register(client)
+    response = await client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    renewed = response.json()
+    assert renewed["user"]["id"] == tokens["user"]["id"]
+    assert renewed["expires_in"] == server.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    assert (await client.get("/api/auth/me", headers=bearer(renewed["access_token"]))).status_code == 200
+
+    response = await client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+
+@pytest.mark.asyncio
+async def test_token_types_are_not_interchangeable(client):
+    """Teste de uso de refresh token como access token e vice-versa"""
+    tokens = await register(client)
+    assert (await client.get("/api/auth/me", headers=bearer(tokens["refresh_token"]))).status_code == 401
+    response = await client.post("/api/auth/refresh", json={"refresh_token": tokens["access_token"]})
+    assert response.status_code == 401
+
+@pytest.mark.asyncio
+async def test_logout_revokes_tokens(client):
+    """Teste de logout: access e refresh token revogados"""
+    tokens = await register(client)
+    headers = bearer(tokens["access_token"])
+    assert (await client.get("/api/auth/me", headers=headers)).status_code == 200
+    response = await client.post("/api/auth/logout", json={"refresh_token": tokens["refresh_token"]}, headers=headers)
+    assert response.status_code == 200
+    response = await client.get("/api/auth/me", headers=headers)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token revogado"
+    response = await client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+
+@pytest.mark.asyncio
+async def test_user_revocation_spares_later_tokens():
+    """Teste de revogação por usuário: tokens emitidos depois continuam válidos"""
+    user_id = str(uuid.uuid4())
+    revocations = Revocations(lambda: server.db, ttl=900)
+    before = jwt.decode(server.create_access_token(user_id), options={"verify_signature": False})
+    await revocations.revoke_user(user_id, 3600)
+    after = jwt.decode(server.create_access_token(user_id), options={"verify_signature": False})
+    assert revocations.maybe_revoked(before["jti"], user_id)
+    assert await revocations.is_revoked(before["jti"], user_id, before["iat"])
+    assert not await revocations.is_revoked(after["jti"], user_id, after["iat"])
+    assert revocations.stats()["false_positives"] == 1
+
+@pytest.mark.asyncio
+async def test_revocations_sync_between_workers():
+    """Teste de sincronização: revogação feita por outro worker chega no sync"""
+    clock = FakeClock()
+    worker_a = Revocations(lambda: server.db, ttl=900, clock=clock)
+    worker_b = Revocations(lambda: server.db, ttl=900, clock=clock)
+    claims = {"jti": uuid.uuid4().hex, "typ": ACCESS, "exp": clock.now + 900}
+    assert await worker_a.revoke_token(claims)
+    assert not await worker_a.revoke_token(claims)
+    assert not worker_b.maybe_revoked(claims["jti"], "someone")
+    await worker_b.sync()
+    assert worker_b.maybe_revoked(claims["jti"], "someone")
+
+    refresh = {"jti": uuid.uuid4().hex, "typ": REFRESH, "exp": clock.now + 86400}
+    await worker_a.revoke_token(refresh)
+    await worker_b.sync()
+    # Refresh tokens are always checked in Mongo, so they stay out of the filter
+    assert not worker_b.maybe_revoked(refresh["jti"], "someone")
+
+@pytest.mark.asyncio
+async def test_revocation_filter_expires_with_token_lifetime():
+    """Teste de expiração das gerações do filtro após a vida do access token"""
+    clock = FakeClock()
+    revocations = Revocations(lambda: server.db, ttl=900, clock=clock)
+    claims = {"jti": uuid.uuid4().hex, "typ": ACCESS, "exp": clock.now + 900}
+    await revocations.revoke_token(claims)
+    clock.now += 900
+    assert revocations.maybe_revoked(claims["jti"], "someone")
+    clock.now += 900
+    assert not revocations.maybe_revoked(claims["jti"], "someone")
+    assert revocations.stats()["entries"] == 0
+
+def test_bloom_filter_has_no_false_negatives():
+    """Teste do bloom filter: sem falsos negativos e taxa de falsos positivos baixa"""
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f"jti:{i}")
+    assert all(f"jti:{i}" in bloom for i in range(1000))
+    false_positives = sum(f"other:{i}" in bloom for i in range(10000))
+    assert false_positives < 300
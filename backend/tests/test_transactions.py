@@ -1,6 +1,12 @@
+import asyncio
+import json
+
 import pytest
 from httpx import AsyncClient, ASGITransport
-from server import app
+from pymongo.errors import BulkWriteError
+import server
+from prices import PriceFeed, StaticPriceProvider
+from server import Transaction, app
 
 @pytest.fixture
 async def authenticated_client():
@@ -26,6 +32,28 @@ async def test_get_cryptos(authenticated_client):
     assert len(data) > 0
     assert data[0]["symbol"] == "BTC"
 
+@pytest.mark.asyncio
+async def test_cryptos_etag_and_not_modified(authenticated_client, monkeypatch):
+    """Teste do ETag e do 304 em /api/cryptos"""
+    response = await authenticated_client.get("/api/cryptos")
+    etag = response.headers["ETag"]
+    assert "max-age" in response.headers["Cache-Control"]
+    
+    response = await authenticated_client.get("/api/cryptos", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+    
+    # Novas cotações geram outro ETag
+    cryptos = [dict(crypto, price_brl=crypto["price_brl"] * 2) for crypto in server.CRYPTO_DATA]
+    monkeypatch.setattr(server.price_feed, "snapshot", server.price_feed.snapshot)
+    monkeypatch.setattr(server.price_feed, "provider", StaticPriceProvider(cryptos))
+    await server.price_feed.refresh()
+    response = await authenticated_client.get("/api/cryptos", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()[0]["price_brl"] == cryptos[0]["price_brl"]
+
 @pytest.mark.asyncio
 async def test_buy_crypto(authenticated_client):
     """Teste de compra de criptomoeda"""
@@ -121,4 +149,230 @@ async def test_get_wallet_balance(authenticated_client):
     assert response.status_code == 200
     data = response.json()
     assert "total_brl" in data
-    assert data["total_brl"] > 0
\ No newline at end of file
+    assert data["total_brl"] > 0
+
+@pytest.mark.asyncio
+async def test_concurrent_buys_keep_balance(authenticated_client):
+    """Teste de compras concorrentes: nenhuma atualização da carteira é perdida"""
+    # credit_wallet relies on the unique (user_id, crypto_id) index
+    await server.ensure_indexes(server.db)
+    responses = await asyncio.gather(*(
+        authenticated_client.post("/api/transactions/buy", json={
+            "crypto_id": "sol",
+            "quantity": 1.0,
+            "transaction_type": "buy"
+        })
+        for _ in range(20)
+    ))
+    assert all(r.status_code == 200 for r in responses)
+    
+    wallet = (await authenticated_client.get("/api/wallet")).json()
+    sol_item = next(item for item in wallet if item["crypto_id"] == "sol")
+    assert sol_item["quantity"] == 20.0
+    assert await server.db.wallets.count_documents({"crypto_id": "sol"}) == 1
+
+@pytest.mark.asyncio
+async def test_concurrent_sells_never_overdraw(authenticated_client):
+    """Teste de vendas concorrentes: o saldo nunca fica negativo"""
+    await authenticated_client.post("/api/transactions/buy", json={
+        "crypto_id": "bnb",
+        "quantity": 5.0,
+        "transaction_type": "buy"
+    })
+    responses = await asyncio.gather(*(
+        authenticated_client.post("/api/transactions/sell", json={
+            "crypto_id": "bnb",
+            "quantity": 1.0,
+            "transaction_type": "sell"
+        })
+        for _ in range(10)
+    ))
+    assert sum(r.status_code == 200 for r in responses) == 5
+    assert sum(r.status_code == 400 for r in responses) == 5
+    
+    wallet = (await authenticated_client.get("/api/wallet")).json()
+    assert not any(item["crypto_id"] == "bnb" for item in wallet)
+    
+    history = (await authenticated_client.get("/api/transactions/history")).json()
+    assert sum(t["transaction_type"] == "sell" for t in history) == 5
+
+@pytest.mark.asyncio
+async def test_history_cursor_pagination(authenticated_client):
+    """Teste de paginação do histórico por cursor"""
+    for _ in range(3):
+        await authenticated_client.post("/api/transactions/buy", json={
+            "crypto_id": "ada",
+            "quantity": 1.0,
+            "transaction_type": "buy"
+        })
+    
+    first_page = await authenticated_client.get("/api/transactions/history", params={"limit": 2})
+    assert first_page.status_code == 200
+    assert len(first_page.json()) == 2
+    cursor = first_page.headers["X-Next-Cursor"]
+    
+    second_page = await authenticated_client.get("/api/transactions/history", params={"limit": 2, "cursor": cursor})
+    assert second_page.status_code == 200
+    assert len(second_page.json()) == 1
+    assert "X-Next-Cursor" not in second_page.headers
+    
+    ids = [t["id"] for t in first_page.json() + second_page.json()]
+    assert len(set(ids)) == 3
+
+@pytest.mark.asyncio
+async def test_history_invalid_cursor(authenticated_client):
+    """Teste de histórico com cursor inválido"""
+    response = await authenticated_client.get("/api/transactions/history", params={"cursor": "invalido"})
+    assert response.status_code == 400
+    assert "Cursor inválido" in response.json()["detail"]
+
+@pytest.mark.asyncio
+async def test_history_stream_ndjson(authenticated_client):
+    """Teste de exportação do histórico em NDJSON"""
+    for crypto_id in ("btc", "eth"):
+        await authenticated_client.post("/api/transactions/buy", json={
+            "crypto_id": crypto_id,
+            "quantity": 0.01,
+            "transaction_type": "buy"
+        })
+    
+    response = await authenticated_client.get("/api/transactions/history/stream")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["crypto_id"] for row in rows] == ["eth", "btc"]
+    assert set(rows[0]) == set(Transaction.model_fields)
+
+@pytest.mark.asyncio
+async def test_wallet_with_many_assets_is_not_truncated(authenticated_client, monkeypatch):
+    """Teste de carteira com mais de 100 ativos (sem truncamento)"""
+    cryptos = [
+        {"id": f"c{i}", "name": f"Coin {i}", "symbol": f"C{i}", "price_brl": float(i + 1), "icon": "C"}
+        for i in range(150)
+    ]
+    monkeypatch.setattr(server, "price_feed", PriceFeed(StaticPriceProvider(cryptos), initial=cryptos))
+    user = (await authenticated_client.get("/api/auth/me")).json()
+    await server.db.wallets.insert_many([
+        {"user_id": user["id"], "crypto_id": crypto["id"], "quantity": 2.0} for crypto in cryptos
+    ])
+    
+    wallet = (await authenticated_client.get("/api/wallet")).json()
+    assert len(wallet) == 150
+    assert wallet[149]["total_brl"] == 300.0
+    
+    balance = (await authenticated_client.get("/api/wallet/balance")).json()
+    assert balance["total_brl"] == sum(2.0 * crypto["price_brl"] for crypto in cryptos)
+
+@pytest.mark.asyncio
+async def test_batch_trade_reports_per_order_results(authenticated_client):
+    """Teste de lote de ordens com resultado por ordem"""
+    response = await authenticated_client.post("/api/transactions/batch", json={"orders": [
+        {"crypto_id": "eth", "quantity": 2.0, "transaction_type": "buy"},
+        {"crypto_id": "eth", "quantity": 0.5, "transaction_type": "sell"},
+        {"crypto_id": "invalid", "quantity": 1.0, "transaction_type": "buy"},
+        {"crypto_id": "sol", "quantity": 1.0, "transaction_type": "sell"},
+    ]})
+    assert response.status_code == 200
+    data = response.json()
+    assert [r["status"] for r in data["results"]] == ["ok", "ok", "error", "error"]
+    assert "não encontrada" in data["results"][2]["detail"]
+    assert "insuficiente" in data["results"][3]["detail"]
+    assert data["executed"] == 2
+    assert data["failed"] == 2
+    
+    wallet = (await authenticated_client.get("/api/wallet")).json()
+    eth_item = next(item for item in wallet if item["crypto_id"] == "eth")
+    assert eth_item["quantity"] == 1.5
+    
+    history = (await authenticated_client.get("/api/transactions/history")).json()
+    assert len(history) == 2
+
+@pytest.mark.asyncio
+async def test_batch_trade_all_or_nothing(authenticated_client):
+    """Teste de lote tudo-ou-nada: uma ordem inválida cancela todas"""
+    response = await authenticated_client.post("/api/transactions/batch", json={
+        "all_or_nothing": True,
+        "orders": [
+            {"crypto_id": "btc", "quantity": 1.0, "transaction_type": "buy"},
+            {"crypto_id": "ada", "quantity": 10.0, "transaction_type": "sell"},
+        ]
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert [r["status"] for r in data["results"]] == ["aborted", "error"]
+    assert data["executed"] == 0
+    
+    wallet = (await authenticated_client.get("/api/wallet")).json()
+    assert wallet == []
+    history = (await authenticated_client.get("/api/transactions/history")).json()
+    assert history == []
+
+@pytest.mark.asyncio
+async def test_batch_trade_survives_concurrent_first_buy(authenticated_client, monkeypatch):
+    """Teste de lote com compra concorrente vencendo o índice único da carteira"""
+    user_id = (await authenticated_client.get("/api/auth/me")).json()["id"]
+    price = server.price_feed.snapshot.get("btc")["price_brl"]
+    collection_type = type(server.db.wallets)
+    bulk_write = collection_type.bulk_write
+    raced = []
+
+    async def racing_bulk_write(collection, requests, ordered=True):
+        if raced:
+            return await bulk_write(collection, requests, ordered=ordered)
+        raced.append(True)
+        # The other request's upsert lands between our read and our write,
+        # so the btc upsert hits the unique index as it would in MongoDB
+        await server.credit_wallet(user_id, "btc", 1.0, price)
+        others = await bulk_write(collection, requests[1:], ordered=ordered)
+        raise BulkWriteError({
+            "writeErrors": [{"index": 0, "code": 11000, "errmsg": "E11000 duplicate key error"}],
+            "nMatched": others.matched_count,
+            "nUpserted": others.upserted_count,
+        })
+
+    monkeypatch.setattr(collection_type, "bulk_write", racing_bulk_write)
+    response = await authenticated_client.post("/api/transactions/batch", json={"orders": [
+        {"crypto_id": "btc", "quantity": 2.0, "transaction_type": "buy"},
+        {"crypto_id": "eth", "quantity": 1.0, "transaction_type": "buy"},
+    ]})
+    assert response.status_code == 200
+    assert raced and response.json()["executed"] == 2
+
+    wallet = {item["crypto_id"]: item["quantity"] for item in (await authenticated_client.get("/api/wallet")).json()}
+    assert wallet == {"btc": 3.0, "eth": 1.0}
+    history = (await authenticated_client.get("/api/transactions/history")).json()
+    assert len(history) == 2
+
+@pytest.mark.asyncio
+async def test_batch_write_error_is_compensated(authenticated_client, monkeypatch):
+    """Teste de lote tudo-ou-nada com erro de escrita: as atualizações aplicadas são desfeitas"""
+    collection_type = type(server.db.wallets)
+    bulk_write = collection_type.bulk_write
+    failed = []
+
+    async def failing_bulk_write(collection, requests, ordered=True):
+        if failed:
+            return await bulk_write(collection, requests, ordered=ordered)
+        failed.append(True)
+        others = await bulk_write(collection, requests[1:], ordered=ordered)
+        raise BulkWriteError({
+            "writeErrors": [{"index": 0, "code": 121, "errmsg": "Document failed validation"}],
+            "nMatched": others.matched_count,
+            "nUpserted": others.upserted_count,
+        })
+
+    monkeypatch.setattr(collection_type, "bulk_write", failing_bulk_write)
+    response = await authenticated_client.post("/api/transactions/batch", json={
+        "all_or_nothing": True,
+        "orders": [
+            {"crypto_id": "btc", "quantity": 2.0, "transaction_type": "buy"},
+            {"crypto_id": "eth", "quantity": 1.0, "transaction_type": "buy"},
+        ]
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert [r["status"] for r in data["results"]] == ["error", "aborted"]
+    assert data["results"][0]["detail"] == "Erro ao atualizar a carteira"
+
+    assert (await authenticated_client.get("/api/wallet")).json() == []
+    assert (await authenticated_client.get("/api/transactions/history")).json() == []
@@ -26,6 +26,17 @@ async def test_update_user_name(authenticated_client):
     data = response.json()
     assert data["name"] == "Updated Name"
 
+@pytest.mark.asyncio
+async def test_update_user_name_visible_on_me(authenticated_client):
+    """Teste de que /auth/me reflete o nome atualizado (invalidação do cache)"""
+    await authenticated_client.get("/api/auth/me")
+    await authenticated_client.put("/api/auth/update", json={
+        "name": "Cached Name"
+    })
+    response = await authenticated_client.get("/api/auth/me")
+    assert response.status_code == 200
+    assert response.json()["name"] == "Cached Name"
+
 @pytest.mark.asyncio
 async def test_update_user_password(authenticated_client):
     """Teste de atualização da senha do usuário"""
@@ -0,0 +1,303 @@
+import argparse
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+ACCESS = "access"
+REFRESH = "refresh"
+REVOCATION_COLLECTION = "revoked_tokens"
+KEY_ALGORITHMS = ("EdDSA", "RS256")
+
+class SigningKey:
+    def __init__(self, kid: str, private_key):
+        self.kid = kid
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+        self.algorithm = "EdDSA" if isinstance(private_key, ed25519.Ed25519PrivateKey) else "RS256"
+
+    def jwk(self) -> dict:
+        to_jwk = OKPAlgorithm.to_jwk if self.algorithm == "EdDSA" else RSAAlgorithm.to_jwk
+        return {**to_jwk(self.public_key, as_dict=True), "kid": self.kid, "alg": self.algorithm, "use": "sig"}
+
+def generate_key(algorithm: str = "EdDSA"):
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    if algorithm == "RS256":
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    raise ValueError(f"unsupported algorithm {algorithm!r}")
+
+def write_key(directory: Path, kid: str, private_key) -> bool:
+    """Store ``<kid>.pem``; False if that kid already exists.
+
+    Written to a temporary name and linked into place, so workers racing
+    to create the same kid all end up reading one complete file.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    temporary = directory / f".{kid}.{os.getpid()}.tmp"
+    descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, "wb") as file:
+        file.write(pem)
+    try:
+        os.link(temporary, directory / f"{kid}.pem")
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        temporary.unlink(missing_ok=True)
+
+def new_kid() -> str:
+    # Sorts by creation time: the newest key is the default signing key
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+class KeyRing:
+    """Signing keys loaded from ``<kid>.pem`` files in ``directory``.
+
+    Tokens are signed with the active key (``active_kid``, else the last
+    kid in sort order) and verified with whichever key their ``kid``
+    header names. To rotate, add a newer key file and restart; keep the
+    old file until the refresh tokens it signed have expired. A token with
+    a kid not loaded yet (signed by a worker restarted first) makes the
+    ring re-read the directory, at most once per ``reload_interval``
+    seconds. An empty directory gets a generated key on first use.
+    """
+
+    def __init__(self, directory, active_kid: Optional[str] = None, algorithm: str = "EdDSA",
+                 reload_interval: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        self.directory = Path(directory)
+        self.active_kid = active_kid
+        self.algorithm = algorithm
+        self.reload_interval = reload_interval
+        self._clock = clock
+        self._keys: Optional[Dict[str, SigningKey]] = None
+        self._loaded_at = 0.0
+
+    def reload(self) -> bool:
+        """Re-read the directory; False if it was read too recently."""
+        if self._keys is not None and self._clock() - self._loaded_at < self.reload_interval:
+            return False
+        self._keys = None
+        self.load()
+        return True
+
+    def load(self) -> Dict[str, SigningKey]:
+        if self._keys is None:
+            paths = sorted(self.directory.glob("*.pem")) if self.directory.is_dir() else []
+            if not paths:
+                write_key(self.directory, new_kid(), generate_key(self.algorithm))
+                paths = sorted(self.directory.glob("*.pem"))
+            keys = {}
+            for path in paths:
+                private_key = serialization.load_pem_private_key(path.read_bytes(), password=None)
+                keys[path.stem] = SigningKey(path.stem, private_key)
+            if self.active_kid is not None and self.active_kid not in keys:
+                raise ValueError(f"JWT signing key {self.active_kid!r} not found in {self.directory}")
+            self._keys = keys
+            self._loaded_at = self._clock()
+        return self._keys
+
+    @property
+    def active(self) -> SigningKey:
+        keys = self.load()
+        return keys[self.active_kid or max(keys)]
+
+    def encode(self, claims: dict) -> str:
+        key = self.active
+        return jwt.encode(claims, key.private_key, algorithm=key.algorithm, headers={"kid": key.kid})
+
+    def decode(self, token: str, token_type: str) -> dict:
+        """Verified claims; raises ``jwt.InvalidTokenError`` (or a subclass)."""
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = self.load().get(kid)
+        if key is None and self.reload():
+            key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError("unknown kid")
+        claims = jwt.decode(
+            token, key.public_key, algorithms=[key.algorithm], options={"require": ["exp", "iat", "sub", "jti"]}
+        )
+        if claims.get("typ") != token_type:
+            raise jwt.InvalidTokenError("wrong token type")
+        return claims
+
+    def jwks(self) -> dict:
+        return {"keys": [key.jwk() for key in self.load().values()]}
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class Revocations:
+    """Revoked access tokens and users, checked without a query per request.
+
+    ``revoked_tokens`` is the record; each process mirrors the recent
+    entries in two generations of bloom filters, each ``ttl`` (the access
+    token lifetime) long, so an entry stays visible for as long as any
+    token it revokes is still valid. A filter miss accepts the token
+    right away; a hit is confirmed in Mongo. Revocations made by other
+    workers arrive with the next sync, within ``sync_interval`` seconds.
+    """
+
+    def __init__(self, get_db: Callable, ttl: float, capacity: int = 100000, error_rate: float = 0.001,
+                 sync_interval: float = 5.0, clock: Callable[[], float] = time.time):
+        self._get_db = get_db
+        self.ttl = ttl
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self._clock = clock
+        self._generations: Dict[int, BloomFilter] = {}
+        self._synced_until: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self.lookups = 0
+        self.false_positives = 0
+
+    def _current(self) -> BloomFilter:
+        generation = int(self._clock() // self.ttl)
+        for stale in [key for key in self._generations if key < generation - 1]:
+            del self._generations[stale]
+        if generation not in self._generations:
+            self._generations[generation] = BloomFilter(self.capacity, self.error_rate)
+        return self._generations[generation]
+
+    def _remember(self, key: str):
+        self._current().add(key)
+
+    def maybe_revoked(self, jti: str, user_id: str) -> bool:
+        self._current()
+        return any(
+            f"jti:{jti}" in bloom or f"user:{user_id}" in bloom for bloom in self._generations.values()
+        )
+
+    async def is_revoked(self, jti: str, user_id: str, issued_at: float) -> bool:
+        """Exact check against the collection."""
+        self.lookups += 1
+        async for entry in self._get_db()[REVOCATION_COLLECTION].find({"_id": {"$in": [f"jti:{jti}", f"user:{user_id}"]}}):
+            if entry["kind"] != "user" or entry["issued_before"] > issued_at:
+                return True
+        self.false_positives += 1
+        return False
+
+    async def revoke_token(self, claims: dict) -> bool:
+        """Revoke one token until it expires; False if it already was."""
+        now = self._clock()
+        try:
+            await self._get_db()[REVOCATION_COLLECTION].insert_one({
+                "_id": f"jti:{claims['jti']}",
+                "kind": claims["typ"],
+                "revoked_at": now,
+                "expires_at": datetime.fromtimestamp(claims["exp"], timezone.utc),
+            })
+        except DuplicateKeyError:
+            return False
+        if claims["typ"] == ACCESS:
+            self._remember(f"jti:{claims['jti']}")
+        return True
+
+    async def revoke_user(self, user_id: str, lifetime: float):
+        """Revoke every token issued to the user so far (``lifetime``: the longest token life)."""
+        now = self._clock()
+        await self._get_db()[REVOCATION_COLLECTION].update_one({"_id": f"user:{user_id}"}, {"$set": {
+            "kind": "user",
+            "issued_before": now,
+            "revoked_at": now,
+            "expires_at": datetime.fromtimestamp(now + lifetime, timezone.utc),
+        }}, upsert=True)
+        self._remember(f"user:{user_id}")
+
+    async def sync(self) -> int:
+        # Re-reads a little overlap to tolerate clock skew between workers;
+        # adding an entry twice is harmless
+        now = self._clock()
+        since = now - self.ttl if self._synced_until is None else self._synced_until - self.sync_interval
+        added = 0
+        query = {"revoked_at": {"$gte": since}, "kind": {"$in": [ACCESS, "user"]}}
+        async for entry in self._get_db()[REVOCATION_COLLECTION].find(query, {"_id": 1}):
+            self._remember(entry["_id"])
+            added += 1
+        self._synced_until = now
+        return added
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Token revocation sync failed")
+            await asyncio.sleep(self.sync_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "entries": sum(bloom.count for bloom in self._generations.values()),
+            "generations": len(self._generations),
+            "lookups": self.lookups,
+            "false_positives": self.false_positives,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage JWT signing keys")
+    parser.add_argument("--keys-dir", default=os.environ.get('JWT_KEYS_DIR', str(Path(__file__).parent / 'keys')))
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="add a key; the newest kid signs after a restart")
+    generate.add_argument("--algorithm", choices=KEY_ALGORITHMS, default=os.environ.get('JWT_ALGORITHM', 'EdDSA'))
+    generate.add_argument("--kid", default=None, help="defaults to the current UTC time")
+    commands.add_parser("list", help="show the keys and which one signs")
+    args = parser.parse_args()
+    directory = Path(args.keys_dir)
+
+    if args.command == "generate":
+        kid = args.kid or new_kid()
+        if not write_key(directory, kid, generate_key(args.algorithm)):
+            parser.error(f"key {kid!r} already exists")
+        print(f"{kid} written to {directory}")
+    else:
+        ring = KeyRing(directory, os.environ.get('JWT_ACTIVE_KID') or None)
+        for kid, key in ring.load().items():
+            print(f"{kid} {key.algorithm}{' (active)' if kid == ring.active.kid else ''}")
+
+if __name__ == "__main__":
+    main()
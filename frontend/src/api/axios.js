@@ -7,6 +7,20 @@ const api = axios.create({
   baseURL: API_BASE,
 });
 
+export const saveSession = ({ access_token, refresh_token, user }) => {
+  localStorage.setItem('token', access_token);
+  localStorage.setItem('refresh_token', refresh_token);
+  if (user) {
+    localStorage.setItem('user', JSON.stringify(user));
+  }
+};
+
+export const clearSession = () => {
+  localStorage.removeItem('token');
+  localStorage.removeItem('refresh_token');
+  localStorage.removeItem('user');
+};
+
 // Add token to requests
 api.interceptors.request.use((config) => {
   const token = localStorage.getItem('token');
@@ -16,17 +30,44 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+// Access tokens are short-lived: renew once with the refresh token, shared
+// by every request that failed meanwhile (a refresh token works only once)
+let refreshing = null;
+
+const refreshSession = () => {
+  if (!refreshing) {
+    const refresh_token = localStorage.getItem('refresh_token');
+    refreshing = (refresh_token
+      ? axios.post(`${API_BASE}/auth/refresh`, { refresh_token }).then((response) => saveSession(response.data))
+      : Promise.reject(new Error('no refresh token'))
+    ).finally(() => {
+      refreshing = null;
+    });
+  }
+  return refreshing;
+};
+
 // Handle 401 errors
 api.interceptors.response.use(
   (response) => response,
-  (error) => {
-    if (error.response?.status === 401) {
-      localStorage.removeItem('token');
-      localStorage.removeItem('user');
+  async (error) => {
+    const original = error.config;
+    const isAuthRoute = original?.url?.startsWith('/auth/login') || original?.url?.startsWith('/auth/register');
+    if (error.response?.status === 401 && original && !original._retried && !isAuthRoute) {
+      original._retried = true;
+      try {
+        await refreshSession();
+        return api(original);
+      } catch (refreshError) {
+        // Fall through to the logout below
+      }
+    }
+    if (error.response?.status === 401 && !isAuthRoute) {
+      clearSession();
       window.location.href = '/login';
     }
     return Promise.reject(error);
   }
 );
 
-export default api;
\ No newline at end of file
+export default api;
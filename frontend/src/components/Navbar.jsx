@@ -3,15 +3,20 @@ import { Link, useNavigate, useLocation } from 'react-router-dom';
 import { Button } from '@/components/ui/button';
 import { Menu, X, Home, ShoppingCart, TrendingUp, History, User, LogOut, Building2 } from 'lucide-react';
 import { toast } from 'sonner';
+import api, { clearSession } from '@/api/axios';
 
 const Navbar = ({ user, setUser }) => {
   const [mobileMenuOpen, setMobileMenuOpen] = useState(false);
   const navigate = useNavigate();
   const location = useLocation();
 
-  const handleLogout = () => {
-    localStorage.removeItem('token');
-    localStorage.removeItem('user');
+  const handleLogout = async () => {
+    try {
+      await api.post('/auth/logout', { refresh_token: localStorage.getItem('refresh_token') });
+    } catch (error) {
+      // Logged out locally all the same
+    }
+    clearSession();
     setUser(null);
     toast.success('Logout realizado com sucesso');
     navigate('/login');
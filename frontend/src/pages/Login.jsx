@@ -1,6 +1,6 @@
 import { useState } from 'react';
 import { useNavigate, Link } from 'react-router-dom';
-import api from '@/api/axios';
+import api, { saveSession } from '@/api/axios';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
@@ -19,10 +19,9 @@ const Login = ({ setUser }) => {
 
     try {
       const response = await api.post('/auth/login', { email, password });
-      const { access_token, user } = response.data;
+      const { user } = response.data;
       
-      localStorage.setItem('token', access_token);
-      localStorage.setItem('user', JSON.stringify(user));
+      saveSession(response.data);
       setUser(user);
       toast.success('Login realizado com sucesso!');
       navigate('/dashboard');
@@ -1,6 +1,6 @@
 import { useState } from 'react';
 import { useNavigate } from 'react-router-dom';
-import api from '@/api/axios';
+import api, { clearSession } from '@/api/axios';
 import Navbar from '@/components/Navbar';
 import { Card } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
@@ -58,8 +58,7 @@ const Profile = ({ user, setUser }) => {
   const handleDelete = async () => {
     try {
       await api.delete('/auth/delete');
-      localStorage.removeItem('token');
-      localStorage.removeItem('user');
+      clearSession();
       setUser(null);
       toast.success('Conta deletada com sucesso');
       navigate('/login');